@@ -6,4 +6,12 @@ from .data import CONTACT_MATRIX_COUNTRIES, CONTACT_MATRIX_IDS, DATA_PATH
 from .contact_matrix import contact_matrix, symmetric_contact_matrix
 from .ibge import brazil_healthcare_capacity, city_id_from_name
 from .mortality import covid_mortality, covid_mean_mortality
-from .ibge_demographic import brazil_city_demography
+from .ibge_demographic import brazil_city_demography, brazil_cities_demography, brazil_city_ids
+from .ibge_rollup import (
+    brazil_cities_aggregate,
+    brazil_metro_areas,
+    brazil_rollup,
+    brazil_rollup_cities,
+    group_demography,
+)
+from .registry import preload
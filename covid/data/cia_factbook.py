@@ -1,6 +1,6 @@
 import pandas as pd
 
-from .data import DATA_PATH
+from .registry import read_csv
 from covid.data.countries.constants import COUNTRY_ALIASES
 
 COUNTRY_TO_AGE_DISTRIBUTION = {
@@ -91,16 +91,17 @@ def cia_factbook(which):
     """
     Import dataset from CIA factbook spreadsheets.
 
+    Datasets are parsed once and shared, hence the resulting data frame is
+    read-only.
+
     Valid datasets:
     * 'age distributions'
     * 'hospital beds'
     """
     if which == "age distribution":
-        df = pd.read_csv(DATA_PATH / "cia_factbook-age_distribution.csv", index_col=0)
-        return df
+        return read_csv("cia_factbook-age_distribution.csv", index_col=0)
     if which == "hospital beds":
-        df = pd.read_csv(DATA_PATH / "cia_factbook-hospital_bed_density.csv", index_col=0, sep=";")
-        return df
+        return read_csv("cia_factbook-hospital_bed_density.csv", index_col=0, sep=";")
     else:
         raise ValueError(f"invalid dataset: {which}")
 
@@ -182,14 +183,13 @@ def hospital_bed_density(country=None):
     country = COUNTRY_ALIASES.get(country, country)
     country = COUNTRY_TO_HOSPITAL_BEDS.get(country, country)
 
-    path = DATA_PATH / "cia_factbook-hospital_bed_density.csv"
-    df = pd.read_csv(path, index_col=0, sep=";")
-    df["density"] /= 1000
+    df = cia_factbook("hospital beds")
+    density = df["density"] / 1000
     if country:
         try:
-            return df.loc[country, "density"]
+            return density.loc[country]
         except KeyError:
             if country in HOSPITAL_BEDS_MISSING_DATA:
-                return df.density.mean()
+                return density.mean()
             raise ValueError(country)
-    return df
+    return df.assign(density=density)
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .data import DATA_PATH, COARSE_INDEX
+from .registry import load, read_csv
 
 
 def symmetric_contact_matrix(country, coarse=False):
@@ -12,9 +13,8 @@ def symmetric_contact_matrix(country, coarse=False):
         https://journals.plos.org/ploscompbiol/article?id=10.1371/journal.pcbi.1002673#s4
     """
     path = DATA_PATH / "contact_matrix" / "fumanelli.xls"
-    df = pd.read_excel(path, country, header=None)
-    df.index = range(1, 101)
-    df.columns = df.index
+    df = load(path, pd.read_excel, sheet_name=country, header=None)
+    df = pd.DataFrame(df.values, index=range(1, 101), columns=range(1, 101))
     return _symmetric_contact_matrix_coarse(df) if coarse else df
 
 
@@ -68,8 +68,7 @@ def contact_matrix(country="mean", physical=False, coarse=None, infer=False) ->
 
 def _contact_matrix(country, physical, coarse):
     which = "physical" if physical else "all"
-    path = DATA_PATH / "contact_matrix" / f"{country.lower()}-{which}.csv"
-    df = pd.read_csv(path, index_col=0)
+    df = read_csv(f"contact_matrix/{country.lower()}-{which}.csv", index_col=0)
     return _contact_matrix_coarse_age_distribution(df) if coarse else df
 
 
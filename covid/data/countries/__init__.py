@@ -9,6 +9,7 @@ from .geography import (
     parse_city,
     parse_entity,
 )
+from .index import Entity, GeographyIndex, geography_index, fold_name
 from .constants import (
     COUNTRIES,
     COUNTRY_LOCALIZED_NAMES,
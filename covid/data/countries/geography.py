@@ -5,7 +5,8 @@ from typing import Tuple
 import pandas as pd
 
 from .constants import normalize_country_id as _as_country
-from ..data import DATA_PATH
+from .index import geography_index
+from ..registry import read_csv
 from ...utils import lru_safe_cache
 
 PARSE_STATE_RE = re.compile(r"^[A-Z]{2,3}$")
@@ -25,17 +26,21 @@ def with_id_entry(obj):
         return obj.append(pd.Series({"id": obj.name}))
 
 
-@with_id_entry
-def get_entity(df, key, state_code, state_id, by, msg):
-    try:
-        if by == "id":
-            return df.loc[key]
-        for col, val in (("state_code", state_code), ("state_id", state_id)):
-            if val is not None:
-                df = df[df[col] == val]
-        return df[df["name"] == key].iloc[0]
-    except IndexError:
-        raise ValueError(msg.format(key=key))
+def get_entity(country, kind, key, state_code=None, state_id=None, by="name", extra=False):
+    """
+    Return the row corresponding to the entity of the given kind with an
+    additional "id" entry.
+
+    Names are resolved with the geography index of the country, so they
+    ignore accents and case. If several entities have the same name, return
+    the first one.
+    """
+    if by != "id":
+        matches = geography_index(country).lookup(key, kind, state_code, state_id)
+        if not matches:
+            raise ValueError(f"invalid {kind}: {key!r}")
+        key = matches[0].id
+    return with_id_entry(_tables[kind].unsafe(country, extra=extra).loc[key])
 
 
 @lru_safe_cache(64)
@@ -55,8 +60,7 @@ def states(country: str, extra=False) -> pd.DataFrame:
     if not extra:
         return states(country, True)[["name", "code"]]
 
-    path = DATA_PATH / "countries" / country / "states.csv"
-    return pd.read_csv(path, index_col=0)
+    return read_csv(f"countries/{country}/states.csv", index_col=0)
 
 
 @lru_cache(128)
@@ -69,22 +73,17 @@ def state_codes(country):
     return frozenset(sorted(df["code"]))
 
 
-@with_id_entry
 def state(country, key, extra=False):
     """
-    Return state from key.
+    Return state from key, which can be the state id, name or code.
     """
     df = states.unsafe(country, extra=extra)
-    try:
-        return df.loc[key]
-    except KeyError:
-        pass
-
-    for col in ["name", "code"]:
-        df_ = df[df[col] == key]
-        if len(df_) != 0:
-            return df_.iloc[0]
-    raise ValueError(f"invalid state for {country}: {state}")
+    index = geography_index(country)
+    if key in df.index:
+        return with_id_entry(df.loc[key])
+    elif key in index.codes:
+        return with_id_entry(df.loc[index.codes[key]])
+    return get_entity(country, "state", key, extra=extra)
 
 
 @lru_safe_cache(64)
@@ -105,8 +104,7 @@ def sub_regions(country: str, state_id=None, state_code=None, extra=False) -> pd
     elif state_code:
         df = sub_regions.unsafe(country, extra=extra)
         return df[(df["state_code"] == state_code)]
-    path = DATA_PATH / "countries" / country / "sub-regions.csv"
-    df = pd.read_csv(path, index_col=0)
+    df = read_csv(f"countries/{country}/sub-regions.csv", index_col=0)
     return df if not extra else df[["name", "state_id", "state_code"]]
 
 
@@ -132,9 +130,7 @@ def sub_region(
             If by='id', treats input as a sub-region id, rather than name.
     """
 
-    country = _as_country(country)
-    df = sub_regions.unsafe(country, extra=extra)
-    return get_entity(df, key, state_code, state_id, by, "invalid sub-region: {key!r}")
+    return get_entity(country, "sub-region", key, state_code, state_id, by, extra)
 
 
 @lru_safe_cache(64)
@@ -152,8 +148,7 @@ def cities(
     """
 
     country = _as_country(country)
-    path = DATA_PATH / "countries" / country / "cities.csv"
-    df = pd.read_csv(path, index_col=0)
+    df = read_csv(f"countries/{country}/cities.csv", index_col=0)
     if sub_region:
         df = df[df["sub_region"] == sub_region]
     if state_id:
@@ -165,7 +160,6 @@ def cities(
     return df[["name", "sub_region", "state_id", "state_code"]]
 
 
-@lru_safe_cache(1025)
 def city(
     country: str, key: str, state_code=None, state_id=None, extra=False, by="name"
 ) -> pd.Series:
@@ -188,16 +182,14 @@ def city(
             If by='id', treats city as a city id, rather than name.
     """
 
-    country = _as_country(country)
-    df = cities.unsafe(country, extra=extra)
-    return get_entity(df, key, state_code, state_id, by, "invalid city: {key!r}")
+    return get_entity(country, "city", key, state_code, state_id, by, extra)
 
 
 def parse_city(country, text, extra=False):
     """
     Similar to city, but parses it from a string that might contain the state.
     """
-    name, _, st = text.rpartition("-")
+    name, _, st = map(str.strip, text.rpartition("-"))
     if st in state_codes(country):
         return _city(country, name, extra=extra, state_code=st)
     return _city(country, text, extra=extra)
@@ -208,6 +200,10 @@ def parse_entity(country, text, extra=False) -> Tuple[str, pd.Series]:
     Similar to parse_city, but parses any geographical entity in a country.
     Returns a tuple of (kind, datasets), in which kind is either 'city', 'state'
     or 'sub-region'.
+
+    Names are matched ignoring accents and case. Exact matches are preferred
+    and cities take precedence over sub-regions and states with the same
+    name.
     """
 
     # It only works for Brazil
@@ -226,25 +222,18 @@ def parse_entity(country, text, extra=False) -> Tuple[str, pd.Series]:
             raise ValueError(f"invalid entity code: {text!r}")
 
     if PARSE_STATE_RE.match(text):
-        df = states.unsafe(country, extra=extra)
-        return "state", with_id_entry(df[df["code"] == text].iloc[0])
+        return "state", state(country, text, extra=extra)
 
     if PARSE_CITY_STATE_RE.match(text):
         city_, _, code = map(str.strip, text.rpartition("-"))
         return "city", city(country, city_, state_code=code, extra=extra)
 
-    try:
-        return "city", city(country, text, extra=extra)
-    except ValueError:
-        pass
-    try:
-        return "sub-region", sub_region(country, text, extra=extra)
-    except ValueError:
-        pass
-    try:
-        return "state", state(country, text, extra=extra)
-    except ValueError:
+    matches = geography_index(country).lookup(text)
+    if not matches:
         raise ValueError(f"invalid geographic entity: {text!r}")
+    entity = matches[0]
+    return entity.kind, get_entity(country, entity.kind, entity.id, by="id", extra=extra)
 
 
 _city = city
+_tables = {"state": states, "sub-region": sub_regions, "city": cities}
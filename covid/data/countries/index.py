@@ -0,0 +1,173 @@
+import difflib
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
+from typing import List, NamedTuple
+
+from .constants import normalize_country_id as _as_country
+from ..registry import read_csv
+
+KINDS = ("city", "sub-region", "state")
+SPACES_RE = re.compile(r"\s+")
+
+
+class Entity(NamedTuple):
+    """
+    Geographic entity in a country.
+    """
+
+    kind: str
+    id: int
+    name: str
+    state_code: str
+
+
+def fold_name(name: str) -> str:
+    """
+    Normalize name for lookups: remove accents, ignore case and collapse
+    whitespace.
+
+    Examples:
+        >>> fold_name(" São  Paulo")
+        'sao paulo'
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return SPACES_RE.sub(" ", name).strip().casefold()
+
+
+class GeographyIndex:
+    """
+    In-memory index of states, sub-regions and cities of a country.
+
+    Names are folded with :func:`fold_name`, so lookups ignore accents, case
+    and extra whitespace. Use :func:`geography_index` to obtain the shared
+    index of each country.
+    """
+
+    def __init__(self, country: str):
+        self.country = country = _as_country(country)
+        path = f"countries/{country}"
+        tables = {
+            "state": read_csv(f"{path}/states.csv", index_col=0),
+            "sub-region": read_csv(f"{path}/sub-regions.csv", index_col=0),
+            "city": read_csv(f"{path}/cities.csv", index_col=0),
+        }
+        states = tables["state"]
+
+        self.entities = {}
+        self.codes = dict(zip(states["code"], states.index))
+        self.parents = {}
+        self._names = defaultdict(list)
+
+        # Entities are indexed by kind, in the order they appear in each file
+        for kind in KINDS:
+            df = tables[kind]
+            codes = states["code"] if kind == "state" else df["state_code"]
+            for id_, name, code in zip(df.index, df["name"], codes):
+                entity = Entity(kind, int(id_), name, code)
+                self.entities[kind, entity.id] = entity
+                self._names[fold_name(name)].append(entity)
+        cities = tables["city"]
+        for id_, sub_region, state in zip(cities.index, cities["sub_region"], cities["state_id"]):
+            self.parents["city", int(id_)] = (
+                ("sub-region", int(sub_region)),
+                ("state", int(state)),
+            )
+        for id_, state in tables["sub-region"]["state_id"].items():
+            self.parents["sub-region", int(id_)] = (("state", int(state)),)
+        self._sorted = sorted(self._names)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def get(self, kind: str, id: int) -> Entity:
+        """
+        Return entity from kind and id.
+
+        Raises:
+            KeyError: if entity does not exist.
+        """
+        return self.entities[kind, id]
+
+    def state(self, code: str) -> Entity:
+        """
+        Return state from its code.
+
+        Raises:
+            KeyError: if code is not valid.
+        """
+        return self.entities["state", self.codes[code]]
+
+    def lineage(self, kind: str, id: int) -> List[Entity]:
+        """
+        Return the chain of parents of an entity, starting from the closest.
+        """
+        return [self.get(*ref) for ref in self.parents.get((kind, id), ())]
+
+    def lookup(self, name: str, kind: str = None, state_code=None, state_id=None) -> List[Entity]:
+        """
+        Return all entities with the given name.
+
+        Exact matches come first, followed by matches that differ only in
+        accents, case or whitespace. Cities come before sub-regions and
+        sub-regions before states.
+
+        Raises:
+            ValueError: if state_id is not valid.
+        """
+        if state_id is not None:
+            try:
+                state_code = self.get("state", state_id).state_code
+            except KeyError:
+                raise ValueError(f"invalid state: {state_id!r}")
+        matches = [
+            e
+            for e in self._names.get(fold_name(name), ())
+            if (kind is None or e.kind == kind)
+            and (state_code is None or e.state_code == state_code)
+        ]
+        matches.sort(key=lambda e: (e.name != name, KINDS.index(e.kind)))
+        return matches
+
+    def search(self, prefix: str, kind: str = None, limit: int = 10) -> List[Entity]:
+        """
+        Return entities whose names start with prefix, in alphabetical order.
+        """
+        prefix = fold_name(prefix)
+        out = []
+        i = bisect_left(self._sorted, prefix)
+        for name in islice(self._sorted, i, None):
+            if not name.startswith(prefix) or len(out) >= limit:
+                break
+            out.extend(e for e in self._names[name] if kind is None or e.kind == kind)
+        return out[:limit]
+
+    def fuzzy(
+        self, name: str, kind: str = None, limit: int = 10, cutoff: float = 0.75
+    ) -> List[Entity]:
+        """
+        Return entities with names similar to the given one, from the most
+        similar to the least.
+        """
+        names = difflib.get_close_matches(fold_name(name), self._sorted, n=limit, cutoff=cutoff)
+        out = [e for n in names for e in self._names[n] if kind is None or e.kind == kind]
+        return out[:limit]
+
+    def complete(self, text: str, kind: str = None, limit: int = 10) -> List[Entity]:
+        """
+        Suggestions for a partially typed name: prefix matches or, if there are
+        none, fuzzy matches.
+        """
+        return self.search(text, kind, limit) or self.fuzzy(text, kind, limit)
+
+
+@lru_cache(16)
+def geography_index(country: str) -> GeographyIndex:
+    """
+    Return the shared geography index of a country.
+    """
+    return GeographyIndex(_as_country(country))
@@ -1,37 +1,27 @@
-from functools import lru_cache
-
-import pandas as pd
-
-from .data import DATA_PATH
+from .countries.index import geography_index
+from .registry import read_csv
 
 
 def brazil_healthcare_capacity():
     """
     Return datasets from Brazilian hospitals capacity.
+
+    The resulting data frame is shared and read-only.
     """
-    path = DATA_PATH / "brazil_healthcare_capacity.csv"
-    df = pd.read_csv(path, index_col=0)
-    return df
+    return read_csv("brazil_healthcare_capacity.csv", index_col=0)
 
 
 def city_id_from_name(name):
     """
     Return IBGE´s city id from city name.
+
+    Names are matched ignoring accents and case.
     """
     if name.isdigit():
         return int(name)
-    try:
-        return _city_id_map()[name.lower()]
-    except KeyError:
+    matches = geography_index("brazil").lookup(name, "city")
+    if not matches:
         raise ValueError(f"invalid city: {name!r}")
 
-
-@lru_cache(1)
-def _city_id_map():
-    path = DATA_PATH / "ibge_demographic" / "city_codes.csv"
-    with path.open() as fd:
-        df = pd.read_csv(path)
-
-    # We have this map here!
-    df = df[["name", "city_full_id"]]
-    return {x.lower(): int(str(y)[:-1]) for x, y in df.values}
+    # IBGE ids without the check digit
+    return matches[0].id // 10
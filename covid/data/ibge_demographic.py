@@ -1,15 +1,24 @@
+from functools import lru_cache
 from pathlib import Path
 
 import click
+import numpy as np
 import pandas as pd
 import requests
 
 from .cia_factbook import coarse_age_distribution
-from .data import DATA_PATH
+from .data import DATA_PATH, COARSE_INDEX
 from .ibge import city_id_from_name
 
 IBGE_DATA: Path = DATA_PATH / "ibge_demographic"
 
+# Demography of all cities packed in (n_cities, n_ages, 2) int32 arrays with
+# males and females in the last axis. Rows follow the sorted array of ids.
+# Build with build_city_store() (or "inv datasets").
+STORE_IDS: Path = DATA_PATH / "ibge_demographic-ids.npy"
+STORE_DETAILED: Path = DATA_PATH / "ibge_demographic-detailed.npy"
+STORE_COARSE: Path = DATA_PATH / "ibge_demographic-coarse.npy"
+
 URL = (
     "https://servicodados.ibge.gov.br/api/v1/pesquisas/23/periodos/all/resultados"
     "?localidade={city}&indicadores=27692,27693,27694,27695,27696,27697,27698,27699,"
@@ -68,6 +77,8 @@ VARNAMES_FEMALE = {
     27740: "100+",
 }
 BLACK_LIST = {4220000}
+AGE_GROUPS = list(VARNAMES_MALE.values())
+SEXES = ["males", "females"]
 
 
 def brazil_city_demography(city_id, coarse=False, collapse_newborn=False, download=True):
@@ -90,6 +101,11 @@ def brazil_city_demography(city_id, coarse=False, collapse_newborn=False, downlo
         city_id = city_id_from_name(city_id)
 
     if coarse:
+        row = _store_row(city_id)
+        if row is not None:
+            index = pd.Index(COARSE_INDEX, name="age")
+            return pd.DataFrame(_store()[2][row], index=index, columns=SEXES, copy=False)
+
         df = brazil_city_demography(city_id, collapse_newborn=True, download=download)
         males, females = map(coarse_age_distribution, [df.males, df.females])
         return pd.DataFrame({"males": males, "females": females})
@@ -105,10 +121,108 @@ def brazil_city_demography(city_id, coarse=False, collapse_newborn=False, downlo
     return _load_city(city_id, download)
 
 
+def brazil_cities_demography(ids=None, coarse=False) -> np.ndarray:
+    """
+    Demography of several cities as a read-only (n_cities, n_ages, 2) array
+    with males and females in the last axis.
+
+    Data is taken from the packed store of city demographies, which is
+    memory-mapped and shared by all calls. Missing values in IBGE tables are
+    stored as zeros.
+
+    Args:
+        ids:
+            Sequence of numeric city ids. If not given, return all cities in
+            the order of :func:`brazil_city_ids`.
+        coarse:
+            If True, use the 9 age groups of :func:`brazil_city_demography`
+            with coarse=True instead of the 22 groups of IBGE.
+    """
+    store = _store()
+    if store is None:
+        raise RuntimeError("demography store not found: run build_city_store() first")
+    all_ids, detailed, coarse_data = store
+    data = coarse_data if coarse else detailed
+    if ids is None:
+        return data
+
+    ids = np.asarray(ids, dtype=all_ids.dtype)
+    rows = np.searchsorted(all_ids, ids)
+    rows[rows == len(all_ids)] = 0
+    missing = all_ids[rows] != ids
+    if missing.any():
+        raise ValueError(f"cities not in the database: {list(ids[missing])}")
+    return data[rows]
+
+
+def brazil_city_ids() -> np.ndarray:
+    """
+    Sorted array with the ids of all cities in the demography store.
+    """
+    store = _store()
+    if store is None:
+        raise RuntimeError("demography store not found: run build_city_store() first")
+    return store[0]
+
+
+def build_city_store(path=IBGE_DATA, output=DATA_PATH) -> int:
+    """
+    Pack demography of all city-<id>.csv files in path into the memory-mapped
+    store used by the loaders and return the number of cities.
+
+    The store is saved in the output directory. The default replaces the
+    files used by the loaders.
+    """
+    files = sorted(Path(path).glob("city-*.csv"), key=lambda p: int(p.stem[5:]))
+    ids = np.array([int(p.stem[5:]) for p in files], dtype=np.int64)
+    detailed = np.zeros((len(files), len(AGE_GROUPS), len(SEXES)), dtype=np.int32)
+    for i, file in enumerate(files):
+        df = pd.read_csv(file, index_col=0)
+        detailed[i] = df.loc[AGE_GROUPS, SEXES].fillna(0).values
+
+    # Each IBGE age group goes to the decade of its lower bound
+    last = len(COARSE_INDEX) - 1
+    bins = [min(int(age.split("-")[0].rstrip("+")) // 10, last) for age in AGE_GROUPS]
+    coarse = np.zeros((len(files), len(COARSE_INDEX), len(SEXES)), dtype=np.int32)
+    np.add.at(coarse, (slice(None), bins), detailed)
+
+    output = Path(output)
+    np.save(output / STORE_IDS.name, ids)
+    np.save(output / STORE_DETAILED.name, detailed)
+    np.save(output / STORE_COARSE.name, coarse)
+    _store.cache_clear()
+    return len(ids)
+
+
+@lru_cache(1)
+def _store():
+    paths = [STORE_IDS, STORE_DETAILED, STORE_COARSE]
+    if not all(p.exists() for p in paths):
+        return None
+    return tuple(np.load(p, mmap_mode="r") for p in paths)
+
+
+def _store_row(city_id):
+    """
+    Row of city in the demography store or None.
+    """
+    store = _store()
+    if store is None:
+        return None
+    ids = store[0]
+    city_id = int(city_id)
+    row = np.searchsorted(ids, city_id)
+    return row if row < len(ids) and ids[row] == city_id else None
+
+
 def _load_city(city_id, dowload):
     path = IBGE_DATA / f"city-{city_id}.csv"
+    row = _store_row(city_id)
+
+    if row is not None:
+        return pd.DataFrame(_store()[1][row], index=AGE_GROUPS, columns=SEXES, copy=False)
 
-    if path.exists():
+    elif path.exists():
         with path.open() as fd:
             return pd.read_csv(fd, index_col=0)
 
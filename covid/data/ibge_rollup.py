@@ -0,0 +1,176 @@
+import json
+import warnings
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import countries
+from .data import DATA_PATH, COARSE_INDEX
+from .ibge import brazil_healthcare_capacity
+from .ibge_demographic import AGE_GROUPS, SEXES, brazil_cities_demography, brazil_city_ids
+from .registry import read_csv
+
+# Demography and healthcare statistics of all states, sub-regions and metro
+# areas, indexed by keys such as "state:35", "sub-region:3515" and
+# "metro:São Paulo". Build with build_rollup() (or "inv datasets").
+ROLLUP: Path = DATA_PATH / "countries" / "brazil" / "rollup.csv"
+METRO_AREAS: Path = DATA_PATH / "brazil_metro.json"
+
+CAPACITY_COLUMNS = [
+    "hospital_total_capacity",
+    "icu_total_capacity",
+    "hospital_surge_capacity",
+    "icu_surge_capacity",
+]
+
+
+def brazil_cities_aggregate(ids) -> pd.Series:
+    """
+    Sum demography and healthcare statistics of the given cities.
+
+    Return a series with the population, the columns in CAPACITY_COLUMNS and
+    the number of males and females in each age group, in "coarse:<sex>:<age>"
+    and "detailed:<sex>:<age>" entries. Use :func:`group_demography` to
+    convert them to a data frame. Cities without healthcare data have no beds.
+    """
+    ids = np.asarray(ids, dtype=int)
+    coarse = brazil_cities_demography(ids, coarse=True).sum(0)
+    detailed = brazil_cities_demography(ids).sum(0)
+
+    e = 1e-50
+    df = brazil_healthcare_capacity().reindex(ids // 10).fillna(0)
+    regular, icu = df["regular"].values, df["icu"].values
+    cases = (df["cases_influenza_regular"] + df["cases_other_regular"]).values
+    cases_icu = (df["cases_influenza_icu"] + df["cases_other_icu"]).values
+    capacity = [
+        regular.sum(),
+        icu.sum(),
+        (regular * (1 - np.minimum(cases / (regular + e), 1))).sum(),
+        (icu * (1 - np.minimum(cases_icu / (icu + e), 1))).sum(),
+    ]
+
+    return pd.Series(
+        [coarse.sum(), *capacity, *coarse.T.flat, *detailed.T.flat],
+        index=["population", *CAPACITY_COLUMNS, *_columns("coarse"), *_columns("detailed")],
+        dtype=object,
+    )
+
+
+def group_demography(stats: pd.Series, coarse=False) -> pd.DataFrame:
+    """
+    Extract age distribution of males and females from the result of
+    :func:`brazil_cities_aggregate` or :func:`brazil_rollup`.
+    """
+    ages = COARSE_INDEX if coarse else AGE_GROUPS
+    data = stats[_columns("coarse" if coarse else "detailed")].values.astype(int)
+    return pd.DataFrame(data.reshape(len(SEXES), -1).T, index=ages, columns=SEXES)
+
+
+def brazil_rollup(key: str) -> pd.Series:
+    """
+    Return precomputed statistics for a state, sub-region or metro area.
+
+    The result has a "name" entry and the same entries as
+    :func:`brazil_cities_aggregate`. It is computed on the fly if the rollup
+    table was not built.
+
+    Args:
+        key:
+            Either "state:<id>", "sub-region:<id>" or "metro:<name>".
+
+    Raises:
+        ValueError: if key is not valid.
+    """
+    if ROLLUP.exists():
+        try:
+            return read_csv(ROLLUP, index_col=0).loc[key]
+        except KeyError:
+            raise ValueError(f"invalid key: {key!r}")
+    stats = brazil_cities_aggregate(brazil_rollup_cities(key))
+    return pd.concat([pd.Series({"name": _name(key)}), stats])
+
+
+def brazil_rollup_cities(key: str) -> np.ndarray:
+    """
+    Return the ids of all cities of a state, sub-region or metro area with
+    known demography.
+
+    Args:
+        key:
+            Either "state:<id>", "sub-region:<id>" or "metro:<name>".
+    """
+    kind, _, ref = key.partition(":")
+    if kind == "metro":
+        try:
+            ids = brazil_metro_areas()[ref]
+        except KeyError:
+            raise ValueError(f"invalid metro area: {ref!r}")
+    elif kind in ("state", "sub-region"):
+        col = "state_id" if kind == "state" else "sub_region"
+        df = countries.cities.unsafe("brazil")
+        ids = df.index[df[col] == int(ref)].values
+    else:
+        raise ValueError(f"invalid key: {key!r}")
+    return ids[np.isin(ids, brazil_city_ids())]
+
+
+@lru_cache(1)
+def brazil_metro_areas() -> dict:
+    """
+    Return a map from metro area names to arrays of city ids.
+    """
+    with METRO_AREAS.open(encoding="utf8") as fd:
+        data = json.load(fd)
+
+    # Map ids without the check digit to full city ids
+    df = countries.cities.unsafe("brazil")
+    full_ids = pd.Series(df.index.values, index=df.index.values // 10)
+    areas = {}
+    for name, ids in data.items():
+        ids = np.array(ids)
+        missing = ~np.isin(ids, full_ids.index)
+        if missing.any():
+            warnings.warn(f"unknown cities in metro area {name}: {ids[missing]}")
+        areas[name] = full_ids[ids[~missing]].values
+    return areas
+
+
+def build_rollup(path=ROLLUP) -> int:
+    """
+    Aggregate statistics for all states, sub-regions and metro areas and save
+    the rollup table.
+
+    Rows are sorted by kind and id (metro areas follow the order in
+    brazil_metro.json), so the result only depends on the raw datasets.
+    Return the number of rows.
+    """
+    keys = [
+        *(f"state:{id}" for id in sorted(countries.states("brazil").index)),
+        *(f"sub-region:{id}" for id in sorted(countries.sub_regions("brazil").index)),
+        *(f"metro:{name}" for name in brazil_metro_areas()),
+    ]
+    rows = {}
+    for key in keys:
+        stats = brazil_cities_aggregate(brazil_rollup_cities(key))
+        rows[key] = pd.concat([pd.Series({"name": _name(key)}), stats])
+
+    df = pd.DataFrame(rows).T.infer_objects()
+    df.index.name = "key"
+    df.to_csv(path)
+    return len(df)
+
+
+def _columns(prefix):
+    ages = COARSE_INDEX if prefix == "coarse" else AGE_GROUPS
+    return [f"{prefix}:{sex}:{age}" for sex in SEXES for age in ages]
+
+
+def _name(key):
+    kind, _, ref = key.partition(":")
+    if kind == "state":
+        return countries.states.unsafe("brazil").loc[int(ref), "name"]
+    elif kind == "sub-region":
+        return countries.sub_regions.unsafe("brazil").loc[int(ref), "name"]
+    return ref
@@ -2,15 +2,14 @@ import pandas as pd
 import numpy as np
 
 from .cia_factbook import age_distribution
-from .data import DATA_PATH
+from .registry import read_csv
 
 
 def covid_mortality():
     """
     Return a dataframe with COVID-19 mortality datasets from Neil M Ferguson, et. al.
     """
-    path = DATA_PATH / "covid-mortality-imperial-college.csv"
-    return pd.read_csv(path, index_col=0) / 100
+    return read_csv("covid-mortality-imperial-college.csv", index_col=0) / 100
 
 
 def covid_mean_mortality(region, year=2020):
@@ -0,0 +1,111 @@
+"""
+Registry of parsed datasets shared by all loaders in covid.data.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+import numpy as np
+import pandas as pd
+
+from .data import DATA_PATH
+
+#: Datasets used when creating regions and models. Maps paths relative to
+#: DATA_PATH to the keyword arguments passed to pd.read_csv.
+DATASETS = {
+    "cia_factbook-age_distribution.csv": {"index_col": 0},
+    "cia_factbook-hospital_bed_density.csv": {"index_col": 0, "sep": ";"},
+    "covid-mortality-imperial-college.csv": {"index_col": 0},
+    "brazil_healthcare_capacity.csv": {"index_col": 0},
+}
+
+_entries = {}
+_locks = {}
+_lock = threading.Lock()
+
+
+def read_csv(path, **kwargs) -> pd.DataFrame:
+    """
+    Parse CSV file with pd.read_csv once per process.
+
+    Return a data frame shared by all callers. Its numeric arrays are not
+    writeable and callers must copy it before modifying anything. The file is parsed
+    again if its modification time changes.
+
+    Args:
+        path:
+            Path to CSV file. Relative paths start from DATA_PATH.
+        kwargs:
+            Keyword arguments forwarded to pd.read_csv.
+    """
+    return load(path, pd.read_csv, **kwargs)
+
+
+def load(path, reader: Callable = pd.read_csv, **kwargs) -> pd.DataFrame:
+    """
+    Like :func:`read_csv`, but uses reader(path, **kwargs) to parse the file.
+    """
+    path = DATA_PATH / path
+    key = (str(path), reader, tuple(sorted(kwargs.items())))
+    mtime = path.stat().st_mtime_ns
+    try:
+        time, df = _entries[key]
+        if time == mtime:
+            return df
+    except KeyError:
+        pass
+
+    # Threads that request the same file wait for the first one to parse it
+    with _lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        time, df = _entries.get(key, (None, None))
+        if time != mtime:
+            df = _freeze(reader(path, **kwargs))
+            _entries[key] = (mtime, df)
+    return df
+
+
+def preload(paths: Iterable = None, threads: int = 4, wait: bool = True):
+    """
+    Parse datasets in parallel threads.
+
+    Args:
+        paths:
+            Sequence of paths or mapping from paths to pd.read_csv arguments.
+            Defaults to DATASETS.
+        threads:
+            Number of worker threads.
+        wait:
+            If False, return immediately and parse files in the background.
+    """
+    paths = DATASETS if paths is None else paths
+    if not isinstance(paths, dict):
+        paths = dict.fromkeys(paths, {})
+    pool = ThreadPoolExecutor(threads)
+    for path, kwargs in paths.items():
+        pool.submit(read_csv, path, **kwargs)
+    pool.shutdown(wait=wait)
+
+
+def clear():
+    """
+    Remove all datasets from the registry.
+    """
+    _entries.clear()
+
+
+def _freeze(df):
+    if isinstance(df, dict):
+        return {k: _freeze(v) for k, v in df.items()}
+    # Some pandas routines for object arrays require writeable buffers.
+    # Columns are views of the arrays that hold data, so the whole chain of
+    # bases is frozen.
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            continue
+        values = np.asarray(df.iloc[:, i])
+        while isinstance(values, np.ndarray):
+            values.flags.writeable = False
+            values = values.base
+    return df
@@ -1,3 +1,7 @@
 from .model import Model
+from .schedule import Schedule
 from .seichar import SEICHAR
 from .seichar_demographic import SEICHARDemographic
+from .seichar_batch import SEICHARBatch, run_batch
+from .exponential import eSEICHAR
+from .emulator import Emulator
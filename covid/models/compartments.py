@@ -0,0 +1,523 @@
+import ast
+import builtins
+from types import FunctionType
+from typing import NamedTuple, Optional, Sequence, Mapping
+
+import numpy as np
+
+NAMESPACE = {"np": np, "__builtins__": builtins}
+
+
+class Transition(NamedTuple):
+    """
+    A flux of individuals from source to target compartment.
+
+    Source or target can be None to represent flows that enter or leave the
+    system, like births, deaths and imported cases.
+    """
+
+    source: Optional[str]
+    target: Optional[str]
+    rate: str
+    when: Optional[str] = None
+
+
+class CompartmentModel:
+    """
+    Declarative description of a compartmental model.
+
+    Dynamics is given by a list of transitions between compartments. Each
+    transition declares a rate expression which is a Python expression
+    involving compartments, auxiliary definitions and model parameters. The
+    spec is compiled once into a function that evaluates all rates and
+    accumulates them according to the stoichiometry matrix.
+
+    Args:
+        compartments:
+            Sequence of compartment names. They are also the names of the
+            corresponding variables in rate expressions.
+        transitions:
+            Sequence of (source, target, rate) or (source, target, rate, when)
+            tuples. If "when" is given, it is the name of a parameter and the
+            transition is only included if the parameter is true.
+        definitions:
+            Mapping of auxiliary variables to their expressions. They are
+            evaluated in order, before any rate.
+
+    Examples:
+        >>> sir = CompartmentModel(
+        ...     ["s", "i", "r"],
+        ...     [("s", "i", "beta * s * i / n"), ("i", "r", "gamma * i")],
+        ...     {"n": "s + i + r"},
+        ... )
+        >>> rhs = sir.bind({"beta": 0.5, "gamma": 0.25})
+        >>> rhs(np.array([0.9, 0.1, 0.0]), 0.0)
+        array([-0.045,  0.02 ,  0.025])
+    """
+
+    def __init__(
+        self,
+        compartments: Sequence[str],
+        transitions: Sequence[tuple],
+        definitions: Mapping[str, str] = None,
+    ):
+        self.compartments = tuple(compartments)
+        self.transitions = tuple(Transition(*tr) for tr in transitions)
+        self.definitions = dict(definitions or {})
+        self._cache = {}
+
+        index = {name: i for i, name in enumerate(self.compartments)}
+        for tr in self.transitions:
+            for name in (tr.source, tr.target):
+                if name is not None and name not in index:
+                    raise ValueError(f"invalid compartment: {name!r}")
+
+        # Parameters are all free names that are not compartments, definitions
+        # or names in the global namespace.
+        exprs = [*self.definitions.values(), *(tr.rate for tr in self.transitions)]
+        bound = {*self.compartments, *self.definitions, *NAMESPACE, "t"}
+        names = {tr.when for tr in self.transitions if tr.when}
+        for expr in exprs:
+            names.update(free_names(expr))
+        self.parameters = tuple(sorted(n for n in names - bound if not hasattr(builtins, n)))
+
+    def __repr__(self):
+        compartments = ", ".join(self.compartments)
+        return f"{type(self).__name__}([{compartments}], {len(self.transitions)} transitions)"
+
+    @property
+    def stoichiometry(self) -> np.ndarray:
+        """
+        A (n_compartments, n_transitions) matrix with the change in each
+        compartment per unit of each transition.
+        """
+        index = {name: i for i, name in enumerate(self.compartments)}
+        S = np.zeros((len(self.compartments), len(self.transitions)))
+        for j, tr in enumerate(self.transitions):
+            if tr.source is not None:
+                S[index[tr.source], j] -= 1
+            if tr.target is not None:
+                S[index[tr.target], j] += 1
+        return S
+
+    def extend(self, transitions=(), definitions=None) -> "CompartmentModel":
+        """
+        Return a new model with additional transitions and with some
+        definitions replaced.
+        """
+        definitions = {**self.definitions, **(definitions or {})}
+        return type(self)(self.compartments, [*self.transitions, *transitions], definitions)
+
+    def bind(self, params, **overrides):
+        """
+        Return the derivative function rhs(y, t) with parameters taken from
+        params.
+
+        Params can be a mapping or an object that stores parameters as
+        attributes. Callable parameters are interpreted as functions of time.
+        The state y has compartments in the first axis and may have
+        additional axes for sub-groups or independent scenarios.
+        """
+        values, callables, enabled = self._parameter_values(params, overrides)
+        try:
+            code = self._cache[callables, enabled]
+        except KeyError:
+            code = self._cache[callables, enabled] = self._compile(callables, enabled)
+
+        code, constants = code
+        namespace = dict(NAMESPACE)
+        for k, v in values.items():
+            namespace["_fn_" + k if k in callables else k] = v
+        for k, expr in constants:
+            namespace[k] = eval(expr, namespace)
+        return FunctionType(code, namespace, "rhs")
+
+    def kernel(self, params, **overrides):
+        """
+        Return a pair (rhs, args) in which rhs(y, t, *args) is the derivative
+        function and args is a tuple of parameter values and pre-computed
+        constants.
+
+        Contrary to bind(), rhs does not depend on parameter values, but only
+        on the structure of the model. It is suitable for JIT compilation,
+        which happens only once for models with the same structure.
+        Time-dependent parameters are not supported.
+
+        Examples:
+            >>> sir = CompartmentModel(["s", "i"], [("s", "i", "beta * s * i")])
+            >>> rhs, args = sir.kernel({"beta": 2.0})
+            >>> rhs(np.array([0.5, 0.5]), 0.0, *args)
+            array([-0.5,  0.5])
+        """
+        values, callables, enabled = self._parameter_values(params, overrides)
+        if callables:
+            names = ", ".join(sorted(callables))
+            raise TypeError(f"kernels do not support time-dependent parameters: {names}")
+        try:
+            rhs, names, constants = self._cache["kernel", enabled]
+        except KeyError:
+            rhs, names, constants = self._cache["kernel", enabled] = self._compile_kernel(enabled)
+
+        namespace = {**NAMESPACE, **values}
+        for k, expr in constants:
+            namespace[k] = eval(expr, namespace)
+        return rhs, tuple(namespace[name] for name in names)
+
+    def split(self, params, **overrides) -> "LinearSplit":
+        """
+        Split the derivative function as rhs(y, t) = A @ y + nonlinear(y, t),
+        in which A is a constant matrix.
+
+        Transitions whose rate is a compartment multiplied by an expression
+        that only depends on constant parameters form the linear part. Rates
+        are first expanded into sums of terms, inlining definitions that are
+        sums or differences, so a rate like gamma * (h - hplus) contributes
+        gamma * h to A and keeps only -gamma * hplus in the remainder. All
+        other terms, including those with time-dependent parameters, are kept
+        in the nonlinear remainder.
+
+        Examples:
+            >>> sir = CompartmentModel(
+            ...     ["s", "i", "r"],
+            ...     [("s", "i", "beta * s * i"), ("i", "r", "gamma * i")],
+            ... )
+            >>> split = sir.split({"beta": 0.5, "gamma": 0.25})
+            >>> split.matrix[2]
+            array([0.  , 0.25, 0.  ])
+        """
+        values, callables, enabled = self._parameter_values(params, overrides)
+        try:
+            nonlinear, terms = self._cache["split", callables, enabled]
+        except KeyError:
+            split = self._split(callables, enabled)
+            nonlinear, terms = self._cache["split", callables, enabled] = split
+
+        namespace = {**NAMESPACE, **values}
+        coeffs = [eval(expr, namespace) for *_, expr in terms]
+        shape = ()
+        for coeff in coeffs:
+            shape = np.broadcast(np.empty(shape), coeff).shape
+        n = len(self.compartments)
+        matrix = np.zeros((*shape, n, n))
+        for (i, j, sign, _), coeff in zip(terms, coeffs):
+            matrix[..., i, j] += sign * np.asarray(coeff)
+        return LinearSplit(matrix, nonlinear.bind(values))
+
+    def _split(self, callables, enabled):
+        # Return the model with nonlinear transitions and a list of linear
+        # terms as (row, col, sign, code) tuples.
+        index = {name: i for i, name in enumerate(self.compartments)}
+        static = (set(self.parameters) - set(callables)) | set(NAMESPACE)
+        filename = f"<{type(self).__name__}>"
+
+        # Definitions are inlined if they only depend on static names or if
+        # they are sums or differences, which are expanded into several terms
+        inline = _Inline({})
+        for name, expr in self.definitions.items():
+            node = inline.visit(ast.parse(expr, mode="eval").body)
+            is_sum = isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub))
+            if is_sum or _is_static(node, static):
+                inline.definitions[name] = node
+
+        nonlinear, terms = [], []
+        for tr, on in zip(self.transitions, enabled):
+            if not on:
+                continue
+            rate = inline.visit(ast.parse(tr.rate, mode="eval").body)
+            expansion = _expand(rate, index, static)
+            linear = [_linear_factor(node, index, static) for _, node in expansion]
+            if not any(linear):
+                nonlinear.append(tr[:3])
+                continue
+            remainder = []
+            for (sign, node), factor in zip(expansion, linear):
+                if factor is None:
+                    remainder.append((sign, node))
+                    continue
+                col, expr = factor
+                code = compile(f"{sign} * ({expr})", filename, "eval")
+                if tr.source is not None:
+                    terms.append((index[tr.source], index[col], -1, code))
+                if tr.target is not None:
+                    terms.append((index[tr.target], index[col], +1, code))
+            if remainder:
+                expr = " ".join(f"{'+' if k > 0 else '-'} {_source(n)}" for k, n in remainder)
+                nonlinear.append((tr.source, tr.target, expr))
+        model = CompartmentModel(self.compartments, nonlinear, self.definitions)
+        return model, terms
+
+    def _parameter_values(self, params, overrides):
+        if isinstance(params, Mapping):
+            get = params.__getitem__
+        else:
+            get = lambda name: getattr(params, name)
+        values = {name: get(name) for name in self.parameters}
+        values.update(overrides)
+
+        callables = frozenset(k for k, v in values.items() if callable(v))
+        enabled = tuple(bool(tr.when is None or values[tr.when]) for tr in self.transitions)
+        return values, callables, enabled
+
+    def source(self, callables=frozenset(), enabled=None) -> str:
+        """
+        Source code for the derivative function.
+        """
+        enabled = enabled or [True] * len(self.transitions)
+        S = self.stoichiometry
+        lines = ["def rhs(y, t):"]
+        for i, name in enumerate(self.compartments):
+            lines.append(f"    {name} = y[{i}]")
+        for name in sorted(callables):
+            lines.append(f"    {name} = _fn_{name}(t)")
+        for name, expr in self.definitions.items():
+            lines.append(f"    {name} = {expr}")
+
+        terms = [[] for _ in self.compartments]
+        for j, (tr, on) in enumerate(zip(self.transitions, enabled)):
+            if not on:
+                continue
+            lines.append(f"    _r{j} = {tr.rate}")
+            for i, coeff in enumerate(S[:, j]):
+                if coeff:
+                    terms[i].append(f"{'-' if coeff < 0 else '+'} _r{j}")
+
+        lines.append("    dy = np.empty(np.shape(y))")
+        for i, ts in enumerate(terms):
+            expr = " ".join(ts).lstrip("+ ") if ts else "0.0"
+            lines.append(f"    dy[{i}] = {expr}")
+        lines.append("    return dy")
+        return "\n".join(lines)
+
+    def _compile(self, callables, enabled):
+        # Sub-expressions that only depend on parameters are computed once
+        # when the function is bound, instead of in every call.
+        tree = ast.parse(self.source(callables, enabled))
+        static = set(self.parameters) - set(callables)
+        hoist = _HoistStatic(static)
+        tree = ast.fix_missing_locations(hoist.visit(tree))
+
+        filename = f"<{type(self).__name__}>"
+        module = compile(tree, filename, "exec")
+        (code,) = (c for c in module.co_consts if hasattr(c, "co_code"))
+        constants = [(k, compile(expr, filename, "eval")) for k, expr in hoist.constants]
+        return code, constants
+
+    def _compile_kernel(self, enabled):
+        # Same as _compile, but parameters and constants are received as
+        # arguments instead of global variables.
+        tree = ast.parse(self.source(frozenset(), enabled))
+        hoist = _HoistStatic(self.parameters)
+        tree = hoist.visit(tree)
+
+        used = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+        names = [k for k, _ in hoist.constants]
+        names.extend(name for name in self.parameters if name in used)
+        tree.body[0].args.args.extend(ast.arg(name, None) for name in names)
+        tree = ast.fix_missing_locations(tree)
+
+        filename = f"<{type(self).__name__}>"
+        namespace = dict(NAMESPACE)
+        exec(compile(tree, filename, "exec"), namespace)
+        constants = [(k, compile(expr, filename, "eval")) for k, expr in hoist.constants]
+        return namespace["rhs"], names, constants
+
+
+class LinearSplit:
+    """
+    Derivative function written as rhs(y, t) = A @ y + nonlinear(y, t).
+
+    Created by :meth:`CompartmentModel.split`. The matrix A may be a stack of
+    matrices with the shape of the additional axes of the state, when
+    parameters are arrays with one value per sub-group or scenario.
+    """
+
+    def __init__(self, matrix, nonlinear):
+        self.matrix = matrix
+        self.nonlinear = nonlinear
+        self._phi = {}
+
+    def phi(self, h):
+        """
+        Return exp(h * A) and the functions phi_k(h * A) for k = 1, 2, 3, in
+        which phi_k(z) = sum_j z^j / (j + k)!. Results are cached by step size.
+        """
+        try:
+            return self._phi[h]
+        except KeyError:
+            if len(self._phi) > 8:
+                self._phi.clear()
+
+        # Blocks of the first row of the exponential of an augmented matrix
+        a = h * self.matrix
+        n = a.shape[-1]
+        augmented = np.zeros((*a.shape[:-2], 4 * n, 4 * n))
+        augmented[..., :n, :n] = a
+        for k in range(3):
+            augmented[..., k * n : (k + 1) * n, (k + 1) * n : (k + 2) * n] = np.eye(n)
+        e = expm(augmented)
+        self._phi[h] = result = tuple(e[..., :n, k * n : (k + 1) * n] for k in range(4))
+        return result
+
+    def apply(self, m, y):
+        """
+        Multiply state y, which has compartments in the first axis, by the
+        matrix or stack of matrices m.
+        """
+        if m.ndim == 2:
+            return m @ y
+        return np.einsum("...ij,j...->i...", m, y)
+
+
+def expm(a):
+    """
+    Matrix exponential of a square matrix or of a stack of matrices.
+
+    Uses scaling and squaring of a truncated Taylor series, which is accurate
+    for the small and well conditioned matrices of compartmental models.
+    """
+    a = np.asarray(a, dtype=float)
+    norm = np.abs(a).sum(-2).max(initial=0.0)
+    squarings = max(0, int(np.ceil(np.log2(norm / 0.25)))) if norm > 0 else 0
+    a = a / 2.0**squarings
+    result = term = np.broadcast_to(np.eye(a.shape[-1]), a.shape)
+    for k in range(1, 13):
+        term = (term @ a) / k
+        result = result + term
+    for _ in range(squarings):
+        result = result @ result
+    return result
+
+
+def _expand(node, compartments, static):
+    # Write expression as a list of (sign, term) pairs, expanding sums and
+    # differences through products and divisions. Sub-expressions are only
+    # expanded if some of their terms are linear.
+    if not isinstance(node, (ast.BinOp, ast.UnaryOp)) or _is_static(node, static):
+        return [(1, node)]
+    if isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, ast.USub):
+            return [(1, node)]
+        return [(-k, n) for k, n in _expand(node.operand, compartments, static)]
+    left = _expand(node.left, compartments, static)
+    if isinstance(node.op, (ast.Add, ast.Sub)):
+        sign = 1 if isinstance(node.op, ast.Add) else -1
+        right = _expand(node.right, compartments, static)
+        return [*left, *((sign * k, n) for k, n in right)]
+    elif isinstance(node.op, ast.Mult):
+        right = _expand(node.right, compartments, static)
+        terms = [(k1 * k2, ast.BinOp(n1, ast.Mult(), n2)) for k1, n1 in left for k2, n2 in right]
+    elif isinstance(node.op, ast.Div):
+        terms = [(k, ast.BinOp(n, ast.Div(), node.right)) for k, n in left]
+    else:
+        return [(1, node)]
+    if any(_linear_factor(n, compartments, static) for _, n in terms):
+        return terms
+    return [(1, node)]
+
+
+def _is_static(node, static):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)} <= static
+
+
+def _linear_factor(node, compartments, static):
+    # If expression is a compartment multiplied or divided by sub-expressions
+    # of static names, return (compartment, coefficient expression).
+    if isinstance(node, ast.Name) and node.id in compartments:
+        return node.id, "1.0"
+    if not isinstance(node, ast.BinOp) or not isinstance(node.op, (ast.Mult, ast.Div)):
+        return None
+
+    def is_static(expr):
+        return {n.id for n in ast.walk(expr) if isinstance(n, ast.Name)} <= static
+
+    op = "*" if isinstance(node.op, ast.Mult) else "/"
+    left = _linear_factor(node.left, compartments, static)
+    if left is not None and is_static(node.right):
+        return left[0], f"({left[1]}) {op} {_source(node.right)}"
+    if op == "*" and is_static(node.left):
+        right = _linear_factor(node.right, compartments, static)
+        if right is not None:
+            return right[0], f"{_source(node.left)} * ({right[1]})"
+    return None
+
+
+_OPERATORS = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+    ast.FloorDiv: "//",
+    ast.Mod: "%",
+    ast.Pow: "**",
+    ast.MatMult: "@",
+    ast.USub: "-",
+    ast.UAdd: "+",
+    ast.Not: "not ",
+}
+
+
+def _source(node):
+    # Source code of an expression node, with all operations in parenthesis.
+    # Works on Python versions without ast.unparse().
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.BinOp):
+        op = _OPERATORS[type(node.op)]
+        return f"({_source(node.left)} {op} {_source(node.right)})"
+    elif isinstance(node, ast.UnaryOp):
+        return f"({_OPERATORS[type(node.op)]}{_source(node.operand)})"
+    elif isinstance(node, ast.Attribute):
+        return f"{_source(node.value)}.{node.attr}"
+    elif isinstance(node, ast.Call):
+        args = [_source(arg) for arg in node.args]
+        args.extend(f"{kw.arg}={_source(kw.value)}" for kw in node.keywords)
+        return f"{_source(node.func)}({', '.join(args)})"
+    elif isinstance(node, ast.Subscript):
+        return f"{_source(node.value)}[{_source(node.slice)}]"
+    elif isinstance(node, getattr(ast, "Index", ())):
+        # Subscripts are wrapped in ast.Index before Python 3.9
+        return _source(node.value)
+    elif isinstance(node, ast.Tuple):
+        return f"({''.join(_source(elt) + ', ' for elt in node.elts)})"
+    return repr(ast.literal_eval(node))
+
+
+class _Inline(ast.NodeTransformer):
+    """
+    Replace names of definitions by their expressions.
+    """
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+
+    def visit_Name(self, node):
+        return self.definitions.get(node.id, node)
+
+
+class _HoistStatic(ast.NodeTransformer):
+    """
+    Replace maximal sub-expressions that only involve static names by
+    references to constants.
+    """
+
+    def __init__(self, static):
+        self.static = set(static)
+        self.allowed = self.static | set(NAMESPACE)
+        self.constants = []
+
+    def visit(self, node):
+        if isinstance(node, ast.expr) and not isinstance(node, (ast.Name, ast.Constant)):
+            names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+            if names & self.static and names <= self.allowed:
+                name = f"_c{len(self.constants)}"
+                self.constants.append((name, ast.Expression(node)))
+                return ast.copy_location(ast.Name(name, ast.Load()), node)
+        return self.generic_visit(node)
+
+
+def free_names(expr: str) -> set:
+    """
+    Return the set of variable names read by expression.
+    """
+    tree = ast.parse(expr, mode="eval")
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
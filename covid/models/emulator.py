@@ -0,0 +1,298 @@
+import itertools
+from typing import Callable, Mapping, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .seichar import SEICHAR
+from .seichar_batch import SEICHARBatch
+
+
+class Sample(NamedTuple):
+    """
+    Results of a simulation in a node of the grid, normalized by the initial
+    population.
+    """
+
+    times: np.ndarray
+    values: np.ndarray
+    integrals: np.ndarray
+
+
+class Emulator:
+    """
+    Approximate results of SEICHAR simulations by interpolation over a grid of
+    parameters.
+
+    Results of each node of the grid are stored per capita. Nodes are
+    simulated lazily, in a single batch, for the duration of the first query
+    that needs them and are extended when a longer query arrives. Use
+    :meth:`build` to simulate all nodes at once for the full duration. A query
+    interpolates the trajectories of the nodes in the cell around the given
+    parameters and fills a model created with the same factory, so it can be
+    used as if it was simulated.
+
+    Args:
+        factory:
+            Function that receives the grid parameters as keyword arguments
+            and returns a model at the beginning of simulation. Models for the
+            same emulator must only differ by grid parameters and population.
+            Everything else, including the demography profile, the fraction
+            of initial cases and healthcare capacity per capita, must be the
+            same.
+        grid:
+            Mapping from parameter names to the sequence of values in each
+            axis of the grid.
+        duration:
+            Simulation period of each node. Queries cannot be longer than it.
+    """
+
+    #: Summary statistics whose errors are estimated in each query
+    METRICS = (
+        "peak_hospitalization_demand",
+        "peak_icu_demand",
+        "fatalities",
+        "hospital_overflow_time",
+        "icu_overflow_time",
+    )
+
+    def __init__(self, factory: Callable, grid: Mapping, duration: int):
+        self.factory = factory
+        self.grid = {k: np.unique(np.asarray(v, dtype=float)) for k, v in grid.items()}
+        self.duration = duration
+        self._samples = {}
+        self._models = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    @property
+    def shape(self):
+        return tuple(map(len, self.grid.values()))
+
+    def build(self) -> "Emulator":
+        """
+        Simulate all nodes of the grid.
+        """
+        self._simulate(list(np.ndindex(*self.shape)), self.duration)
+        return self
+
+    def cell(self, **params) -> list:
+        """
+        Locate the grid cell that contains the given parameters.
+
+        Return a list with a ((i, j), theta) pair for each axis, in which i and
+        j are the indexes of the nodes before and after the parameter and
+        theta is its fractional position between them.
+
+        Raises:
+            ValueError: if parameters are outside the grid.
+        """
+        if set(params) != set(self.grid):
+            raise TypeError(f"expected parameters: {', '.join(self.grid)}")
+        axes = []
+        for name, values in self.grid.items():
+            x = float(params[name])
+            nearest = np.abs(values - x).argmin()
+            if np.isclose(x, values[nearest], rtol=1e-9, atol=0):
+                x = values[nearest]
+            i = int(np.searchsorted(values, x, side="right")) - 1
+            if i == len(values) - 1 and x == values[i]:
+                axes.append(((i, i), 0.0))
+                continue
+            if i < 0 or i >= len(values) - 1:
+                raise ValueError(f"{name}={x} is outside the grid")
+            theta = (x - values[i]) / (values[i + 1] - values[i])
+            axes.append(((i, i + 1), theta))
+        return axes
+
+    def emulate(self, model: SEICHAR, duration=None, **params) -> pd.Series:
+        """
+        Fill model with interpolated results of a simulation with the given
+        duration and parameters.
+
+        Model must be created by the factory with the same parameters and must
+        not be simulated yet. Summary statistics are computed just like in
+        model.run().
+
+        Return a series with the estimated relative error of each metric in
+        METRICS. Errors are estimated from nodes around the cell: linear
+        interpolation along each axis deviates by theta * (1 - theta) * h**2 *
+        |f''| / 2, in which h is the size of the cell and the second
+        derivative f'' of the metric is the largest one estimated from three
+        consecutive nodes that include the cell (axes with only two nodes use
+        2 * theta * (1 - theta) times the variation of the metric across the
+        cell instead). The contributions of all axes
+        are added to the difference between the emulated metric and the
+        interpolation of the metric in each node, since interpolating
+        trajectories also shifts and flattens their peaks. Errors vanish at
+        the nodes of the grid.
+        """
+        duration = self.duration if duration is None else duration
+        if duration > self.duration:
+            raise ValueError(f"duration must be at most {self.duration}")
+        axes = self.cell(**params)
+
+        # Only nodes with non-zero weights contribute to the result
+        nodes, weights = [], []
+        for corner in itertools.product((0, 1), repeat=len(axes)):
+            w = np.prod([(1 - theta, theta)[c] for (_, theta), c in zip(axes, corner)])
+            if w > 0:
+                nodes.append(tuple(idx[c] for (idx, _), c in zip(axes, corner)))
+                weights.append(w)
+        stencils = self._stencils(axes)
+        needed = {*nodes, *(n for group in stencils.values() for st in group for n in st)}
+        self._simulate(sorted(needed), duration)
+        samples = [self._samples[n] for n in nodes]
+        size = np.searchsorted(samples[0].times, samples[0].times[0] + duration + 1, side="right")
+        population = np.sum(model.state)
+
+        times = samples[0].times[:size]
+        values = population * sum(w * s.values[:size] for w, s in zip(weights, samples))
+        if all(len(s.times) == size for s in samples):
+            integrals = population * sum(w * s.integrals for w, s in zip(weights, samples))
+        else:
+            integrals = _cumtrapz(values, times)[-1]
+        self._fill(model, times, values, integrals)
+
+        # Error estimates from the curvature of metrics along each axis
+        def metrics(node):
+            totals = population * _totals(model, self._samples[node].values[:size])
+            return np.array(self._metrics(model, times, totals))
+
+        estimate = np.dot(weights, [metrics(n) for n in nodes])
+        emulated = np.array(self._metrics(model, times, _totals(model, values)))
+        error = np.abs(emulated - estimate)
+        names = list(self.grid)
+        for k, group in stencils.items():
+            (i, j), theta = axes[k]
+            grid = self.grid[names[k]]
+            h = grid[j] - grid[i]
+            bound = 0.0
+            for stencil in group:
+                fs = [metrics(n) for n in stencil]
+                if len(stencil) == 2:
+                    # Axes with only two nodes have no curvature estimate
+                    delta = 2 * theta * (1 - theta) * np.abs(fs[1] - fs[0])
+                else:
+                    h0, h1 = np.diff(grid[[n[k] for n in stencil]])
+                    f2 = 2 * ((fs[2] - fs[1]) / h1 - (fs[1] - fs[0]) / h0) / (h0 + h1)
+                    delta = 0.5 * theta * (1 - theta) * h**2 * np.abs(f2)
+                bound = np.maximum(bound, delta)
+            error += bound
+        scale = np.abs(estimate)
+        scale[3:] = duration
+        with np.errstate(invalid="ignore", divide="ignore"):
+            error = np.where(error == 0, 0.0, error / scale)
+        return pd.Series(np.nan_to_num(error, nan=np.inf), index=self.METRICS)
+
+    def _stencils(self, axes):
+        """
+        Map the index of each axis in which parameters are not at a node to
+        the list of sequences of three consecutive nodes along that axis that
+        include the cell. Stencils go through the corner of the cell with the
+        largest weight. Axes with only two nodes have a single stencil with
+        the two nodes of the cell.
+        """
+        corner = tuple(idx[int(theta > 0.5)] for idx, theta in axes)
+        out = {}
+        for k, ((i, j), theta) in enumerate(axes):
+            if theta == 0:
+                continue
+            size = len(list(self.grid.values())[k])
+            ranges = [range(i, j + 1)] if size < 3 else []
+            ranges += [range(m, m + 3) for m in (i - 1, i) if 0 <= m and m + 3 <= size]
+            out[k] = [[(*corner[:k], m, *corner[k + 1 :]) for m in r] for r in ranges]
+        return out
+
+    def _simulate(self, nodes, duration):
+        """
+        Simulate nodes, or extend their previous simulations, until they
+        cover the given duration. Nodes that share the same time run in a
+        single batch.
+        """
+        pending = {}
+        for node in nodes:
+            if node not in self._models:
+                params = {k: v[i] for (k, v), i in zip(self.grid.items(), node)}
+                self._models[node] = self.factory(**params)
+            model = self._models[node]
+            elapsed = model.time - model.trajectory.times[0] if len(model.trajectory) else 0
+            if not len(model.trajectory) or elapsed <= duration:
+                pending.setdefault(elapsed, []).append(node)
+
+        # A model that already ran up to day d + 1 continues with run(duration
+        # - d - 1) and ends exactly as a single run(duration) would.
+        for elapsed, group in pending.items():
+            models = [self._models[node] for node in group]
+            try:
+                batch = SEICHARBatch(models)
+            except (TypeError, ValueError):
+                for model in models:
+                    model.run(duration - elapsed)
+            else:
+                batch.run(duration - elapsed)
+
+            for node, model in zip(group, models):
+                traj = model.trajectory
+                n = traj.values[0].sum()
+                self._samples[node] = Sample(
+                    traj.times.copy(), traj.values / n, model.integrals / n
+                )
+
+    def _fill(self, model, times, values, integrals):
+        """
+        Store emulated results in model.
+        """
+        H, C = map(model.columns.index, ("hospitalized", "critical"))
+        totals = _totals(model, values)
+        model.record_totals = True
+        model.record_columns = None
+        model._trajectory = None
+        model.trajectory.extend(times, totals)
+        model.state = values[-1]
+        model.time = times[-1]
+        model.integrals = np.array(integrals)
+        model.peaks = np.array([totals[:, H].max(), totals[:, C].max()])
+        model.event_times = {
+            "hospital_overflow": _crossing(times, totals[:, H] - model.hospital_capacity),
+            "icu_overflow": _crossing(times, totals[:, C] - model.icu_capacity),
+        }
+        model._run_post_process()
+
+    def _metrics(self, model, times, totals):
+        H, C, F = map(model.columns.index, ("hospitalized", "critical", "fatalities"))
+        return [
+            totals[:, H].max(),
+            totals[:, C].max(),
+            totals[-1, F],
+            min(_crossing(times, totals[:, H] - model.hospital_capacity), times[-1]),
+            min(_crossing(times, totals[:, C] - model.icu_capacity), times[-1]),
+        ]
+
+
+def _totals(model, values):
+    # Sum over sub-groups of a (T, width) array of states
+    return values.reshape(len(values), len(model.columns), -1).sum(-1)
+
+
+def _cumtrapz(ys, times):
+    out = np.zeros(np.shape(ys))
+    steps = 0.5 * (ys[1:] + ys[:-1]) * np.reshape(np.diff(times), (-1, *[1] * (np.ndim(ys) - 1)))
+    out[1:] = np.cumsum(steps, 0)
+    return out
+
+
+def _crossing(times, gs):
+    """
+    Time in which gs first becomes non-negative, linearly interpolated between
+    samples, or infinity.
+    """
+    (idx,) = np.nonzero(gs >= 0)
+    if not len(idx):
+        return np.inf
+    i = idx[0]
+    if i == 0:
+        return float(times[0])
+    g0, g1 = gs[i - 1], gs[i]
+    return float(times[i - 1] + (times[i] - times[i - 1]) * g0 / (g0 - g1))
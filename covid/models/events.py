@@ -0,0 +1,191 @@
+from typing import Callable, NamedTuple, Sequence
+
+import numpy as np
+
+
+class Event(NamedTuple):
+    """
+    An event happens when fn(x) crosses zero.
+
+    Event functions are vectorized: they receive a state or a stack of states
+    in which compartments are in the last axis and return one value per state.
+
+    Args:
+        name:
+            Event name. Time of first occurrence is stored under this name.
+        fn:
+            Event function.
+        direction:
+            If positive, only detect crossings from negative to positive
+            values. If negative, only crossings from positive to negative and
+            if zero, detect both.
+        terminal:
+            If True, simulation stops at the step in which event occurs.
+        initial:
+            If True, event also happens at the initial time if the initial
+            state is already at the final side of the crossing.
+    """
+
+    name: str
+    fn: Callable
+    direction: int = 0
+    terminal: bool = False
+    initial: bool = False
+
+
+class EventTracker:
+    """
+    Detect events along a simulation and locate the time of their first
+    occurrence.
+
+    Events are evaluated once at the end of each step. If a crossing is
+    detected, its time is found by bisection on a cubic Hermite interpolation
+    of the state within the step.
+
+    Args:
+        events:
+            Sequence of events.
+        fun:
+            Derivative function with signature fun(x, t).
+        t, x:
+            Initial time and state. State might be a (n, width) batch of
+            states. In that case, times are stored as arrays with one entry
+            per state.
+        times:
+            Optional mapping with times of events that happened before the
+            beginning of the simulation.
+    """
+
+    bisection_iterations = 40
+
+    #: True if some event was registered in the last update
+    fired = False
+
+    def __init__(self, events: Sequence[Event], fun, t, x, times=None):
+        self.events = list(events)
+        self.fun = fun
+        self._values = [np.asarray(ev.fn(x), dtype=float) for ev in self.events]
+        self.times = {}
+        times = times or {}
+        for ev, g in zip(self.events, self._values):
+            ts = np.full(g.shape, np.inf)
+            ts[...] = times.get(ev.name, np.inf)
+            if ev.initial:
+                ts[(self._sign(ev, g) >= 0) & np.isinf(ts)] = t
+            self.times[ev.name] = ts
+
+    def __getitem__(self, name):
+        return self.times[name]
+
+    def _sign(self, ev, g):
+        return g if ev.direction >= 0 else -g
+
+    def _crossed(self, ev, g0, g1):
+        if ev.direction > 0:
+            return (g0 < 0) & (g1 >= 0)
+        elif ev.direction < 0:
+            return (g0 > 0) & (g1 <= 0)
+        return np.sign(g0) != np.sign(g1)
+
+    def update(self, t0, x0, t1, x1, active=True):
+        """
+        Register the events that happened in the step from (t0, x0) to
+        (t1, x1) and return a boolean (or boolean array for batches) that is
+        True if a terminal event occurred.
+
+        Events are only registered in the positions of the active mask.
+        """
+        stop = np.zeros(np.shape(self._values[0]) if self._values else (), dtype=bool)
+        dense = None
+        self.fired = False
+
+        for k, ev in enumerate(self.events):
+            g0 = self._values[k]
+            g1 = self._values[k] = np.asarray(ev.fn(x1), dtype=float)
+            crossed = self._crossed(ev, g0, g1) & active
+            if ev.terminal:
+                stop |= crossed
+
+            # We only record the first occurrence of each event
+            times = self.times[ev.name]
+            crossed &= np.isinf(times)
+            if crossed.any():
+                self.fired = True
+                dense = dense or hermite(self.fun, t0, x0, t1, x1)
+                theta = self._locate(ev, g0, dense)
+                times[crossed] = (t0 + theta * (t1 - t0))[crossed]
+        return stop
+
+    def update_many(self, t0, x0, ts, xs):
+        """
+        Register the events that happened in a sequence of steps that starts
+        at (t0, x0) and passes through (ts[k], xs[k]).
+
+        Return a tuple (stop, fired), in which stop is the index of the first
+        step with a terminal event or None and fired is a boolean array that
+        marks the steps in which some event was registered. Steps after stop
+        are ignored. Batches of states are not supported.
+        """
+        n = len(ts)
+        values = [np.asarray(ev.fn(xs), dtype=float) for ev in self.events]
+        crossings = []
+        stop = n
+        for ev, g0, g in zip(self.events, self._values, values):
+            crossed = np.flatnonzero(self._crossed(ev, np.append(g0, g[:-1]), g))
+            crossings.append(crossed)
+            if ev.terminal and len(crossed):
+                stop = min(stop, crossed[0])
+
+        fired = np.zeros(n, dtype=bool)
+        for k, (ev, g, crossed) in enumerate(zip(self.events, values, crossings)):
+            times = self.times[ev.name]
+            if len(crossed) and crossed[0] <= stop and np.isinf(times):
+                j = crossed[0]
+                ta, xa = (t0, x0) if j == 0 else (ts[j - 1], xs[j - 1])
+                g0 = self._values[k] if j == 0 else g[j - 1]
+                theta = self._locate(ev, g0, hermite(self.fun, ta, xa, ts[j], xs[j]))
+                times[...] = ta + theta * (ts[j] - ta)
+                fired[j] = True
+            self._values[k] = g[min(stop, n - 1)]
+        return (None if stop == n else stop), fired
+
+    def _locate(self, ev, g0, dense):
+        lo = np.zeros(g0.shape)
+        hi = np.ones(g0.shape)
+        for _ in range(self.bisection_iterations):
+            mid = 0.5 * (lo + hi)
+            g = np.asarray(ev.fn(dense(mid[..., None])))
+            left = self._crossed(ev, g0, g)
+            hi = np.where(left, mid, hi)
+            lo = np.where(left, lo, mid)
+        return hi
+
+    def first(self, name):
+        """
+        Time of first occurrence of event or infinity.
+        """
+        times = self.times[name]
+        return times.item() if times.ndim == 0 else times
+
+
+def hermite(fun, t0, x0, t1, x1):
+    """
+    Cubic Hermite interpolation of the solution in the interval [t0, t1].
+
+    Return a function of the fraction theta of step.
+    """
+    h = t1 - t0
+    f0 = fun(x0, t0)
+    f1 = fun(x1, t1)
+
+    def dense(theta):
+        theta2 = theta * theta
+        theta3 = theta2 * theta
+        return (
+            (2 * theta3 - 3 * theta2 + 1) * x0
+            + (theta3 - 2 * theta2 + theta) * h * f0
+            + (3 * theta2 - 2 * theta3) * x1
+            + (theta3 - theta2) * h * f1
+        )
+
+    return dense
@@ -1,152 +1,240 @@
+import warnings
+
 import numpy as np
-import pandas as pd
-from ..utils import today
-from ..parameters import epidemic
 
+from .seichar import SEICHAR
 
-class Model:
-    """
-    Base class for all models.
 
-    Attributes:
-        params: A
+class eSEICHAR(SEICHAR):
+    """
+    SEICHAR model linearized around the disease free equilibrium.
+
+    At the outset of an epidemic, susceptibles are roughly the whole
+    population and healthcare is below capacity. Active cases then grow as
+    exp(K * t), in which K is the growth rate in :attr:`SEICHAR.K`, and keep a
+    fixed proportion between compartments. Recovered and fatalities grow by
+    the corresponding fluxes and susceptibles by the balance of all other
+    compartments. The solution has a closed form and can be evaluated for any
+    set of times with :meth:`states`, without time integration.
+
+    Parameters and queries are the same as in SEICHAR. Vital dynamics and
+    imported cases are ignored and R0 is evaluated at the beginning of each
+    run (time-dependent R0 is advanced one day at a time). The initial state
+    has active compartments in the proportions of the growing mode. Other
+    states are advanced as if each active compartment grew at rate K.
+
+    Approximation is only valid while the fraction of the population that was
+    infected remains small. Simulations stop when this fraction reaches
+    max_attack_rate, even if a longer duration is given, and models that
+    start beyond it cannot run. The default seed of models with unit
+    population is 0.001% of infectious.
     """
 
-    # Constants
-    DATA_ALIASES = {}
-
-    # Initial values
-    params = 1
-    date = None
-    time = 0
-    iter = 0
-    state = None
-
-    @classmethod
-    def create(cls, params=None):
-        new = object.__new__(cls)
-        new.set_params(params)
-        return new
-
-    def __init__(self, params=None, date=None, **kwargs):
-        # params
-        # self.set_params(params)
-        self.date = date or today()
-
-    #
-    # Parameters
-    #
-    def set_params(self, params):
-        """
-
-        Args:
-            params:
-
-        Returns:
-
+    max_attack_rate = 0.05
+
+    # The default 1% seed is already beyond max_attack_rate
+    unit_seed = 1e-5
+
+    # Compartments that grow exponentially
+    ACTIVE = [
+        SEICHAR.EXPOSED,
+        SEICHAR.INFECTIOUS,
+        SEICHAR.CRITICAL,
+        SEICHAR.HOSPITALIZED,
+        SEICHAR.ASYMPTOMATIC,
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if "state" not in kwargs and "x0" not in kwargs:
+            x = np.zeros(8)
+            x[self.ACTIVE] = self.mode() * self.state[self.INFECTIOUS]
+            x[self.SUSCEPTIBLE] = self.state.sum() - x.sum()
+            self.state = x
+
+    def mode(self, K=None) -> np.ndarray:
         """
-        self.params = params
-
-    def set_param(self, name, value, *, distrib=None, ref=None):
+        Ratio of each active compartment (exposed, infectious, critical,
+        hospitalized and asymptomatic) to the infectious population in the
+        growing mode.
         """
-        Sets a parameter in the model, possibly assigning a distribution and
-        reference.
+        K = self.K if K is None else K
+        p_s, p_h, p_icu, p_f = (
+            self.prob_symptomatic,
+            self.prob_hospitalization,
+            self.prob_icu,
+            self.prob_fatality,
+        )
+        e = (K + self.gamma_i) / (p_s * self.sigma)
+        a = (1 - p_s) * self.sigma * e / (K + self.gamma_a)
+
+        # Patients in the ICU that survive return to the hospital ward
+        loop = (1 - p_f) * self.gamma_c * p_icu * self.gamma_h / (K + self.gamma_c)
+        h = p_h * self.gamma_i / (K + self.gamma_h - loop)
+        c = p_icu * self.gamma_h * h / (K + self.gamma_c)
+        return np.array([e, 1.0, c, h, a])
+
+    def _fluxes(self, x):
+        # Rates of new recoveries and fatalities due to active compartments
+        i, c, h, a = (x[..., k] for k in self.ACTIVE[1:])
+        p_h, p_icu = self.prob_hospitalization, self.prob_icu
+        r = (1 - p_h) * self.gamma_i * i + (1 - p_icu) * self.gamma_h * h + self.gamma_a * a
+        f = self.prob_fatality * self.gamma_c * c
+        return r, f
+
+    def _growth(self, dt, K):
+        # Closed form factors exp(K dt), int exp(K dt) and int int exp(K dt)
+        dt = np.asarray(dt, dtype=float)
+        growth = np.exp(K * dt)
+        if K == 0:
+            return growth, dt, dt * dt / 2
+        int1 = np.expm1(K * dt) / K
+        return growth, int1, (int1 - dt) / K
+
+    def states(self, times, x=None, t=None, K=None) -> np.ndarray:
         """
-        raise NotImplementedError
+        Evaluate states at the given times.
 
-    def get_param(self, name):
+        Return an array with one row per time. By default, the solution
+        starts from the current state and time of the model.
         """
-        Return
-        Args:
-            name:
-
-        Returns:
-
+        x = np.asarray(self.state if x is None else x, dtype=float)
+        t = self.time if t is None else t
+        K = self.K if K is None else K
+        growth, int1, _ = self._growth(np.subtract(times, t), K)
+        r, f = self._fluxes(x)
+
+        xs = np.empty((*np.shape(times), 8))
+        xs[...] = x
+        xs[..., self.ACTIVE] *= growth[..., None]
+        xs[..., self.RECOVERED] += r * int1
+        xs[..., self.FATALITIES] += f * int1
+        xs[..., self.SUSCEPTIBLE] += x.sum() - xs.sum(-1)
+        return xs
+
+    def integrals_between(self, t0, t1, x=None, K=None) -> np.ndarray:
         """
-
-    def get_param_value(self, name):
+        Time integral of each compartment from t0 to t1, starting from state x
+        at t0 (defaults to the current state).
         """
-
-        Args:
-            name:
-
-        Returns:
-
+        x = np.asarray(self.state if x is None else x, dtype=float)
+        K = self.K if K is None else K
+        dt = t1 - t0
+        _, int1, int2 = self._growth(dt, K)
+        r, f = self._fluxes(x)
+
+        q = x * dt
+        q[self.ACTIVE] = x[self.ACTIVE] * int1
+        q[self.RECOVERED] += r * int2
+        q[self.FATALITIES] += f * int2
+        q[self.SUSCEPTIBLE] += x.sum() * dt - q.sum()
+        return q
+
+    def horizon(self, x=None, K=None) -> float:
         """
+        Time from the current state until the fraction of the population that
+        was ever infected reaches max_attack_rate or, for decaying
+        epidemics, until active cases are negligible.
 
-    #
-    # Retrieving columns
-    #
-    def get_data_transformer(self, name):
-        if name == "days":
-            raise NotImplementedError
-        else:
-            raise ValueError(f"Invalid transform: {name}")
-
-    def get_data(self, name):
-        name = self.DATA_ALIASES.get(name, name)
-        return self.data[[name]]
-
-    def __getitem__(self, item):
-        if isinstance(item, str):
-            col, _, transform = item.rpartition(":")
-            if transform:
-                fn = self.get_data_transformer(transform)
-                return fn(col)
-            else:
-                return self.get_data(col)
-
-        elif isinstance(item, list):
-            raise NotImplementedError
-        elif isinstance(item, slice):
-            raise NotImplementedError
-        else:
-            raise TypeError(f"invalid item: {item!r}")
-
-    #
-    # Running simulation
-    #
-    def run(self, time_or_fn):
+        Result is limited to max_simulation_period.
         """
-        Runs the model for the given duration of until the given convergence
-        function returns True.
+        x = np.asarray(self.state if x is None else x, dtype=float)
+        K = self.K if K is None else K
+        n = x.sum()
+        active = x[self.ACTIVE].sum()
+        if K > 0:
+            # New infections are (exp(K t) - 1) * (active + fluxes / K)
+            target = self.max_attack_rate * n - (n - x[self.SUSCEPTIBLE])
+            scale = active + sum(self._fluxes(x)) / K
+            if target <= 0 or scale <= 0:
+                return 0.0
+            time = np.log1p(target / scale) / K
+        elif K < 0 and active > 0:
+            time = np.log(1e-6 * n / active) / K
+        else:
+            time = np.inf
+        return float(min(max(time, 0.0), self.max_simulation_period))
+
+    def diff(self, x, t):
+        x = np.asarray(x, dtype=float)
+        r, f = self._fluxes(x)
+        dx = np.zeros_like(x)
+        dx[..., self.ACTIVE] = self.K * x[..., self.ACTIVE]
+        dx[..., self.RECOVERED] = r
+        dx[..., self.FATALITIES] = f
+        dx[..., self.SUSCEPTIBLE] = -dx.sum(-1)
+        return dx
+
+    def step(self, x, t=None, dt=1.0, watcher=None):
+        t = self.time if t is None else t
+        K = self.K
+        x_ = self.states(t + dt, x, t, K)
+        if watcher is not None:
+            watcher(x, (x_ - x) / dt, t, dt)
+        if self.integrals is not None:
+            self.integrals += self.integrals_between(t, t + dt, x, K)
+        self.time = t + dt
+        return x_
+
+    def _valid_duration(self, duration):
+        # Limit duration to the validity of the linear approximation
+        horizon = self.horizon()
+        if horizon == 0:
+            raise ValueError(
+                "linear approximation is not valid: the attack rate already reached "
+                f"max_attack_rate={self.max_attack_rate}"
+            )
+        if duration is None:
+            return horizon
+        if duration > horizon:
+            warnings.warn(f"linear approximation is only valid for {horizon:.1f} days")
+            return horizon
+        return duration
+
+    def _simulate(self, duration=None, *args, **kwargs):
+        duration = self._valid_duration(duration)
+        return super()._simulate(duration, *args, **kwargs)
+
+    def run(self, duration=None, convergence=None, watcher=None, events=(), stop_at=()):
         """
-        raise NotImplementedError
-
-
-class eSIR(Model):
-    """
-    A simple SIR model linearized around the DFE.
-    """
-
-    DATA_ALIASES = {"S": "susceptible", "I": "infectious", "R": "recovered"}
-
-    def run_interval(self, time: int):
-        time = int(time)
-        ts = np.arange(time)
+        Run simulation for the given duration or until the linear
+        approximation ceases to be valid.
 
-        S, I, R = self.S(ts), self.I(ts), self.R(ts)
-        data = {"susceptible": S, "infectious": I, "recovered": R}
-        df = pd.DataFrame(data, index=self.to_dates(ts + self.time))
-        self.time += time
-        self.data_ts = self.data_ts.append(df)
-
-    #
-    # Epidemic curves
-    #
-    def S(self, t):
-        return self.S_value - self.I_value * np.exp(self.K * t)
-
-    def I(self, t):
-        return self.I_value * np.exp(self.K * t)
-
-    def R(self, t):
-        return self.I_value * np.exp(self.K * t)
-
-
-m = eSIR()
-assert m.R0 == 2.74
-assert m.K == m.gamma * 1.74
-
-m.run(120)
-assert m["I"] == 1e-6 * np.exp()
+        Unless R0 is time-dependent or a convergence or watcher function is
+        given, all days are evaluated at once from the closed form solution.
+        Arguments are the same as in :meth:`Model.run`. Durations longer than
+        :meth:`horizon` are truncated with a warning.
+        """
+        if callable(self.R0) or convergence is not None or watcher is not None:
+            return super().run(duration, convergence, watcher, events, stop_at)
+        duration = self._valid_duration(duration)
+
+        x = np.asarray(self.state, dtype=float)
+        t = self.time
+        K = self.K
+        tracker = self._event_tracker(duration, events, stop_at, t, x)
+        self.event_times = tracker.times
+        tf = t + duration
+        tmax = t + self.max_simulation_period
+
+        # Same number of steps as _simulate()
+        n_steps, s = 0, t
+        while True:
+            s += self.dt
+            n_steps += 1
+            if s > tmax or s > tf:
+                break
+        ts = np.add.accumulate(np.array([t, *[self.dt] * n_steps]))[1:]
+        xs = self.states(ts, x, t, K)
+
+        stop, _ = tracker.update_many(t, x, ts, xs)
+        if stop is not None:
+            ts, xs = ts[: stop + 1], xs[: stop + 1]
+        if self._get_validation() != "off":
+            for t_, x_ in zip(ts, xs):
+                self.check_state(x_, t_, x)
+
+        integrals = self.integrals_between(t, ts[-1], x, K)
+        self.time = ts[-1]
+        self._store_run(np.append(t, ts), np.vstack([x[None], xs]), integrals)
+        return self
@@ -0,0 +1,98 @@
+"""
+Compiled integration loops.
+
+The whole fixed-step RK4 loop is generated as a single function that calls
+the derivative kernel of a :class:`covid.models.compartments.CompartmentModel`
+directly. If numba is installed, both are JIT-compiled. Otherwise, or if numba
+fails to compile them, the same functions run as plain Python, which is still
+faster than going through the Model.step() machinery.
+"""
+
+import warnings
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
+
+LOOPS = {}
+
+
+def is_available() -> bool:
+    """
+    True if numba is installed.
+    """
+    return numba is not None
+
+
+def rk4_loop(rhs, nonnegative=False):
+    """
+    Return a function that integrates several days with RK4.
+
+    The returned function has signature:
+
+        loop(x, t, dt, steps, n_days, args, xs, qs) -> (x, t)
+
+    It performs n_days steps of size dt, each one subdivided in the given
+    number of RK4 steps, and stores the state at the end of each day in the
+    rows of xs. The integral of state since the beginning of the loop is saved
+    in the rows of qs. Arguments are passed to rhs as rhs(x, t, *args).
+
+    If nonnegative is True, negative populations are clipped to zero after
+    each RK4 step.
+    """
+    key = (rhs, nonnegative)
+    try:
+        return LOOPS[key]
+    except KeyError:
+        LOOPS[key] = compiled = _Compiled(rhs, nonnegative)
+        return compiled
+
+
+def _make_loop(rhs, nonnegative):
+    def loop(x, t, dt, steps, n_days, args, xs, qs):
+        h = dt / steps
+        q = np.zeros_like(x)
+        for day in range(n_days):
+            s = t
+            for _ in range(steps):
+                k1 = rhs(x, s, *args)
+                k2 = rhs(x + 0.5 * h * k1, s + 0.5 * h, *args)
+                k3 = rhs(x + 0.5 * h * k2, s + 0.5 * h, *args)
+                k4 = rhs(x + 1.0 * h * k3, s + 1.0 * h, *args)
+                v = (k1 + 2 * k2 + 2 * k3 + k4) / 6
+                q = q + (h * x + (h * h / 6) * (k1 + k2 + k3))
+                x = x + v * h
+                if nonnegative:
+                    x = np.maximum(x, 0.0)
+                s += h
+            t += dt
+            xs[day] = x
+            qs[day] = q
+        return x, t
+
+    return loop
+
+
+class _Compiled:
+    """
+    Call the JIT-compiled loop, falling back to the Python implementation if
+    numba is not available or if compilation fails.
+    """
+
+    def __init__(self, rhs, nonnegative):
+        self.python = self.function = _make_loop(rhs, nonnegative)
+        if numba is not None:
+            self.function = numba.njit(_make_loop(numba.njit(rhs), nonnegative))
+
+    def __call__(self, *args):
+        if self.function is self.python:
+            return self.python(*args)
+        try:
+            return self.function(*args)
+        except numba.core.errors.NumbaError as exc:
+            warnings.warn(f"could not JIT compile integration loop: {exc}")
+            self.function = self.python
+            return self.python(*args)
@@ -2,12 +2,17 @@ import datetime
 from numbers import Real
 from pprint import pformat
 from types import MappingProxyType
-from typing import Sequence
+from typing import Iterator, List, NamedTuple, Sequence
 
 import numpy as np
 import pandas as pd
 
+from . import jit
+from .events import Event, EventTracker
 from .plot import Plot
+from .schedule import Schedule
+from .solvers import DormandPrince
+from .trajectory import StateArray, Trajectory
 from ..types import cached
 
 NOW = datetime.datetime.now()
@@ -15,6 +20,28 @@ TODAY = datetime.date(NOW.year, NOW.month, NOW.day)
 DAY = datetime.timedelta(days=1)
 
 
+def _copy_attr(value):
+    if isinstance(value, Trajectory):
+        return value.fork()
+    elif isinstance(value, np.ndarray):
+        return value.copy()
+    elif isinstance(value, dict):
+        return {k: _copy_attr(v) for k, v in value.items()}
+    elif isinstance(value, (list, set)):
+        return type(value)(map(_copy_attr, value))
+    return value
+
+
+class Snapshot(NamedTuple):
+    """
+    State of simulation at a given time.
+    """
+
+    time: float
+    date: datetime.date
+    state: np.ndarray
+
+
 class ModelMeta(type):
     """
     Meta class for model types.
@@ -48,15 +75,97 @@ class Model(metaclass=ModelMeta):
     plot: Plot = cached(lambda self: self.plot_class(self))
     plot_class = Plot
 
-    # Solver and numerical method parameters
+    # Declarative description of the dynamics (see covid.models.compartments)
+    DYNAMICS = None
+    _rhs = None
+    _rhs_window = (-np.inf, np.inf)
+    _split = None
+
+    # Solver and numerical method parameters. The "etdrk4" solver is an
+    # exponential RK4 that integrates the linear transitions of DYNAMICS
+    # exactly. It remains stable with one step per day for fast rates, with
+    # accuracy similar to RK4 with the same number of steps.
+    SOLVERS = ("rk4", "dopri5", "etdrk4")
+    solver = "rk4"
     steps_per_day = 4
     dt = 1.0
     max_simulation_period = 5 * 365
 
+    # Integration backend. If "numba", runs with the rk4 solver are integrated
+    # by a single compiled loop (see covid.models.jit). It falls back to the
+    # Python implementation if numba is not installed or if the model or run
+    # uses features not supported by the compiled loop, such as watchers or
+    # time-dependent parameters. Models that clip negative values in
+    # _clip_state() should set nonnegative=True, so the compiled loop does the
+    # same.
+    BACKENDS = ("python", "numba")
+    backend = "python"
+    nonnegative = False
+    compiled_chunk_size = 64
+
+    # Adaptive solver options (ignored by rk4). If atol is None, it is
+    # inferred from the magnitude of the initial state. Very long steps may
+    # overshoot into negative populations, hence the finite max_step.
+    rtol = 1e-6
+    atol = None
+    max_step = 5.0
+    _solver = None
+
+    # Invariant checks. If "sampled", the state is checked after each
+    # simulated day and, if "full", in each evaluation of the derivative.
+    VALIDATION_MODES = ("off", "sampled", "full")
+    validation = "off"
+    population_rtol = 1e-6
+
     # Dynamic queries and epidemic state
     time = 0.0
     state = None
     is_spreading = True
+    _trajectory = None
+    _data_cache = (None, None)
+    _query_cache = (None, None)
+    _dates_cache = (None, None)
+
+    # Parameters that affect the results of model[name] queries
+    QUERY_PARAMETERS = ("start_date", "time_delta")
+    _NOT_COPIED = {
+        "plot",
+        "_rhs",
+        "_rhs_window",
+        "_split",
+        "_solver",
+        "_data_cache",
+        "_query_cache",
+        "_dates_cache",
+    }
+    event_times = MappingProxyType({})
+
+    # Running integrals of each state variable and running maxima of
+    # peak_values(). They are updated during simulation with the same
+    # accuracy as the solver, so summary statistics do not need to rescan the
+    # trajectory. Both are None if accumulate is False or if trajectory was
+    # not produced by the solver.
+    accumulate = True
+    integrals = None
+    peaks = None
+
+    # Recording policy. Integration is always done in double precision, but
+    # only part of the results may be stored in the trajectory.
+    #
+    # record_every:
+    #     Store one state every given number of steps. If None, only store the
+    #     states at the end of steps in which an event happened. The first and
+    #     last states of a run are always stored.
+    # record_dtype:
+    #     Data type of stored states (e.g., np.float32).
+    # record_columns:
+    #     If given, only store the selected compartments.
+    # record_totals:
+    #     If True, models with sub-groups store the sum over all groups.
+    record_every = 1
+    record_dtype = float
+    record_columns = None
+    record_totals = False
 
     # Reporting options
     start_date = TODAY
@@ -112,42 +221,170 @@ class Model(metaclass=ModelMeta):
 
         if not hasattr(self, "display_columns"):
             self.display_columns = self.columns
-        if not hasattr(self, "datasets"):
-            self.data = pd.DataFrame(columns=self.columns)
 
     def __str__(self):
         return self.summary()
 
     def __iter__(self):
-        x = self.state
-        dt = self.dt / self.steps_per_day
-        t = self.time
-        while True:
-            for i in range(self.steps_per_day):
-                x = self.rk4_step(x, t, dt)
-                t += dt
-            yield x
+        for snapshot in self.stream(float("inf")):
+            yield snapshot.state
 
-    def __getitem__(self, item):
-        if isinstance(item, str):
-            if ":" in item:
-                col, *methods = item.split(":")
-                fn, *fns = [getattr(self, f"get_{m}") for m in methods]
-                res = fn(col)
-                for fn in fns:
-                    res = fn(res)
-                return res
+    def stream(self, duration=None, every=1, columns=None) -> Iterator[Snapshot]:
+        """
+        Run simulation lazily, yielding a (time, date, state) snapshot at the
+        end of each simulated day.
+
+        States are saved in the trajectory and model is updated after each
+        step, so the caller can stop iteration at any moment and resume the
+        simulation later. Contrary to run(), it does not compute the summary
+        statistics at the end of simulation.
+
+        Args:
+            duration:
+                Maximum duration of simulation. If None, stops when the
+                dynamics converges, just like run().
+            every:
+                Yield only one snapshot every given number of days.
+            columns:
+                If given, select the state of a column or a list of columns.
+                Otherwise, yields the full state vector.
+
+        Examples:
+            >>> for t, date, icu in model.stream(columns="critical"):  # doctest: +SKIP
+            ...     if icu > model.icu_capacity:
+            ...         break
+        """
+        select = self._column_selector(columns)
+        for n, (t, x) in enumerate(self._simulate(duration), 1):
+            if n % every == 0:
+                yield Snapshot(t, self.start_date + t * DAY, select(x))
+
+    def _column_selector(self, columns):
+        if columns is None:
+            return lambda x: x
+
+        n_groups = len(self.sub_groups or [None])
+        if isinstance(columns, str):
+            i = self.columns.index(columns)
+            if self.sub_groups:
+                return lambda x: x[i * n_groups : (i + 1) * n_groups]
+            return lambda x: x[i]
+
+        idx = [self.columns.index(col) for col in columns]
+        if self.sub_groups:
+            shape = (len(self.columns), n_groups)
+            return lambda x: np.reshape(x, shape)[idx]
+        return lambda x: x[idx]
+
+    @property
+    def trajectory(self) -> Trajectory:
+        """
+        Buffer that stores the simulated times and states.
+        """
+        if self._trajectory is None:
+            if self.state is not None:
+                width = np.size(self._record_state(self.state))
             else:
-                try:
-                    method = getattr(self, f"get_data_{item}")
-                except AttributeError:
-                    raise KeyError(item)
-                else:
-                    return method(self.data)
-        else:
+                width = len(self.recorded_columns) * len(self.recorded_groups or [None])
+            self._trajectory = Trajectory(width, dtype=self.record_dtype)
+        return self._trajectory
+
+    @property
+    def recorded_columns(self) -> list:
+        """
+        Compartments stored in the trajectory.
+        """
+        return list(self.columns if self.record_columns is None else self.record_columns)
+
+    @property
+    def recorded_groups(self):
+        """
+        Sub-groups stored in the trajectory for each compartment or None.
+        """
+        if not self.sub_groups:
+            return None
+        return ("total",) if self.record_totals else self.sub_groups
+
+    def _record_state(self, x):
+        """
+        Convert a state or a stack of states to the layout stored in the
+        trajectory.
+        """
+        x = np.asarray(x)
+        if self.record_columns is None and not (self.record_totals and self.sub_groups):
+            return x
+        idx = [self.columns.index(col) for col in self.recorded_columns]
+        x = np.reshape(x, (*x.shape[:-1], len(self.columns), -1))[..., idx, :]
+        if self.record_totals:
+            x = x.sum(-1)
+        return np.reshape(x, (*x.shape[: -1 if self.record_totals else -2], -1))
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """
+        Simulation results as a dataframe indexed by time.
+
+        The dataframe is a view over the trajectory buffer and is only rebuilt
+        when new states are stored.
+        """
+        traj = self.trajectory
+        version, df = self._data_cache
+        if version != traj.version:
+            df = self._to_dataframe(traj.times, traj.values)
+            self._data_cache = (traj.version, df)
+        return df
+
+    @data.setter
+    def data(self, df):
+        self.integrals = self.peaks = None
+        values = np.asarray(df.values, dtype=float)
+        self._trajectory = traj = Trajectory(values.shape[1], len(values))
+        traj.extend(np.asarray(df.index, dtype=float), values)
+
+    def __getitem__(self, item):
+        if not isinstance(item, str):
             cls = type(item)
             raise TypeError(f"invalid index type: {cls.__name__}")
 
+        # Results are memoised until the trajectory or some parameter in
+        # QUERY_PARAMETERS changes. Callers receive copies.
+        version = self._data_version()
+        cached_version, results = self._query_cache
+        if cached_version != version:
+            results = {}
+            self._query_cache = (version, results)
+        try:
+            res = results[item]
+        except KeyError:
+            res = results[item] = self._query(item)
+        return res.copy() if hasattr(res, "copy") else res
+
+    def _data_version(self):
+        """
+        Return a value that changes whenever the results of queries may
+        change.
+        """
+        traj = self.trajectory
+        params = [getattr(self, attr, None) for attr in self.QUERY_PARAMETERS]
+        params = [p.tobytes() if isinstance(p, np.ndarray) else p for p in params]
+        return traj, traj.version, *params
+
+    def _query(self, item):
+        if ":" in item:
+            col, *methods = item.split(":")
+            fn, *fns = [getattr(self, f"get_{m}") for m in methods]
+            res = fn(col)
+            for fn in fns:
+                res = fn(res)
+            return res
+        else:
+            try:
+                method = getattr(self, f"get_data_{item}")
+            except AttributeError:
+                raise KeyError(item)
+            else:
+                return method(self._query_data())
+
     def get_dates(self, df):
         """
         Getitem transformer that convert integer indexes to dates.
@@ -159,11 +396,34 @@ class Model(metaclass=ModelMeta):
             times: Sequence = self.time_to_dates(np.arange(len(df)))
             return pd.DataFrame(df, index=times)
         else:
-            df = df.copy()
-            df.index = self.time_to_dates(idx)
+            df = df.copy(deep=False)
+            df.index = self._index_to_dates(idx)
             return df
 
-    def time_to_dates(self, times: Sequence, start_date=None, delta=None) -> np.ndarray:
+    def _index_to_dates(self, idx) -> pd.DatetimeIndex:
+        # Most queries are indexed by the times in the trajectory, whose dates
+        # are cached and extended as simulation grows.
+        times = self.trajectory.times
+        if len(idx) == len(times) and np.array_equal(idx, times):
+            return self._trajectory_dates()
+        return self.time_to_dates(idx)
+
+    def _trajectory_dates(self) -> pd.DatetimeIndex:
+        traj = self.trajectory
+        times = traj.times
+        key = (traj, getattr(self, "start_date", TODAY), getattr(self, "time_delta", DAY))
+        cached_key, dates = self._dates_cache
+        n = 0 if cached_key != key else len(dates)
+        if n > len(times) or n and dates[n - 1] != self.time_to_dates(times[n - 1 : n])[0]:
+            n = 0
+        if n == 0:
+            dates = self.time_to_dates(times)
+        elif n < len(times):
+            dates = dates.append(self.time_to_dates(times[n:]))
+        self._dates_cache = (key, dates)
+        return dates
+
+    def time_to_dates(self, times: Sequence, start_date=None, delta=None) -> pd.DatetimeIndex:
         """
         Convert an array of numerical times to dates.
 
@@ -185,20 +445,142 @@ class Model(metaclass=ModelMeta):
         if isinstance(delta, Real):
             delta = datetime.timedelta(days=float(delta))
 
-        data = [start_date + t * delta for t in times]
-        return np.array(data) if data else np.array([], dtype=datetime.date)
+        start = np.datetime64(pd.Timestamp(start_date), "ns")
+        step = pd.Timedelta(delta).value
+        offsets = np.rint(np.asarray(times, dtype=float) * step).astype("timedelta64[ns]")
+        return pd.DatetimeIndex(start + offsets)
 
     def copy(self, **kwargs):
         """
-        Create a copy of simulation.
+        Create an independent copy of simulation.
+
+        Arrays and containers are copied and the trajectory is shared until
+        one of the models modify it. Keyword arguments override attributes in
+        the new model.
         """
         cls = type(self)
         obj = cls.__new__(cls)
         for k, v in self.__dict__.items():
-            v = kwargs.get(k, v)
+            if k not in self._NOT_COPIED:
+                obj.__dict__[k] = _copy_attr(v)
+        for k, v in kwargs.items():
             setattr(obj, k, v)
         return obj
 
+    def fork(self, **changes) -> "Model":
+        """
+        Return a copy of the model with some parameters changed.
+
+        The new model continues the simulation from the current time and state
+        and shares the trajectory up to this point with the original one. This
+        is useful to simulate several scenarios that diverge at some point in
+        time.
+
+        Examples:
+            >>> base = SEICHAR(region="Brazil").run(29)  # doctest: +SKIP
+            >>> scenarios = [base.fork(R0=R0).run(120) for R0 in (1.2, 1.5, 2.0)]
+        """
+        for k in changes:
+            if not hasattr(self, k):
+                raise TypeError(f"invalid argument: {k}")
+        return self.copy(**changes)
+
+    def checkpoint(self) -> "Model":
+        """
+        Save current state of simulation.
+
+        Return a copy of the model that can be used to create forks or to
+        restore the simulation with :meth:`restore`.
+        """
+        return self.copy()
+
+    def restore(self, checkpoint: "Model"):
+        """
+        Restore simulation to the state saved in checkpoint.
+        """
+        if type(checkpoint) is not type(self):
+            raise TypeError("checkpoint must be an instance of the same class")
+        self.__dict__.clear()
+        self.__dict__.update(checkpoint.copy().__dict__)
+        return self
+
+    @property
+    def rhs(self):
+        """
+        Derivative function compiled from DYNAMICS. State has compartments in
+        the first axis.
+        """
+        return self._rhs or self.bind_dynamics()
+
+    def rhs_at(self, t):
+        """
+        Derivative function valid at time t.
+
+        Parameters given as :class:`Schedule` instances are bound as constants
+        of the current segment, and the function is recompiled when t leaves
+        it.
+        """
+        lo, hi = self._rhs_window
+        if self._rhs is None or not lo <= t < hi:
+            self.bind_dynamics(t)
+        return self._rhs
+
+    def bind_dynamics(self, t=None):
+        """
+        Compile the derivative function with the current parameter values.
+
+        This is called at the beginning of each run, so parameters should not
+        be modified during a simulation.
+        """
+        if self.DYNAMICS is None:
+            raise NotImplementedError("model does not declare its DYNAMICS")
+
+        t = self.time if t is None else t
+        overrides, window = self._schedule_overrides(t)
+        self._rhs = self.DYNAMICS.bind(self, **overrides)
+        self._rhs_window = window
+        self._split = None
+        return self._rhs
+
+    def split_at(self, t):
+        """
+        Linear and nonlinear parts of the derivative function valid at time
+        t, as a :class:`covid.models.compartments.LinearSplit`.
+        """
+        self.rhs_at(t)
+        if self._split is None:
+            overrides, _ = self._schedule_overrides(t)
+            self._split = self.DYNAMICS.split(self, **overrides)
+        return self._split
+
+    def _compartments_first(self, x):
+        """
+        Reshape state so compartments are in the first axis, as expected by
+        functions compiled from DYNAMICS.
+        """
+        return x
+
+    def _compartments_last(self, y):
+        """
+        Inverse of _compartments_first().
+        """
+        return y
+
+    def _schedule_overrides(self, t):
+        """
+        Return a mapping with the values of Schedule parameters at time t and
+        the (lo, hi) interval in which they are valid.
+        """
+        lo, hi = -np.inf, np.inf
+        overrides = {}
+        for name in self.DYNAMICS.parameters:
+            value = getattr(self, name)
+            if isinstance(value, Schedule):
+                start, end, a, b = value.segment(t)
+                lo, hi = max(lo, start), min(hi, end)
+                overrides[name] = value if b else float(a)
+        return overrides, (lo, hi)
+
     def diff(self, x, t):
         """
         Derivative function for state.
@@ -223,25 +605,170 @@ class Model(metaclass=ModelMeta):
         v = (k1 + 2 * k2 + 2 * k3 + k4) / 6
         if watcher is not None:
             watcher(x, v, t, dt)
+        if self.integrals is not None:
+            # RK4 step for the augmented variable q' = x
+            self.integrals += dt * x + (dt * dt / 6) * (k1 + k2 + k3)
         self.x = x = x + v * dt
         self.time = t + dt
         return x
 
+    def etdrk4_step(self, x, t, dt, watcher=None):
+        """
+        A single step of the ETDRK4 exponential integrator of Cox and
+        Matthews.
+
+        The linear part of the dynamics is integrated exactly with the matrix
+        exponential and the phi functions of A. Only the nonlinear remainder,
+        which comes from infections and from patients above healthcare
+        capacity, is approximated.
+        """
+        if self.validation == "full":
+            self.check_state(x, t)
+        split = self.split_at(t)
+        apply, fn = split.apply, split.nonlinear
+        E, phi1, phi2, phi3 = split.phi(dt)
+        E2, half_phi1, _, _ = split.phi(0.5 * dt)
+        f1 = phi1 - 3 * phi2 + 4 * phi3
+        f2 = phi2 - 2 * phi3
+        f3 = 4 * phi3 - phi2
+
+        y1 = self._compartments_first(x)
+        E2y = apply(E2, y1)
+        n1 = fn(y1, t)
+        y2 = E2y + 0.5 * dt * apply(half_phi1, n1)
+        n2 = fn(y2, t + 0.5 * dt)
+        y3 = E2y + 0.5 * dt * apply(half_phi1, n2)
+        n3 = fn(y3, t + 0.5 * dt)
+        y4 = apply(E2, y2) + 0.5 * dt * apply(half_phi1, 2 * n3 - n1)
+        n4 = fn(y4, t + dt)
+        y = apply(E, y1) + dt * (apply(f1, n1) + 2 * apply(f2, n2 + n3) + apply(f3, n4))
+
+        if self.integrals is not None:
+            # Simpson's rule with the average of the midpoint stages
+            q = (dt / 6) * (y1 + 2 * y2 + 2 * y3 + y)
+            self.integrals += self._compartments_last(q)
+        x_ = self._clip_state(self._compartments_last(y))
+        if watcher is not None:
+            watcher(x, (x_ - x) / dt, t, dt)
+        self.x = x_
+        self.time = t + dt
+        return x_
+
     def step(self, x, t=None, dt=1.0, watcher=None):
         """
         A single day step. It will perform `self.steps_per_day` RK4 iterations
         in the given time period.
 
+        If solver="dopri5", it integrates with an adaptive step that may span
+        several days and uses dense output to obtain the state at t + dt. If
+        solver="etdrk4", iterations use the exponential integrator in
+        etdrk4_step().
+
         If t and dt are omitted, uses current time and dt=1.0.
         """
-        dt /= self.steps_per_day
         t = self.time if t is None else t
+        if self.solver == "dopri5":
+            return self._adaptive_step(x, t, dt, watcher)
+        elif self.solver == "etdrk4":
+            substep = self.etdrk4_step
+        elif self.solver == "rk4":
+            substep = self.rk4_step
+        else:
+            raise ValueError(f"invalid solver: {self.solver!r}")
+
+        steps = self.steps_per_day
+        breakpoints = self.get_breakpoints()
+        if not any(t < b <= t + dt for b in breakpoints):
+            dt /= steps
+            for i in range(steps):
+                x = substep(x, t, dt, watcher=watcher)
+                t += dt
+            return x
+
+        # Sub-steps are split at breakpoints, so no step straddles a
+        # discontinuity. The last stage of a step that ends at a breakpoint
+        # is evaluated slightly before it, using the left limit of the
+        # derivative.
+        times = np.linspace(t, t + dt, steps + 1)
+        times = np.union1d(times, [b for b in breakpoints if t < b <= t + dt])
+        for t0, t1 in zip(times[:-1], times[1:]):
+            h = np.nextafter(t1, -np.inf) - t0 if t1 in breakpoints else t1 - t0
+            x = substep(x, t0, h, watcher=watcher)
+        self.time = t + dt
+        return x
 
-        for i in range(self.steps_per_day):
-            x = self.rk4_step(x, t, dt, watcher=watcher)
-            t += dt
+    def _adaptive_step(self, x, t, dt, watcher=None):
+        solver = self._solver
+
+        # We restart the solver if it did not produce the current state
+        if solver is None or solver.last != t or not np.array_equal(solver.last_y, x):
+            x = np.asarray(x, dtype=float)
+            atol = self.atol
+            if atol is None:
+                atol = 1e-12 * np.abs(x).sum()
+            self._solver = solver = DormandPrince(
+                self.diff,
+                t,
+                x,
+                rtol=self.rtol,
+                atol=atol,
+                max_step=self.max_step,
+                breakpoints=self.get_breakpoints(),
+                switching=self._switching_values,
+                clip=self._clip_state,
+            )
+
+        x = solver.advance(t + dt, watcher)
+        if self.integrals is not None:
+            integral = solver.integrate(t + dt)
+            self.integrals += integral - solver.last_integral
+            solver.last_integral = integral
+        solver.last, solver.last_y = t + dt, x
+        self.time = t + dt
         return x
 
+    def get_breakpoints(self):
+        """
+        Return a sequence of times in which the derivative function changes
+        discontinuously. Adaptive solvers never step over those times.
+        """
+        return ()
+
+    def _switching_values(self, x):
+        """
+        Return an array of values that change sign when the derivative
+        function has a kink or None if model has no such points.
+        """
+        return None
+
+    def _clip_state(self, x):
+        """
+        Project state back to the valid domain after each step.
+        """
+        return x
+
+    def peak_values(self, x):
+        """
+        Return an array of quantities whose running maximum is saved in the
+        peaks attribute or None if model does not track peaks.
+
+        It must accept a stack of states and return values in the last axis.
+        """
+        return None
+
+    def _reset_accumulators(self, x):
+        if not self.accumulate:
+            self.integrals = self.peaks = None
+            return
+        self.integrals = np.zeros(np.shape(x))
+        peaks = self.peak_values(x)
+        self.peaks = None if peaks is None else np.array(peaks, dtype=float)
+
+    def _update_peaks(self, xs):
+        if self.peaks is not None:
+            values = self.peak_values(xs)
+            self.peaks = np.maximum(self.peaks, values.reshape(-1, *self.peaks.shape).max(0))
+
     def trim_to_burst(self, times, xs):
         """
         Find the epidemic peak and trim datasets to be around this peak.
@@ -264,7 +791,7 @@ class Model(metaclass=ModelMeta):
 
         return times[i:j], xs[i:j]
 
-    def run(self, duration=None, convergence=None, watcher=None) -> "Model":
+    def run(self, duration=None, convergence=None, watcher=None, events=(), stop_at=()) -> "Model":
         """
         Run simulation until dynamics can be considered resolved.
 
@@ -277,44 +804,239 @@ class Model(metaclass=ModelMeta):
             watcher:
                 If given, is executed with (x_old, v, t, dt) for each step
                 and can track simulation variables during execution.
+            events:
+                Additional :class:`covid.models.events.Event` instances
+                tracked during simulation. Times of first occurrence are
+                saved in the event_times dictionary.
+            stop_at:
+                Names of events that should stop the simulation, e.g.,
+                "icu_overflow".
+        """
+        compiled = None
+        if self._get_backend() == "numba" and convergence is None and watcher is None:
+            compiled = self._compiled_loop()
+        if compiled is not None:
+            self._run_compiled(compiled, duration, events, stop_at)
+        else:
+            for _ in self._simulate(duration, convergence, watcher, events, stop_at):
+                pass
+        self._run_post_process()
+        return self
+
+    def _get_backend(self):
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"invalid backend: {self.backend!r}")
+        return self.backend
+
+    def _compiled_loop(self):
+        """
+        Return a (loop, args, shape) tuple used by the compiled backend or None
+        if the model cannot be integrated by it.
+
+        See :func:`covid.models.jit.rk4_loop` for the signature of loop. Shape
+        is the shape of state expected by the derivative kernel.
+        """
+        supported = (
+            self.solver == "rk4"
+            and self.DYNAMICS is not None
+            and self._get_validation() != "full"
+            and self.get_watcher_function() is None
+            and type(self).get_convergence_function is Model.get_convergence_function
+            and not self.get_breakpoints()
+        )
+        if not supported:
+            return None
+        overrides, _ = self._schedule_overrides(self.time)
+        try:
+            rhs, args = self.DYNAMICS.kernel(self, **overrides)
+        except TypeError:
+            return None
+        shape = (len(self.columns), -1) if self.sub_groups else (len(self.columns),)
+        return jit.rk4_loop(rhs, self.nonnegative), args, shape
+
+    def _run_compiled(self, compiled, duration=None, events=(), stop_at=()):
         """
-        x = np.asarray(self.state)
+        Same as run(), but integrate with the compiled loop in chunks of
+        several days. Events and recording policy are handled after each chunk.
+        """
+        loop, args, shape = compiled
+        x = x0 = np.asarray(self.state, dtype=float)
         t = self.time
         dt = self.dt
-        ts = [self.time]
-        xs = [x]
-        convergence = convergence or self.get_convergence_function()
-        watcher = watcher or self.get_watcher_function()
+        check = self._get_validation() != "off"
+        tracker = self._event_tracker(duration, events, stop_at, t, x)
+        self.event_times = tracker.times
         tf = float("inf") if duration is None else t + duration
         tmax = t + self.max_simulation_period
 
-        while True:
-            x_ = np.asarray(self.step(x, t, dt, watcher=watcher))
-            t += dt
-            xs.append(x_)
-            ts.append(t)
-            x = x_
+        traj = self.trajectory
+        if not len(traj):
+            traj.append(t, self._record_state(x))
+            self._reset_accumulators(x)
 
-            if duration is None and (convergence(x, x_, t, dt) or t > tf):
+        # Same number of steps as _simulate()
+        n_steps, s = 0, t
+        while True:
+            s += dt
+            n_steps += 1
+            if s > tmax or s > tf:
                 break
-            elif t > tmax or t > tf:
+
+        every = self.record_every
+        n = 0
+        while n < n_steps:
+            size = min(n_steps - n, self.compiled_chunk_size)
+            xs = np.empty((size, *np.reshape(x, shape).shape))
+            qs = np.empty_like(xs)
+            loop(np.reshape(x, shape), t, dt, self.steps_per_day, size, args, xs, qs)
+            xs = xs.reshape(size, -1)
+            qs = qs.reshape(size, -1)
+            ts = np.add.accumulate(np.array([t, *[dt] * size]))[1:]
+
+            stop, fired = tracker.update_many(t, x, ts, xs)
+            size = size if stop is None else stop + 1
+            steps = np.arange(n + 1, n + size + 1)
+            if every:
+                keep = steps % every == 0
+            else:
+                keep = fired[:size].copy()
+            keep[-1] |= stop is not None or n + size == n_steps
+
+            if check:
+                for t_, x_ in zip(ts[:size], xs[:size]):
+                    self.check_state(x_, t_, x0)
+            traj.extend(ts[:size][keep], self._record_state(xs[:size][keep]))
+            if self.integrals is not None:
+                self.integrals += qs[size - 1]
+            self._update_peaks(xs[:size])
+
+            n += size
+            x, t = xs[size - 1], ts[size - 1]
+            self.state, self.time = x, t
+            if stop is not None:
                 break
 
-        df = self._to_dataframe(np.array(ts), np.array(xs))
-        if len(self.data):
-            self.data = self.data.append(df.iloc[1:])
+    def _simulate(self, duration=None, convergence=None, watcher=None, events=(), stop_at=()):
+        """
+        Advance simulation one day at a time, storing each state in the
+        trajectory and yielding (t, x) pairs.
+
+        Arguments are the same as in run(). Model time and state are updated
+        before yielding, so the simulation can be interrupted at any point.
+        """
+        x = x0 = np.asarray(self.state)
+        t = self.time
+        dt = self.dt
+        check = self._get_validation() != "off"
+        if self.DYNAMICS is not None:
+            self.bind_dynamics()
+        convergence = convergence or self.get_convergence_function()
+        watcher = watcher or self.get_watcher_function()
+        tracker = self._event_tracker(duration, events, stop_at, t, x)
+        self.event_times = tracker.times
+        tf = float("inf") if duration is None else t + duration
+        tmax = t + self.max_simulation_period
+
+        traj = self.trajectory
+        if not len(traj):
+            traj.append(t, self._record_state(x))
+            self._reset_accumulators(x)
+        period = self.max_simulation_period if duration is None else duration
+        every = self.record_every
+        size = int(min(period, self.max_simulation_period) / dt)
+        traj.reserve(len(traj) + (size // every if every else 0) + 2)
+
+        n = 0
+        recorded = True
+        try:
+            while True:
+                x_ = np.asarray(self.step(x, t, dt, watcher=watcher))
+                stop = tracker.update(t, x, t + dt, x_)
+                t += dt
+                x = x_
+                self.state, self.time = x, t
+                self._update_peaks(x)
+                if check:
+                    self.check_state(x, t, x0)
+
+                n += 1
+                done = (
+                    stop
+                    or (duration is None and (convergence(x, x_, t, dt) or t > tf))
+                    or t > tmax
+                    or t > tf
+                )
+                recorded = done or (n % every == 0 if every else tracker.fired)
+                if recorded:
+                    traj.append(t, self._record_state(x))
+                yield t, x
+
+                if done:
+                    break
+        finally:
+            # Simulation interrupted by the caller
+            if not recorded:
+                traj.append(t, self._record_state(x))
+
+    def _event_tracker(self, duration, events, stop_at, t, x) -> EventTracker:
+        events = [*self.get_events(duration), *events]
+        names = {ev.name for ev in events}
+        for name in stop_at:
+            if name not in names:
+                raise ValueError(f"invalid event: {name!r}")
+        events = [ev._replace(terminal=True) if ev.name in stop_at else ev for ev in events]
+        return EventTracker(events, self.diff, t, x, times=self.event_times)
+
+    def _get_validation(self):
+        if self.validation not in self.VALIDATION_MODES:
+            raise ValueError(f"invalid validation mode: {self.validation!r}")
+        return self.validation
+
+    def check_state(self, x, t, x0=None):
+        """
+        Raise a ValueError if state x at time t violates some invariant of
+        the model.
+
+        Args:
+            x:
+                State to be checked.
+            t:
+                Simulation time. Used in error messages.
+            x0:
+                If given, it is a state in the beginning of the simulation and
+                is used to check conserved quantities.
+        """
+
+    def _store_run(self, times, xs, integrals=None):
+        """
+        Save results of a simulation that started at the current state.
+
+        If given, integrals are the integrals of state during simulation.
+        """
+        traj = self.trajectory
+        rows = np.arange(len(times))
+        if self.record_every:
+            rows = rows[(rows % self.record_every == 0) | (rows == rows[-1])]
+        else:
+            rows = rows[[0, -1]] if len(rows) > 1 else rows
+        if len(traj):
+            rows = rows[1:]
         else:
-            self.data = df
+            self._reset_accumulators(xs[0])
+        traj.extend(times[rows], self._record_state(xs[rows]))
+        if integrals is None:
+            self.integrals = None
+        elif self.integrals is not None:
+            self.integrals += integrals
+        self._update_peaks(xs)
+        self.state = xs[-1]
         self._run_post_process()
-        self.state = x
-        return self
 
     def run_interval(self, dt, watcher=None) -> "Model":
         """
         Run simulation by given interval.
         """
-        tf = self.time + dt
-        return self.run(lambda x, x_, t: t >= tf, watcher=watcher)
+        return self.run(dt, watcher=watcher)
 
     def get_convergence_function(self):
         """
@@ -325,6 +1047,16 @@ class Model(metaclass=ModelMeta):
         """
         return lambda *args: False
 
+    def get_events(self, duration=None) -> List[Event]:
+        """
+        Return the list of events tracked during simulation.
+
+        Terminal events stop the simulation. Models should include a terminal
+        event that signals that the dynamics is resolved when duration is
+        None.
+        """
+        return []
+
     def get_watcher_function(self):
         """
         Return a function that tracks simulation state and annotate model,
@@ -341,16 +1073,20 @@ class Model(metaclass=ModelMeta):
         """
 
     def _to_dataframe(self, times, ys) -> pd.DataFrame:
-        if self.sub_groups:
-            names = "column", "age"
-            mk_product = pd.MultiIndex.from_product
-            columns = mk_product((self.columns, self.sub_groups), names=names)
-        else:
-            columns = self.columns
+        columns, groups = self.recorded_columns, self.recorded_groups
+        if groups:
+            return StateArray(times, ys, columns, groups).to_frame()
         df = pd.DataFrame(ys, columns=columns)
         df.index = times
         return df
 
+    def _query_data(self):
+        """
+        Data passed to get_data_<name> methods when model is queried with
+        model[name].
+        """
+        return self.data
+
     def get_data(self, name, df=None):
         """
         Returns pre-processed from dataframe. Subclasses might implement methods
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 
 from .model import Model
+from .seichar import SEICHAR
+from .seichar_batch import run_batch
 
 
 class ModelEnsemble(Model):
@@ -12,20 +14,33 @@ class ModelEnsemble(Model):
 
     ensemble_size = 5
 
-    def __init__(self, cls, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.distributions = {k: v for k, v in kwargs.items() if hasattr(k, "rvs")}
+    def __init__(self, cls, *args, ensemble_size=None, **kwargs):
+        super().__init__()
+        if ensemble_size is not None:
+            self.ensemble_size = ensemble_size
+        self.distributions = {k: v for k, v in kwargs.items() if hasattr(v, "rvs")}
         self.factory_method = cls
-        self.params = pd.DataFrame({k: v.rvs(self.ensemble_size) for k, v in self.distributions})
+        self.params = pd.DataFrame(
+            {k: v.rvs(self.ensemble_size) for k, v in self.distributions.items()},
+            index=range(self.ensemble_size),
+        )
 
         kw = {k: v for k, v in kwargs.items() if k not in self.distributions}
-        self.models = [cls(*args, **kw, **row.to_dict()) for row in self.params]
+        self.models = [cls(*args, **kw, **row.to_dict()) for _, row in self.params.iterrows()]
 
     def run(self, *args, **kwargs) -> "Model":
+        # Scalar SEICHAR models are integrated in a single batch
+        if self._can_batch() and not args and set(kwargs) <= {"duration"}:
+            run_batch(self.models, **kwargs)
+            return self
+
         for model in self.models:
             model.run(*args, **kwargs)
         return self
 
+    def _can_batch(self):
+        return all(type(m) is SEICHAR for m in self.models)
+
     def mean(self, col):
         """Return a dataframe with the mean value computed over all samples
         for the given column."""
@@ -1,5 +1,3 @@
-import datetime
-
 import seaborn as sns
 from matplotlib import pyplot as plt
 
@@ -28,9 +26,8 @@ class Plot:
 
 class SEICHARPlot(Plot):
     def plot(self, *args, **kwargs):
-        dt = datetime.timedelta(days=1)
         m = self.model
-        idx = [m.start_date + t * dt for t in self.data.index]
+        idx = m.time_to_dates(self.data.index)
 
         def df(which):
             df = m[which]
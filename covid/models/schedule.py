@@ -0,0 +1,171 @@
+import bisect
+import operator
+from numbers import Real
+from typing import Mapping
+
+import numpy as np
+
+
+class Schedule:
+    """
+    Piecewise linear function of time, usually describing how a parameter
+    such as R0 changes with interventions.
+
+    The real line is divided into segments by a sorted list of breakpoints.
+    In each segment the function is a + b * t, and it may be discontinuous at
+    breakpoints. Segments include their left end and exclude the right one.
+
+    Schedules can be added and multiplied with numbers and other schedules,
+    which is a convenient way to compose interventions.
+
+    Args:
+        breakpoints:
+            Sorted sequence of n breakpoints.
+        intercepts, slopes:
+            Sequences with n + 1 coefficients, one for each segment. Slopes
+            are zero if not given.
+
+    Examples:
+        >>> R0 = 2.0 * Schedule.steps(1.0, {30: 0.5, 60: 0.75})
+        >>> R0(0), R0(45), R0(90)
+        (2.0, 1.0, 1.5)
+    """
+
+    __slots__ = ("breakpoints", "intercepts", "slopes", "_bounds", "_cache")
+
+    @classmethod
+    def constant(cls, value) -> "Schedule":
+        """
+        A schedule that is constant in time.
+        """
+        return cls((), [value])
+
+    @classmethod
+    def steps(cls, initial, changes: Mapping[float, float]) -> "Schedule":
+        """
+        Piecewise constant schedule that starts with the initial value and
+        changes to the given values at each time.
+
+        Examples:
+            >>> Schedule.steps(1.0, {7: 0.5})
+            Schedule.steps(1.0, {7.0: 0.5})
+        """
+        times = sorted(changes)
+        return cls(times, [initial, *(changes[t] for t in times)])
+
+    @classmethod
+    def ramp(cls, initial, final, start, end) -> "Schedule":
+        """
+        Schedule that changes linearly from initial to final value between
+        start and end times.
+        """
+        if end <= start:
+            return cls.steps(initial, {start: final})
+        slope = (final - initial) / (end - start)
+        return cls([start, end], [initial, initial - slope * start, final], [0, slope, 0])
+
+    def __init__(self, breakpoints, intercepts, slopes=None):
+        breakpoints = [float(t) for t in breakpoints]
+        if len(intercepts) != len(breakpoints) + 1:
+            raise ValueError("must have one more segment than breakpoints")
+        if any(a >= b for a, b in zip(breakpoints, breakpoints[1:])):
+            raise ValueError("breakpoints must be sorted and unique")
+        slopes = [0.0] * len(intercepts) if slopes is None else slopes
+        self.breakpoints = tuple(breakpoints)
+        self.intercepts = np.asarray(intercepts, dtype=float)
+        self.slopes = np.asarray(slopes, dtype=float)
+        self._bounds = [-np.inf, *breakpoints, np.inf]
+        self._cache = (np.inf, -np.inf, 0.0, 0.0)
+
+    def __repr__(self):
+        if not self.slopes.any():
+            initial, *values = self.intercepts
+            changes = dict(zip(self.breakpoints, values))
+            return f"Schedule.steps({initial}, {changes})"
+        args = (list(self.breakpoints), list(self.intercepts), list(self.slopes))
+        return "Schedule(%r, %r, %r)" % args
+
+    def __eq__(self, other):
+        if isinstance(other, Schedule):
+            return (
+                self.breakpoints == other.breakpoints
+                and np.array_equal(self.intercepts, other.intercepts)
+                and np.array_equal(self.slopes, other.slopes)
+            )
+        return NotImplemented
+
+    __hash__ = object.__hash__
+
+    def __call__(self, t):
+        if isinstance(t, Real):
+            lo, hi, a, b = self._cache
+            if not lo <= t < hi:
+                k = bisect.bisect_right(self.breakpoints, t)
+                lo, hi = self._bounds[k], self._bounds[k + 1]
+                a, b = float(self.intercepts[k]), float(self.slopes[k])
+                self._cache = (lo, hi, a, b)
+            return a + b * t if b else a
+
+        t = np.asarray(t, dtype=float)
+        k = np.searchsorted(self.breakpoints, t, side="right")
+        return self.intercepts[k] + self.slopes[k] * t
+
+    def segment(self, t):
+        """
+        Return (lo, hi, a, b) for the segment lo <= t < hi in which the
+        schedule is a + b * t.
+        """
+        k = bisect.bisect_right(self.breakpoints, t)
+        return self._bounds[k], self._bounds[k + 1], self.intercepts[k], self.slopes[k]
+
+    def average(self, start, end):
+        """
+        Mean value of schedule in the interval [start, end].
+        """
+        if end <= start:
+            return self(start)
+        inner = [t for t in self.breakpoints if start < t < end]
+        ts = np.array([start, *inner, end])
+        a, b = self.intercepts, self.slopes
+        k = np.searchsorted(self.breakpoints, ts[:-1], side="right")
+        area = a[k] * (ts[1:] - ts[:-1]) + b[k] * (ts[1:] ** 2 - ts[:-1] ** 2) / 2
+        return area.sum() / (end - start)
+
+    #
+    # Arithmetic
+    #
+    def _binary(self, other, op):
+        if isinstance(other, Real):
+            other = Schedule.constant(other)
+        elif not isinstance(other, Schedule):
+            return NotImplemented
+
+        breakpoints = sorted({*self.breakpoints, *other.breakpoints})
+        k1 = np.searchsorted(self.breakpoints, [-np.inf, *breakpoints], side="right")
+        k2 = np.searchsorted(other.breakpoints, [-np.inf, *breakpoints], side="right")
+        a1, b1 = self.intercepts[k1], self.slopes[k1]
+        a2, b2 = other.intercepts[k2], other.slopes[k2]
+
+        if op is operator.add:
+            return Schedule(breakpoints, a1 + a2, b1 + b2)
+        if np.any((b1 != 0) & (b2 != 0)):
+            raise ValueError("product of two linear segments is not piecewise linear")
+        return Schedule(breakpoints, a1 * a2, a1 * b2 + b1 * a2)
+
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __neg__(self):
+        return Schedule(self.breakpoints, -self.intercepts, -self.slopes)
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    __radd__ = __add__
+    __rmul__ = __mul__
@@ -1,9 +1,13 @@
 import datetime
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
 
+from .compartments import CompartmentModel, expm
+from .events import Event
 from .model import Model
+from .schedule import Schedule
 from .plot import SEICHARPlot
 from ..region import region as as_region
 from ..types import delegate, cached, alias, computed
@@ -12,6 +16,22 @@ from ..utils import fmt, pc, pm
 identity = lambda x: x
 
 
+class FinalSize(NamedTuple):
+    """
+    Outcome of an epidemic, as estimated by :meth:`SEICHAR.final_size`.
+
+    Values are floats or, for age-structured models, arrays with one entry per
+    sub-group.
+    """
+
+    susceptible: np.ndarray
+    infected: np.ndarray
+    attack_rate: np.ndarray
+    fatalities: np.ndarray
+    peak_hospitalized: np.ndarray
+    peak_critical: np.ndarray
+
+
 # noinspection PyUnusedLocal
 class SEICHAR(Model):
     """
@@ -55,7 +75,22 @@ class SEICHAR(Model):
     ASYMPTOMATIC_ALL = cached(lambda x: x._idx_all(x.ASYMPTOMATIC))
     RECOVERED_ALL = cached(lambda x: x._idx_all(x.RECOVERED))
     FATALITIES_ALL = cached(lambda x: x._idx_all(x.FATALITIES))
+    ACTIVE_ALL = cached(
+        lambda x: np.concatenate(
+            [
+                x.EXPOSED_ALL,
+                x.INFECTIOUS_ALL,
+                x.CRITICAL_ALL,
+                x.HOSPITALIZED_ALL,
+                x.ASYMPTOMATIC_ALL,
+            ]
+        )
+    )
     _idx_all = lambda self, i: [i]
+    QUERY_PARAMETERS = (*Model.QUERY_PARAMETERS, "hospital_capacity", "icu_capacity")
+
+    # States are clipped to non-negative values after each step (see _clip_state)
+    nonnegative = True
 
     OPTIONS = {
         "seed:int": "Initial infectious population",
@@ -76,6 +111,45 @@ class SEICHAR(Model):
     region = None
     ref_year = 2020
 
+    # Dynamics: transitions between compartments with their rates
+    DYNAMICS = CompartmentModel(
+        ["s", "e", "i", "c", "h", "a", "r", "f"],
+        [
+            ("s", "e", "infections"),
+            ("s", "i", "import_rate"),
+            (None, "a", "asympt_import_rate"),
+            ("e", "i", "prob_symptomatic * sigma * e"),
+            ("e", "a", "(1 - prob_symptomatic) * sigma * e"),
+            ("i", "h", "prob_hospitalization * gamma_i * i"),
+            ("i", "r", "(1 - prob_hospitalization) * gamma_i * i"),
+            ("h", "c", "prob_icu * gamma_h * h"),
+            ("h", "r", "(1 - prob_icu) * gamma_h * hminus"),
+            ("h", "r", "(1 - prob_no_hospitalization_fatality) * gamma_hr * hplus"),
+            ("h", "f", "prob_no_hospitalization_fatality * gamma_hr * hplus"),
+            ("c", "h", "(1 - prob_fatality) * gamma_c * cminus"),
+            ("c", "f", "prob_fatality * gamma_c * cminus"),
+            ("c", "r", "(1 - prob_no_icu_fatality) * gamma_cr * cplus"),
+            ("c", "f", "prob_no_icu_fatality * gamma_cr * cplus"),
+            ("a", "r", "gamma_a * a"),
+            # Vital dynamics
+            (None, "s", "kappa * n", "vital_dynamics"),
+            *((x, None, f"_mu * {x}", "vital_dynamics") for x in "seichar"),
+        ],
+        {
+            # Patients above capacity do not receive proper treatment
+            "hplus": "np.maximum(0, h - hospital_capacity)",
+            "hminus": "h - hplus",
+            "cplus": "np.maximum(0, c - icu_capacity)",
+            "cminus": "c - cplus",
+            "n": "s + e + i + c + h + a + r",
+            "beta": "R0 * (gamma_i + _mu) * (sigma + prob_symptomatic * _mu) / sigma"
+            " / (prob_symptomatic + (1 - prob_symptomatic) * rho)",
+            # Written as the growth at the disease free equilibrium minus
+            # the effect of the depletion of susceptibles
+            "infections": "beta * (i + rho * a) - beta * (i + rho * a) * (n - s) / n",
+        },
+    )
+
     # Epidemiological parameters
     R0 = 2.74
     rho = 0.55
@@ -87,7 +161,7 @@ class SEICHAR(Model):
     def K(self):
         g = self.gamma_i
         s = self.sigma
-        R0 = self.R0
+        R0 = self.R0(self.time) if callable(self.R0) else self.R0
         return 0.5 * (s + g) * (np.sqrt(1 + 4 * (R0 - 1) * s * g / (s + g) ** 2) - 1)
 
     @computed
@@ -99,9 +173,12 @@ class SEICHAR(Model):
 
     @property
     def R0_average(self):
-        if callable(self.R0):
+        if isinstance(self.R0, Schedule):
+            return float(np.mean(self.R0(self.trajectory.times)))
+        elif callable(self.R0):
             fn = self.R0
-            return sum(fn(t) for t in self.data.index) / len(self.data)
+            times = self.trajectory.times
+            return sum(fn(t) for t in times) / len(times)
         else:
             return self.R0
 
@@ -142,8 +219,10 @@ class SEICHAR(Model):
     icu_total_capacity = cached(lambda x: x.icu_beds_pm * x.population / 1000)
     hospital_total_capacity = cached(lambda x: x.hospital_beds_pm * x.population / 1000)
 
-    # Initial state
+    # Initial state. Models with the default unit population start with a
+    # fraction unit_seed of infectious unless a fractional seed is given.
     seed = 1
+    unit_seed = 0.01
     fatalities = 0.0
     hospitalization_days = 0.0
     icu_days = 0.0
@@ -166,10 +245,7 @@ class SEICHAR(Model):
 
     @property
     def population(self):
-        if self.data.shape[0]:
-            return self.data.iloc[-1].sum() - self.fatalities
-        else:
-            return sum(self.state) - self.fatalities
+        return np.sum(self.state) - self.fatalities
 
     @classmethod
     def _main(cls, *args, hospitalization_bias=1.0, **kwargs):
@@ -190,7 +266,6 @@ class SEICHAR(Model):
         if x0 is not None:
             kwargs["state"] = x0
         super().__init__(*args, **kwargs)
-        self._watching = {}
 
         def set_(attr, value):
             x = kwargs.get(attr, value)
@@ -225,7 +300,7 @@ class SEICHAR(Model):
         # Fix population and seed
         if self.initial_population is None:
             self.initial_population = 1.0
-            self.seed = 0.01 if self.seed >= 1.0 else self.seed
+            self.seed = self.unit_seed if self.seed >= 1.0 else self.seed
 
         # Initial state
         if "state" not in kwargs:
@@ -258,34 +333,72 @@ class SEICHAR(Model):
 
     def rk4_step(self, x, t, dt, watcher=None):
         x_ = super().rk4_step(x, t, dt, watcher)
-        return np.where(x_ > 0, x_, 0.0)
+        return self._clip_state(x_, out=x_)
+
+    def _clip_state(self, x, out=None):
+        return np.maximum(x, 0.0, out=out)
+
+    @property
+    def is_closed(self):
+        """
+        True if total population, including fatalities, is conserved.
+        """
+        return not self.vital_dynamics and not np.any(self.asympt_import_rate)
+
+    def check_state(self, x, t, x0=None):
+        x = np.asarray(x)
+        valid = x >= 0
+        if not valid.all():
+            msg = f"negative or NaN populations at t={t}: {self._describe_state(x, ~valid)}"
+            raise ValueError(msg)
+
+        if x0 is not None and self.is_closed:
+            n0 = np.sum(x0, -1)
+            n = np.sum(x, -1)
+            if np.any(np.abs(n - n0) > self.population_rtol * n0):
+                raise ValueError(f"population is not conserved at t={t}: {n0} -> {n}")
+
+    def _describe_state(self, x, mask):
+        n_groups = len(self.sub_groups or [None])
+        items = []
+        for idx in zip(*np.nonzero(mask)):
+            *row, k = idx
+            name = self.columns[k // n_groups]
+            if self.sub_groups:
+                name = f"{name}:{self.sub_groups[k % n_groups]}"
+            if row:
+                name = f"{name}{row}"
+            items.append(f"{name}={x[idx]}")
+        return ", ".join(items)
+
+    def _switching_values(self, x):
+        # Dynamics changes when hospitals and ICUs reach maximum capacity
+        h = np.sum(x[self.HOSPITALIZED_ALL]) - self.hospital_capacity
+        c = np.sum(x[self.CRITICAL_ALL]) - self.icu_capacity
+        return np.array([h, c])
+
+    def peak_values(self, x):
+        # Total hospital and ICU demand
+        h = x[..., self.HOSPITALIZED_ALL].sum(-1)
+        c = x[..., self.CRITICAL_ALL].sum(-1)
+        return np.stack([h, c], -1)
+
+    def get_breakpoints(self):
+        # Time dependent R0 functions may declare the times in which they
+        # change discontinuously
+        return getattr(self.R0, "breakpoints", ())
 
     def diff(self, x, t):
-        s, e, i, c, h, a, r, f = x
-        hplus = max(0, h - self.hospital_capacity)
-        hminus = min(h, self.hospital_capacity)
-        cplus = max(0, c - self.icu_capacity)
-        cminus = min(c, self.icu_capacity)
-
-        assert hplus >= 0 and hminus >= 0 and cplus >= 0 and cminus >= 0, locals()
-        assert np.all(x >= 0), locals()
-
-        diff = self.diff_seichar(s, e, i, cminus, cplus, hminus, hplus, a, r, f, t)
-        return np.array(diff)
-
-    def diff_seichar(self, s, e, i, cminus, cplus, hminus, hplus, a, r, f, t):
-        n = s + e + i + cminus + cplus + hminus + hplus + a + r
-        lambd = self.lambd(n, i, a, t)
-        return [
-            self.diff_s(s, n, lambd, t),
-            self.diff_e(s, e, lambd, t),
-            self.diff_i(e, i, t),
-            self.diff_c(hminus + hplus, cminus, cplus, t),
-            self.diff_h(i, hminus, hplus, cminus, t),
-            self.diff_a(e, a, t),
-            self.diff_r(a, i, hminus, hplus, cminus, cplus, r, t),
-            self.diff_f(hplus, cminus, cplus, t),
-        ]
+        # Compartments are in the last axis, so x can also be a (n, 8) batch of states.
+        if self.validation == "full":
+            self.check_state(x, t)
+        return self.rhs_at(t)(x.T, t).T
+
+    def _compartments_first(self, x):
+        return x.T
+
+    def _compartments_last(self, y):
+        return y.T
 
     def beta(self, t):
         p_s = self.prob_symptomatic
@@ -298,118 +411,34 @@ class SEICHAR(Model):
             / (p_s + (1 - p_s) * self.rho)
         )
 
-    def lambd(self, n, i, a, t):
-        return self.beta(t) * (i + self.rho * a) / n
-
-    def diff_s(self, s, n, lambd, t):
-        infections = self._infections(lambd, s)
-
-        if self.vital_dynamics:
-            # FIXME: prevent S from being negative due to import rate
-            return self.kappa * n - infections - self.mu * s - self.import_rate
-        else:
-            return -infections - self.import_rate
-
-    def _infections(self, lambd, s):
-        return lambd * s
-
-    def diff_e(self, s, e, lambd, t):
-        infections = self._infections(lambd, s)
-        return infections - self.sigma * e - self._mu * e
-
-    def diff_i(self, e, i, t):
-        p_s = self.prob_symptomatic
-        return p_s * self.sigma * e - self.gamma_i * i - self._mu * i + self.import_rate
-
-    def diff_c(self, h, cminus, cplus, t):
-        c = cminus + cplus
-        return (
-            self.prob_icu * self.gamma_h * h
-            - self.gamma_c * cminus
-            - self.gamma_cr * cplus
-            - self._mu * c
-        )
-
-    def diff_h(self, i, hminus, hplus, cminus, t):
-        h = hminus + hplus
-        return (
-            self.prob_hospitalization * self.gamma_i * i
-            - self.gamma_h * hminus
-            - self.prob_icu * self.gamma_h * hplus
-            - self.gamma_hr * hplus
-            + (1 - self.prob_fatality) * self.gamma_c * cminus
-            - self._mu * h
-        )
-
-    def diff_a(self, e, a, t):
-        p_s = self.prob_symptomatic
-        return (
-            (1 - p_s) * self.sigma * e - self.gamma_a * a - self._mu * a + self.asympt_import_rate
-        )
-
-    def diff_r(self, a, i, hminus, hplus, cminus, cplus, r, t):
-        return (
-            self.gamma_a * a
-            + (1 - self.prob_hospitalization) * self.gamma_i * i
-            + (1 - self.prob_icu) * self.gamma_h * hminus
-            + (1 - self.prob_no_hospitalization_fatality) * self.gamma_hr * hplus
-            + (1 - self.prob_no_icu_fatality) * self.gamma_cr * cplus
-            - self._mu * r
-        )
-
-    def diff_f(self, hplus, cminus, cplus, t):
-        return (
-            self.prob_fatality * self.gamma_c * cminus
-            + self.prob_no_hospitalization_fatality * self.gamma_hr * hplus
-            + self.prob_no_icu_fatality * self.gamma_cr * cplus
-        )
-
-    def get_convergence_function(self):
-        N = None
-        x0 = None
-        start = True
-
-        if self.vital_dynamics and (self.kappa != 0 or self.mu != 0):
-            raise NotImplementedError
-
-        def fn(x, x_, t, dt):
-            nonlocal N, x0, start
-            N = x.sum() if N is None else N
-
-            if start:
-                x0 = x if x0 is None else x0
-                if np.abs(x_ - x0).mean() >= N * 1e-3:
-                    start = False
-                return False
-            else:
-                return (np.abs(x_ - x) < N * 1e-6).all()
-
-        return fn
-
-    def get_watcher_function(self):
-        t_h = float("inf")
-        t_c = float("inf")
-
-        self._watching = w = {"hospital_overflow_t": t_h, "icu_overflow_t": t_c}
-
-        def watch(x, v, t, dt):
-            nonlocal t_h, t_c
-
-            h = np.sum(x[self.HOSPITALIZED_ALL])
-            c = np.sum(x[self.CRITICAL_ALL])
-            if h >= self.hospital_capacity:
-                t_h = min(t_h, t)
-            if c >= self.icu_capacity:
-                t_c = min(t_c, t)
-
-            w["hospital_overflow_t"] = t_h
-            w["icu_overflow_t"] = t_c
-            self._watch_simulation(w, x, v, t, dt)
-
-        return watch
+    def get_events(self, duration=None):
+        # Event functions work both with single states and with (n, 8)
+        # batches of states.
+        H, C, active = self.HOSPITALIZED_ALL, self.CRITICAL_ALL, self.ACTIVE_ALL
+        events = [
+            Event(
+                "hospital_overflow",
+                lambda x: x[..., H].sum(-1) - self.hospital_capacity,
+                direction=1,
+                initial=True,
+            ),
+            Event(
+                "icu_overflow",
+                lambda x: x[..., C].sum(-1) - self.icu_capacity,
+                direction=1,
+                initial=True,
+            ),
+        ]
 
-    def _watch_simulation(self, w, x, v, t, dt):
-        pass
+        # Epidemic is resolved when the number of active cases falls below a
+        # small fraction of the population or, if it never grows, when it
+        # falls below half of its initial value.
+        if duration is None:
+            x = np.asarray(self.state)
+            tol = np.minimum(1e-6 * x.sum(-1), 0.5 * x[..., active].sum(-1))
+            fn = lambda x: x[..., active].sum(-1) - tol
+            events.append(Event("resolved", fn, direction=-1, terminal=True))
+        return events
 
     def _run_post_process(self):
         def advance(t):
@@ -417,39 +446,159 @@ class SEICHAR(Model):
                 return None
             return self.start_date + datetime.timedelta(int(t))
 
-        # Compartments
-        r = self["recovered:total"]
-        f = self["fatalities:total"]
-        s = self["susceptible:total"]
-        e = self["exposed"]
-        i = self["infectious"]
-        c = self["critical"]
-        h = self["hospitalized"]
-        a = self["asymptomatic"]
         total = self.get_total
-        integral = self.integral
-        w = self._watching
+        integral = self.integral_of
+        w = self.event_times
 
         # Healthcare statistics
-        self.peak_hospitalization_demand = total(h).max()
-        self.peak_icu_demand = total(c).max()
-        self.hospitalization_days = total(integral(h))
-        self.icu_days = total(integral(c))
-        self.hospital_overflow_time = w["hospital_overflow_t"]
-        self.icu_overflow_time = w["icu_overflow_t"]
+        if self.peaks is not None:
+            self.peak_hospitalization_demand, self.peak_icu_demand = self.peaks
+        else:
+            self.peak_hospitalization_demand = self._recorded_peak("hospitalized")
+            self.peak_icu_demand = self._recorded_peak("critical")
+        self.hospitalization_days = total(integral("hospitalized"))
+        self.icu_days = total(integral("critical"))
+        self.hospital_overflow_time = float(w.get("hospital_overflow", np.inf))
+        self.icu_overflow_time = float(w.get("icu_overflow", np.inf))
         self.hospital_overflow_date = advance(self.hospital_overflow_time)
         self.icu_overflow_date = advance(self.icu_overflow_time)
 
         # Epidemiology
-        self.susceptible = s.iloc[-1]
-        self.recovered = r.iloc[-1]
-        self.fatalities = f.iloc[-1]
-
-        self.total_exposed = total(integral(e) * self.sigma)
-        self.total_infectious = total(integral(i) * self.gamma_i)
-        self.total_asymptomatic = total(integral(a) * self.gamma_a)
-        self.total_hospitalized = total(integral(h) * self.gamma_h)
-        self.total_critical = total(integral(c) * self.gamma_c)
+        self.susceptible = self.final_state("susceptible").sum()
+        self.recovered = self.final_state("recovered").sum()
+        self.fatalities = self.final_state("fatalities").sum()
+
+        self.total_exposed = total(integral("exposed") * self.sigma)
+        self.total_infectious = total(integral("infectious") * self.gamma_i)
+        self.total_asymptomatic = total(integral("asymptomatic") * self.gamma_a)
+        self.total_hospitalized = total(integral("hospitalized") * self.gamma_h)
+        self.total_critical = total(integral("critical") * self.gamma_c)
+
+    def final_state(self, col) -> np.ndarray:
+        """
+        Value of column in the current state, with one entry per group.
+        """
+        n_groups = len(self.sub_groups or [None])
+        i = self.columns.index(col) * n_groups
+        return np.asarray(self.state)[i : i + n_groups]
+
+    def final_size(self) -> FinalSize:
+        """
+        Estimate the outcome of the epidemic from the current state, without
+        running the simulation.
+
+        The final number of susceptibles solves the final-size relation
+
+            s = expm(-M * (beta * load / n)) @ s0
+            load = kappa * (e0 + s0 - s) + i0 / gamma_i + rho * a0 / gamma_a
+
+        in which load is the integral of i + rho * a, kappa is the expected
+        infectiousness of a new case and M is the relative contact matrix (1
+        for models without age structure). M * v scales the columns of M, as in
+        the infections term of the dynamics. The relation is exact without age
+        structure. With age structure it neglects the ordering of infections
+        in different groups and agrees with simulations within a few percent.
+        Fatalities follow from the clinical probabilities and the peaks of
+        hospital and ICU occupancy are approximated by treating the epidemic
+        as a pulse with the amplitude of the peak of infectious and the same
+        area.
+
+        Parameters are taken at the current time and healthcare capacity is
+        assumed not to be exceeded. Vital dynamics and imported cases are
+        ignored.
+        """
+        x = np.asarray(self._compartments_first(self.state), dtype=float)
+        x = x.reshape(8, -1)
+        s0, e0, i0, c0, h0, a0, r0, f0 = x
+        n = x[:7].sum(0)
+        size = len(n)
+        M = np.broadcast_to(getattr(self, "relative_contact_matrix", 1.0), (size, size))
+
+        # Final size relation, solved by Newton's method with a numerical
+        # jacobian starting from an empty population
+        p_s, rho = self.prob_symptomatic, self.rho
+        beta = self.beta(self.time)
+        kappa = p_s / self.gamma_i + (1 - p_s) * rho / self.gamma_a
+        load0 = kappa * (e0 + s0) + i0 / self.gamma_i + rho * a0 / self.gamma_a
+
+        def final(s):
+            load = load0 - kappa * s
+            return np.clip(expm(-M * (beta * load / n)) @ s0, 0, s0)
+
+        s = np.zeros(size)
+        h = 1e-7 * n
+        for _ in range(50):
+            fs = final(s)
+            jacobian = np.eye(size)
+            for j in range(size):
+                ds = np.zeros(size)
+                ds[j] = h[j]
+                jacobian[:, j] -= (final(s + ds) - fs) / h[j]
+            delta = np.linalg.solve(jacobian, s - fs)
+            s = np.clip(s - delta, 0, s0)
+            if np.abs(delta).max() <= 1e-12 * n.max():
+                break
+        infected = e0 + s0 - s
+
+        # Fatalities. Hospitalized patients may go back and forth to ICU.
+        p_h, p_icu, p_f = self.prob_hospitalization, self.prob_icu, self.prob_fatality
+        symptomatic = p_s * infected + i0
+        death_h = p_icu * p_f / (1 - p_icu * (1 - p_f))
+        death_c = p_f + (1 - p_f) * death_h
+        fatalities = f0 + (p_h * symptomatic + h0) * death_h + c0 * death_c
+
+        # Peak of exposed + infectious + asymptomatic happens at s = n / R
+        s_tot, n_tot, w_tot = s0.sum(), n.sum(), (e0 + i0 + a0).sum()
+        R = float(np.max(beta * kappa))
+        growth = s_tot * R / n_tot
+        w_peak = w_tot
+        if growth > 1:
+            w_peak += s_tot - n_tot / R * (1 + np.log(growth))
+        residence = [1 / self.sigma, p_s / self.gamma_i, (1 - p_s) / self.gamma_a]
+        i_peak = w_peak * residence[1] / sum(residence)
+        i_peak = np.maximum(i0, i_peak * infected / infected.sum())
+
+        # Occupancy responds to a pulse of duration T as a first order filter
+        def pulse(height, T, rate):
+            return height * (1 - np.exp(-rate * T)) / rate
+
+        hospitalized = p_h * symptomatic
+        T = hospitalized.sum() / (p_h * self.gamma_i * i_peak).sum()
+        h_peak = np.maximum(h0, pulse(p_h * self.gamma_i * i_peak, T, self.gamma_h))
+        T = hospitalized.sum() / self.gamma_h / h_peak.sum()
+        c_peak = np.maximum(c0, pulse(p_icu * self.gamma_h * h_peak, T, self.gamma_c))
+
+        result = FinalSize(s, infected, infected / n, fatalities, h_peak, c_peak)
+        if not self.sub_groups:
+            result = FinalSize(*(float(np.sum(v)) for v in result))
+        return result
+
+    def integral_of(self, col):
+        """
+        Time integral of column since the beginning of simulation.
+
+        Uses the integrals accumulated by the solver, if available, or
+        integrates the trajectory with the rectangle rule otherwise. Models
+        with sub-groups return one value per group. The result is NaN if
+        integrals were not accumulated and the column was not recorded.
+        """
+        if self.integrals is None:
+            if col not in self.recorded_columns:
+                if self.sub_groups:
+                    return pd.Series(np.nan, index=self.sub_groups)
+                return np.nan
+            return self.integral(self[col])
+        n_groups = len(self.sub_groups or [None])
+        i = self.columns.index(col) * n_groups
+        values = self.integrals[i : i + n_groups]
+        if self.sub_groups:
+            return pd.Series(values, index=self.sub_groups)
+        return values[0]
+
+    def _recorded_peak(self, col):
+        if col not in self.recorded_columns:
+            return np.nan
+        return self.get_total(col).max()
 
     def mortality_rate(self):
         """Return the infection fatality ratio so far"""
@@ -490,11 +639,11 @@ class SEICHAR(Model):
 
         return f"""Demography
 - Total population   : {fmt(N0)}
-- Recovered          : {fmt(int(self.recovered))} ({pc(self.recovered / N)})
-- Fatalities (total) : {fmt(int(self.fatalities))} ({pc(self.fatalities / N)})
-- Infectious (max)   : {fmt(int(self.total_infectious))} ({pc(self.total_infectious / N)})
-- Asymptomatic (max) : {fmt(int(self.total_asymptomatic))} ({pc(p_asympt)})
-- Exposed (max)      : {fmt(int(self.total_exposed))} ({pc(self.total_exposed / N)})
+- Recovered          : {fmt(np.floor(self.recovered))} ({pc(self.recovered / N)})
+- Fatalities (total) : {fmt(np.floor(self.fatalities))} ({pc(self.fatalities / N)})
+- Infectious (max)   : {fmt(np.floor(self.total_infectious))} ({pc(self.total_infectious / N)})
+- Asymptomatic (max) : {fmt(np.floor(self.total_asymptomatic))} ({pc(p_asympt)})
+- Exposed (max)      : {fmt(np.floor(self.total_exposed))} ({pc(self.total_exposed / N)})
 """
 
     def summary_epidemiology(self):
@@ -525,12 +674,12 @@ class SEICHAR(Model):
         )
 
         return f"""Healthcare parameters
-- Hosp. days         : {fmt(int(self.hospitalization_days))}
-- ICU days           : {fmt(int(self.icu_days))}
-- Peak hosp. demand  : {fmt(int(h_demand))} ({pm(h_demand / N)})
+- Hosp. days         : {fmt(np.floor(self.hospitalization_days))}
+- ICU days           : {fmt(np.floor(self.icu_days))}
+- Peak hosp. demand  : {fmt(np.floor(h_demand))} ({pm(h_demand / N)})
     x surge capacity : {fmt(self.peak_hospitalization_demand / self.hospital_capacity)}
     x total          : {fmt(h_overload)}
-- Peak ICU demand    : {fmt(int(c_demand))} ({pm(c_demand / N)})
+- Peak ICU demand    : {fmt(np.floor(c_demand))} ({pm(c_demand / N)})
     x surge capacity : {fmt(self.peak_icu_demand / self.icu_capacity)}
     x total          : {fmt(icu_overload)}
 - Hosp. overflow     : {fmt(t_hf)} days ({dt_hf})
@@ -538,8 +687,11 @@ class SEICHAR(Model):
 """
 
     def summary_simulation(self):
-        N = self.data.iloc[0].sum()
-        fluctuation = self.data.values.sum(1).std()
+        if self.record_columns is not None:
+            return "Invariants\n    - Not available: only some compartments were recorded\n"
+        totals = self.trajectory.values.sum(1)
+        N = totals[0]
+        fluctuation = totals.std()
         return f"""Invariants
     - Sum of compartments: {fmt(N)} ({pc(fluctuation / N)})
     """
@@ -580,7 +732,7 @@ class SEICHAR(Model):
     def get_data_icu(self, df):
         xs = self.get_data_critical(df)
         max_icu = self.icu_capacity
-        data = np.data.where(xs > max_icu, max_icu, xs)
+        data = np.where(xs > max_icu, max_icu, xs)
         return pd.Series(data, index=xs.index)
 
     def get_data_critical_demand(self, df):
@@ -0,0 +1,205 @@
+from typing import Sequence
+
+import numpy as np
+
+from .seichar import SEICHAR
+from ..utils import same_value
+
+
+class SEICHARBatch(SEICHAR):
+    """
+    Integrate many SEICHAR scenarios simultaneously.
+
+    The state is a (n_scenarios, 8) array and all epidemiological, clinical
+    and healthcare parameters are stored as vectors with one entry per
+    scenario. A single RK4 step advances the whole batch, which removes the
+    interpreter overhead of running each model separately.
+
+    Models with sub-groups, like SEICHARDemographic, are batched in the same
+    way: the state is a (n_scenarios, 8 * n_groups) array and parameters
+    given per sub-group are stored as (n_groups, n_scenarios) arrays.
+
+    Results are copied back to the original models after each run and are
+    identical to those of calling model.run() on each scenario.
+
+    Args:
+        models:
+            Sequence of SEICHAR instances of the same class. All models must
+            share the same time, time step, solver, vital dynamics
+            configuration and sub-groups. R0 may be a function of time only if
+            all models share the same function. Other parameters of DYNAMICS,
+            like the contact matrix, must also be the same.
+    """
+
+    PARAMETERS = (
+        "R0",
+        "rho",
+        "prob_symptomatic",
+        "import_rate",
+        "asympt_import_rate",
+        "sigma",
+        "gamma_i",
+        "gamma_a",
+        "gamma_h",
+        "gamma_c",
+        "gamma_hr",
+        "gamma_cr",
+        "prob_hospitalization",
+        "prob_icu",
+        "prob_fatality",
+        "prob_no_hospitalization_fatality",
+        "prob_no_icu_fatality",
+        "kappa",
+        "mu",
+        "_mu",
+        "hospital_capacity",
+        "icu_capacity",
+    )
+    SHARED = (
+        "time",
+        "dt",
+        "steps_per_day",
+        "max_simulation_period",
+        "vital_dynamics",
+        "solver",
+        "validation",
+        "sub_groups",
+    )
+
+    def __init__(self, models: Sequence[SEICHAR]):
+        self.models = models = list(models)
+        if not models:
+            raise ValueError("cannot create an empty batch")
+        cls = type(models[0])
+        for model in models:
+            if not isinstance(model, SEICHAR) or type(model) is not cls:
+                name = type(model).__name__
+                raise TypeError(f"can only batch SEICHAR models of a single class, got {name}")
+        self.DYNAMICS = cls.DYNAMICS
+
+        for attr in self.SHARED:
+            values = {getattr(m, attr) for m in models}
+            if len(values) != 1:
+                raise ValueError(f"models in batch must have the same {attr}")
+            setattr(self, attr, values.pop())
+        if self.solver not in ("rk4", "etdrk4"):
+            raise ValueError("batches can only be integrated with fixed step solvers")
+
+        for attr in self.PARAMETERS:
+            values = [getattr(m, attr) for m in models]
+            if any(map(callable, values)):
+                if any(v is not values[0] for v in values):
+                    raise ValueError(f"models in batch must share the same {attr} function")
+                setattr(self, attr, values[0])
+            else:
+                # Scenarios go in the last axis, after sub-groups
+                setattr(self, attr, np.array(values, dtype=float).T)
+
+        for attr in self.DYNAMICS.parameters:
+            if attr in self.PARAMETERS or attr in self.SHARED:
+                continue
+            value = getattr(models[0], attr)
+            if any(not same_value(getattr(m, attr), value) for m in models):
+                raise ValueError(f"models in batch must have the same {attr}")
+            setattr(self, attr, value)
+
+        self.state = np.array([m.state for m in models], dtype=float)
+        n_groups = len(self.sub_groups or [None])
+        (
+            self.SUSCEPTIBLE,
+            self.EXPOSED,
+            self.INFECTIOUS,
+            self.CRITICAL,
+            self.HOSPITALIZED,
+            self.ASYMPTOMATIC,
+            self.RECOVERED,
+            self.FATALITIES,
+        ) = range(0, 8 * n_groups, n_groups)
+
+    def __len__(self):
+        return len(self.models)
+
+    def run(self, duration=None) -> "SEICHARBatch":
+        """
+        Run all simulations in batch and store results in the corresponding
+        models.
+
+        Each scenario stops at the same day it would stop if it was simulated
+        separately.
+        """
+        x = x0 = self.state
+        t = self.time
+        dt = self.dt
+        check = self._get_validation() != "off"
+        self.bind_dynamics()
+        self.integrals = np.zeros(np.shape(x))
+        ts = [t]
+        xs = [x]
+        qs = [self.integrals.copy()]
+        n = len(self.models)
+        stop = np.full(n, -1)
+        self.event_times = {
+            name: np.array([m.event_times.get(name, np.inf) for m in self.models])
+            for name in set().union(*(m.event_times for m in self.models))
+        }
+        events = self._event_tracker(duration, (), (), t, x)
+        tf = float("inf") if duration is None else t + duration
+        tmax = t + self.max_simulation_period
+
+        while True:
+            x_ = self.step(x, t, dt)
+            done = events.update(t, x, t + dt, x_, active=stop == -1)
+            x = x_
+            t += dt
+            xs.append(x)
+            ts.append(t)
+            qs.append(self.integrals.copy())
+            if check:
+                self.check_state(x, t, x0)
+
+            done |= t > tmax or t > tf
+            stop[(stop == -1) & done] = len(xs) - 1
+            if (stop != -1).all():
+                break
+
+        ts = np.array(ts)
+        xs = np.array(xs)
+        for i, model in enumerate(self.models):
+            k = stop[i]
+            model.time = ts[k]
+            model.event_times = {name: v[i] for name, v in events.times.items()}
+            model._store_run(ts[: k + 1], xs[: k + 1, i], qs[k][i])
+        self.time = t
+        self.state = x
+        return self
+
+    def diff(self, x, t):
+        if self.validation == "full":
+            self.check_state(x, t)
+        return self._compartments_last(self.rhs_at(t)(self._compartments_first(x), t))
+
+    def _idx_all(self, i):
+        return list(range(i, i + len(self.sub_groups or [None])))
+
+    def _compartments_first(self, x):
+        if not self.sub_groups:
+            return x.T
+        return np.moveaxis(np.reshape(x, (len(x), 8, -1)), 0, -1)
+
+    def _compartments_last(self, y):
+        if not self.sub_groups:
+            return y.T
+        return np.moveaxis(y, -1, 0).reshape(y.shape[-1], -1)
+
+    def _run_post_process(self):
+        pass
+
+
+def run_batch(models: Sequence[SEICHAR], duration=None) -> list:
+    """
+    Run a sequence of SEICHAR models of the same class in a single batch and
+    return the list of models.
+    """
+    batch = SEICHARBatch(models)
+    batch.run(duration)
+    return batch.models
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .seichar import SEICHAR
+from .trajectory import StateArray
 from .. import data
 from ..region import Region
 
@@ -18,6 +19,19 @@ class SEICHARDemographic(SEICHAR):
     ref_year = 2020
     seed = 1e-3
     asymptomatic_contact_matrix = None
+
+    # Capacity is shared by all age groups and infections depend on the
+    # contact matrix. Sub-groups are in the second axis and expressions also
+    # accept a trailing axis of independent scenarios.
+    DYNAMICS = SEICHAR.DYNAMICS.extend(
+        definitions={
+            "hplus": "h / (h.sum(0) + 1e-50) * np.maximum(0, h.sum(0) - hospital_capacity)",
+            "hminus": "h - hplus",
+            "cplus": "c / (c.sum(0) + 1e-50) * np.maximum(0, c.sum(0) - icu_capacity)",
+            "cminus": "c - cplus",
+            "infections": "np.dot(relative_contact_matrix, beta * (i + rho * a) / (n + 1e-50) * s)",
+        }
+    )
     _idx_all = lambda self, i: np.array(range(i, i + len(self.sub_groups)))
 
     def __init__(self, *args, **kwargs):
@@ -96,51 +110,58 @@ class SEICHARDemographic(SEICHAR):
             self.FATALITIES,
         ) = range(0, 8 * n_groups, n_groups)
 
+    @property
+    def results(self) -> StateArray:
+        """
+        Simulation results as a (time, compartment, age) array.
+        """
+        traj = self.trajectory
+        return StateArray(traj.times, traj.values, self.recorded_columns, self.recorded_groups)
+
+    def _query_data(self):
+        return self.results
+
+    def _get_column(self, col, df):
+        if isinstance(df, StateArray):
+            return df.by_age(col)
+        return super()._get_column(col, df)
+
+    def get_data_totals(self, df):
+        """
+        Dataframe with the total of each compartment over all age groups.
+        """
+        if isinstance(df, StateArray):
+            return pd.DataFrame(df.total(), index=df.times, columns=list(df.columns))
+        return df.T.groupby(level=0, sort=False).sum().T
+
+    def get_data_total(self, df):
+        if isinstance(df, StateArray):
+            return pd.Series(df.total().sum(1), index=df.times)
+        return super().get_data_total(df)
+
     def get_total(self, col):
+        if isinstance(col, str) and col in self.columns:
+            return self["totals"][col]
         data = super().get_total(col)
-        return data.sum(len(data.shape) - 1)
+        return data.sum(len(data.shape) - 1, skipna=False)
 
     def diff(self, x, t):
-        x = np.reshape(x, (-1, len(self.sub_groups)))
-        s, e, i, c, h, a, r, f = x
-
-        # assert (x >= 0).all(), f"Invalid value at t={t}: {x}"
-
-        err = 1e-50
-        h_hat = h / (h.sum() + err)
-        c_hat = c / (c.sum() + err)
-        hplus = h_hat * max(0, h.sum() - self.hospital_capacity)
-        hminus = h_hat * min(h.sum(), self.hospital_capacity)
-        cplus = c_hat * max(0, c.sum() - self.icu_capacity)
-        cminus = c_hat * min(c.sum(), self.icu_capacity)
-
-        diff = self.diff_seichar(s, e, i, cminus, cplus, hminus, hplus, a, r, f, t)
-        return np.concatenate(diff)
-
-    def lambd(self, n, i, a, t):
-        tol = 1e-50
-        beta = self.beta(t)
-
-        if self.contact_matrix is None:
-            return beta * (i + self.rho * a) / (n + tol)
-        elif self.asymptomatic_contact_matrix is None:
-            fractions = (i + self.rho * a) / (n + tol)
-            return self.relative_contact_matrix * beta * fractions
-        else:
-            beta_i = self.relative_contact_matrix * beta * i / (n + tol)
-            beta_a = self.relative_contact_matrix * beta * a / (n + tol)
-            return beta_i + self.rho * beta_a
+        if self.validation == "full":
+            self.check_state(x, t)
+        x = np.reshape(x, (8, -1))
+        return self.rhs_at(t)(x, t).reshape(-1)
+
+    def _compartments_first(self, x):
+        return np.reshape(x, (8, -1))
 
-    def _infections(self, lambd, s):
-        res = np.dot(lambd, s)
-        # res = np.where(res > s * self.dt, res, s * self.dt)
-        return res
+    def _compartments_last(self, y):
+        return y.reshape(-1)
 
     def summary_demography(self):
         st = super().summary_demography()
-        fatalities = self.data["fatalities"].iloc[-1]
-        exposed = self.data["exposed"].apply(self.integral, 0) * self.sigma
-        infectious = self.data["infectious"].apply(self.integral, 0) * self.gamma_i
+        fatalities = pd.Series(self.final_state("fatalities"), index=self.sub_groups)
+        exposed = self.integral_of("exposed") * self.sigma
+        infectious = self.integral_of("infectious") * self.gamma_i
         data = pd.DataFrame(
             {
                 "fatalities": fatalities.apply(int),
@@ -152,8 +173,8 @@ class SEICHARDemographic(SEICHAR):
         data.loc["total", :] = [
             int(fatalities.sum()),
             100 * fatalities.sum() / self.demography.sum(),
-            100 * fatalities.sum() / exposed.sum(),
-            100 * fatalities.sum() / infectious.sum(),
+            100 * fatalities.sum() / exposed.sum(skipna=False),
+            100 * fatalities.sum() / infectious.sum(skipna=False),
         ]
         data["fatalities"] = data["fatalities"].apply(int)
         lines = str(data).splitlines()
@@ -0,0 +1,247 @@
+import numpy as np
+
+#
+# Dormand-Prince 5(4) Butcher tableau, error estimator and dense output
+# coefficients (Hairer, Norsett & Wanner, Solving ODEs I).
+#
+DOPRI_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1])
+DOPRI_A = [
+    np.array([]),
+    np.array([1 / 5]),
+    np.array([3 / 40, 9 / 40]),
+    np.array([44 / 45, -56 / 15, 32 / 9]),
+    np.array([19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729]),
+    np.array([9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656]),
+]
+DOPRI_B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84])
+DOPRI_E = np.array([-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40])
+DOPRI_P = np.array(
+    [
+        [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+        [0, 0, 0, 0],
+        [
+            0,
+            131558114200 / 32700410799,
+            -68118460800 / 10900136933,
+            87487479700 / 32700410799,
+        ],
+        [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+        [
+            0,
+            127303824393 / 49829197408,
+            -318862633887 / 49829197408,
+            701980252875 / 199316789632,
+        ],
+        [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+        [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+    ]
+)
+
+# Weights for the integral of dense output
+DOPRI_W = np.array([1 / 2, 1 / 3, 1 / 4, 1 / 5])
+
+
+class DormandPrince:
+    """
+    Adaptive Dormand-Prince 5(4) integrator with dense output.
+
+    Args:
+        fun:
+            Derivative function with signature fun(x, t).
+        t, y:
+            Initial time and state.
+        rtol, atol:
+            Relative and absolute tolerances for the local error estimate.
+        max_step:
+            Maximum allowed step size.
+        breakpoints:
+            Sorted sequence of times in which fun changes discontinuously.
+            Steps never cross a breakpoint.
+        switching:
+            Optional function of state that returns an array of values.
+            The right-hand side is assumed to have a kink whenever one of them
+            changes sign, and steps are truncated to end at the crossing.
+        clip:
+            Optional function used to project accepted states back to the
+            valid domain.
+    """
+
+    min_switching_step = 1e-6
+    safety = 0.9
+    min_factor = 0.2
+    max_factor = 10.0
+
+    def __init__(
+        self,
+        fun,
+        t,
+        y,
+        rtol=1e-6,
+        atol=1e-6,
+        max_step=float("inf"),
+        breakpoints=(),
+        switching=None,
+        clip=None,
+    ):
+        self.fun = fun
+        self.t = t
+        self.y = np.array(y, dtype=float)
+        self.rtol = rtol
+        self.atol = atol
+        self.max_step = max_step
+        self.breakpoints = np.sort(np.asarray(breakpoints, dtype=float))
+        self.switching = switching
+        self.clip = clip or (lambda x: x)
+        self.nfev = 0
+        self.naccepted = 0
+        self.nrejected = 0
+        self.f = self._eval(self.y, t)
+        self.h = self._initial_step()
+
+        # Integral of solution since the initial time
+        self.integral = np.zeros_like(self.y)
+        self.integral_old = self.integral
+
+        # Dense output of last step
+        self.last = t
+        self.last_y = self.y
+        self.last_integral = self.integral
+        self.t_old = t
+        self.y_old = self.y
+        self.h_old = 0.0
+        self.Q = None
+
+    def _eval(self, y, t):
+        self.nfev += 1
+        return self.fun(y, t)
+
+    def _norm(self, x):
+        return np.sqrt(np.mean(np.square(x)))
+
+    def _initial_step(self):
+        scale = self.atol + self.rtol * np.abs(self.y)
+        d0 = self._norm(self.y / scale)
+        d1 = self._norm(self.f / scale)
+        h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+        return min(h, self.max_step)
+
+    def _next_breakpoint(self, t):
+        i = np.searchsorted(self.breakpoints, t, side="right")
+        return self.breakpoints[i] if i < len(self.breakpoints) else None
+
+    def _attempt(self, h, t_limit):
+        t, y = self.t, self.y
+        K = np.empty((7, *y.shape))
+        K[0] = self.f
+        for s in range(1, 6):
+            dy = h * np.tensordot(DOPRI_A[s], K[:s], 1)
+            K[s] = self._eval(y + dy, min(t + DOPRI_C[s] * h, t_limit))
+        y_new = y + h * np.tensordot(DOPRI_B, K[:6], 1)
+        K[6] = self._eval(y_new, min(t + h, t_limit))
+
+        scale = self.atol + self.rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = self._norm(h * np.tensordot(DOPRI_E, K, 1) / scale)
+        return y_new, K, err
+
+    def _interpolate(self, t_old, y_old, h, Q, t):
+        x = (t - t_old) / h
+        p = np.cumprod([x] * 4)
+        return y_old + h * np.tensordot(p, Q, 1)
+
+    def _locate_switch(self, h, y_new, Q):
+        """
+        Return the fraction of step in which the first switching function
+        changes sign or None.
+        """
+        g0 = self.switching(self.y)
+        if g0 is None:
+            return None
+        g0 = np.sign(g0)
+        g1 = np.sign(self.switching(y_new))
+        if np.all(g0 == g1):
+            return None
+
+        a, b = 0.0, 1.0
+        for _ in range(50):
+            m = 0.5 * (a + b)
+            ym = self._interpolate(0.0, self.y, h, Q, m * h)
+            if np.any(np.sign(self.switching(ym)) != g0):
+                b = m
+            else:
+                a = m
+        return b
+
+    def step(self, watcher=None):
+        """
+        Perform a single accepted step.
+        """
+        t, y = self.t, self.y
+        h = min(self.h, self.max_step)
+        t_break = self._next_breakpoint(t)
+        hit_break = t_break is not None and t + h >= t_break
+        if hit_break:
+            h = t_break - t
+
+        while True:
+            # Evaluations at the breakpoint use the left limit of fun
+            t_limit = np.nextafter(t_break, -np.inf) if hit_break else float("inf")
+            y_new, K, err = self._attempt(h, t_limit)
+
+            if err > 1.0:
+                self.nrejected += 1
+                h *= max(self.min_factor, self.safety * err**-0.2)
+                hit_break = False
+                continue
+
+            Q = np.tensordot(DOPRI_P, K, (0, 0))
+            if self.switching is not None and h > self.min_switching_step:
+                theta = self._locate_switch(h, y_new, Q)
+                if theta is not None and theta * h + self.min_switching_step < h:
+                    h = theta * h + self.min_switching_step
+                    hit_break = False
+                    continue
+            break
+
+        self.naccepted += 1
+        factor = self.max_factor if err == 0 else self.safety * err**-0.2
+        self.h = h * min(self.max_factor, max(self.min_factor, factor))
+        if watcher is not None:
+            watcher(y, (y_new - y) / h, t, h)
+
+        self.t_old, self.y_old, self.h_old, self.Q = t, y, h, Q
+        self.integral_old = self.integral
+        self.integral = self.integral + h * y + h * h * np.tensordot(DOPRI_W, Q, 1)
+        self.t = t_new = t_break if hit_break else t + h
+        self.y = self.clip(y_new)
+        if hit_break or np.any(self.y != y_new):
+            self.f = self._eval(self.y, t_new)
+        else:
+            self.f = K[6]
+
+        # The step size estimate is meaningless across a discontinuity
+        if hit_break:
+            self.h = self._initial_step()
+
+    def advance(self, t, watcher=None):
+        """
+        Integrate until time t and return the state at t using dense output.
+        """
+        while self.t < t:
+            self.step(watcher)
+        if self.t == t or self.Q is None:
+            return self.y.copy()
+        y = self._interpolate(self.t_old, self.y_old, self.h_old, self.Q, t)
+        return self.clip(y)
+
+    def integrate(self, t):
+        """
+        Integral of the dense output from the initial time to t, which must be
+        within the last step.
+        """
+        if self.t == t or self.Q is None:
+            return self.integral
+        h = self.h_old
+        p = np.cumprod([(t - self.t_old) / h] * 5)
+        return self.integral_old + h * (
+            p[0] * self.y_old + h * np.tensordot(p[1:] * DOPRI_W, self.Q, 1)
+        )
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+
+
+class Trajectory:
+    """
+    Growable and preallocated store for the results of a simulation.
+
+    Times and states are saved in contiguous arrays that double in size when
+    capacity is exceeded. Appending a new state has amortized O(1) cost and
+    the stored values are exposed as array views.
+
+    Args:
+        width:
+            Number of entries in each state vector.
+        capacity:
+            Initial number of rows reserved in the buffer.
+        dtype:
+            Data type used to store states.
+    """
+
+    def __init__(self, width, capacity=0, dtype=float):
+        self.width = width
+        self.size = 0
+        self.version = 0
+        self._times = np.empty(capacity)
+        self._values = np.empty((capacity, width), dtype=dtype)
+        self._refs = [1]
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self._times)
+
+    @property
+    def times(self) -> np.ndarray:
+        """
+        View over the times of all stored states.
+        """
+        return self._times[: self.size]
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        View over all stored states. Each state is a row in a 2D array.
+        """
+        return self._values[: self.size]
+
+    @property
+    def last(self) -> np.ndarray:
+        """
+        Last stored state.
+        """
+        if self.size == 0:
+            raise IndexError("empty trajectory")
+        return self._values[self.size - 1]
+
+    def reserve(self, capacity):
+        """
+        Make sure buffer can hold at least the given number of rows without
+        re-allocating.
+        """
+        if capacity > self.capacity:
+            self._reallocate(max(capacity, 2 * self.capacity))
+        elif self._refs[0] > 1:
+            self._reallocate(self.capacity)
+
+    def _reallocate(self, capacity, keep=True):
+        times = np.empty(capacity)
+        values = np.empty((capacity, self.width), dtype=self._values.dtype)
+        if keep:
+            times[: self.size] = self.times
+            values[: self.size] = self.values
+        self._times = times
+        self._values = values
+
+        # Detach from forks
+        self._refs[0] -= 1
+        self._refs = [1]
+
+    def append(self, t, x):
+        """
+        Append a single state at the given time.
+        """
+        n = self.size
+        if n == self.capacity or self._refs[0] > 1:
+            self.reserve(n + 1)
+        self._times[n] = t
+        self._values[n] = x
+        self.size = n + 1
+        self.version += 1
+
+    def extend(self, times, xs):
+        """
+        Append a sequence of times and states.
+        """
+        n = self.size
+        m = n + len(times)
+        self.reserve(m)
+        self._times[n:m] = times
+        self._values[n:m] = xs
+        self.size = m
+        self.version += 1
+
+    def clear(self):
+        """
+        Remove all stored states, but keep allocated memory.
+        """
+        if self._refs[0] > 1:
+            self._reallocate(self.capacity, keep=False)
+        self.size = 0
+        self.version += 1
+
+    def copy(self) -> "Trajectory":
+        """
+        Return an independent copy of trajectory.
+        """
+        new = Trajectory(self.width, self.size, dtype=self._values.dtype)
+        new.extend(self.times, self.values)
+        return new
+
+    def fork(self) -> "Trajectory":
+        """
+        Return a copy of trajectory that shares memory with the original.
+
+        Buffers are copied lazily: the first of them that appends or removes
+        states makes a private copy of the data.
+        """
+        new = Trajectory.__new__(Trajectory)
+        new.__dict__.update(self.__dict__)
+        self._refs[0] += 1
+        return new
+
+
+class StateArray:
+    """
+    Labelled view over states of a model with sub-groups.
+
+    States are stored as a contiguous (time, compartment, group) array and
+    accessors return views whenever possible. The wide dataframe with a
+    (column, age) MultiIndex is only built by :meth:`to_frame`.
+
+    Args:
+        times:
+            Array of T times.
+        values:
+            A (T, n_compartments * n_groups) or (T, n_compartments, n_groups)
+            array of states.
+        columns:
+            Compartment names.
+        groups:
+            Names of sub-groups.
+    """
+
+    def __init__(self, times, values, columns, groups):
+        self.times = np.asarray(times)
+        self.columns = tuple(columns)
+        self.groups = tuple(groups)
+        shape = (len(self.times), len(self.columns), len(self.groups))
+        self.values = np.reshape(values, shape)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        shape = " x ".join(map(str, self.values.shape))
+        return f"{type(self).__name__}({shape})"
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def _index(self, name):
+        try:
+            return self.columns.index(name)
+        except ValueError:
+            raise KeyError(name)
+
+    def compartment(self, name) -> np.ndarray:
+        """
+        A (T, n_groups) view with the given compartment in each group.
+        """
+        return self.values[:, self._index(name)]
+
+    def total(self, name=None) -> np.ndarray:
+        """
+        Sum over all groups.
+
+        Return a (T,) array for the given compartment or a (T, n_compartments)
+        array if name is None.
+        """
+        if name is None:
+            return self.values.sum(2)
+        return self.compartment(name).sum(1)
+
+    def by_age(self, name) -> pd.DataFrame:
+        """
+        Dataframe indexed by time with one column per group. Data is shared
+        with the array.
+        """
+        data = self.compartment(name)
+        return pd.DataFrame(data, index=self.times, columns=list(self.groups), copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Wide dataframe indexed by time with (column, age) columns.
+        """
+        names = "column", "age"
+        columns = pd.MultiIndex.from_product((self.columns, self.groups), names=names)
+        values = self.values.reshape(len(self.times), -1)
+        return pd.DataFrame(values, index=self.times, columns=columns)
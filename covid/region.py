@@ -3,11 +3,12 @@ import warnings
 from enum import Enum
 from typing import Optional, Iterable
 
+import numpy as np
 import pandas as pd
 
 from . import data
 from .data import countries
-from .types import delegate, computed
+from .types import delegate, computed, cached
 from .utils import fmt, pc, indent
 
 ifmt = lambda x: fmt(int(x))
@@ -85,14 +86,7 @@ class Region:
     KIND_CITY = RegionType.CITY
     KIND_METRO = RegionType.METRO
 
-    @property
-    def _mortality(self):
-        (
-            self.prob_hospitalization,
-            self.prob_icu,
-            self.prob_fatality,
-        ) = res = data.covid_mean_mortality(self.demography)
-        return res
+    _mortality = computed(lambda r: data.covid_mean_mortality(r.demography))
 
     @computed
     def contact_matrix(self):
@@ -272,6 +266,53 @@ class MultiRegion(Region):
         self.name = name
 
 
+class CityGroup(MultiRegion):
+    """
+    Aggregate of Brazilian cities, such as a state, sub-region or metro area.
+
+    Demography and healthcare statistics are computed for all cities at once
+    from the packed datasets, or loaded from the rollup table with
+    :meth:`from_rollup`. City instances are only created when sub_regions is
+    accessed.
+    """
+
+    data_source = "IBGE"
+    city_ids = cached(lambda self: data.brazil_rollup_cities(self._key))
+    sub_regions = cached(lambda self: [City(self._country, int(id)) for id in self.city_ids])
+
+    def __init__(self, country, name, ids, **kwargs):
+        ids = np.asarray(ids, dtype=int)
+        missing = ~np.isin(ids, data.brazil_city_ids())
+        for id_ in ids[missing]:
+            warnings.warn(f"City has no demography: {id_}")
+        self.city_ids = ids = ids[~missing]
+        if not len(ids):
+            raise ValueError(f"cannot create empty multi-region {name}")
+        self._init(country, name, data.brazil_cities_aggregate(ids), **kwargs)
+
+    @classmethod
+    def from_rollup(cls, country, key, **kwargs) -> "CityGroup":
+        """
+        Create region from a key of the rollup table, such as "state:35",
+        "sub-region:3515" or "metro:São Paulo".
+        """
+        stats = data.brazil_rollup(key)
+        new = cls.__new__(cls)
+        new._key = key
+        new._init(country, stats["name"], stats, **kwargs)
+        return new
+
+    def _init(self, country, name, stats, **kwargs):
+        self._country = country
+        coarse = data.group_demography(stats, coarse=True)
+        demography = coarse.sum(1).rename_axis("age")
+        Region.__init__(self, "multi", demography, kind=self.KIND_METRO, **kwargs)
+        self.name = name
+        self.demography_detailed = data.group_demography(stats)
+        for attr in data.ibge_rollup.CAPACITY_COLUMNS:
+            setattr(self, attr, stats[attr])
+
+
 def region(name, **kwargs):
     """
     Normalize string or Region and return a Region.
@@ -285,46 +326,30 @@ def region(name, **kwargs):
     elif "/" in name:
         country, _, entity = map(str.strip, name.partition("/"))
         country = countries.normalize_country_id(country)
-        kind, info = countries.parse_entity(country, entity)
+        if entity.lower().startswith("metro:"):
+            key = "metro:" + entity[6:].strip()
+            return CityGroup.from_rollup(country, key, id=key)
 
+        kind, info = countries.parse_entity(country, entity)
         if kind == "state":
-            df = countries.cities(country, state_id=info["id"])
-            state = _region_from_cities(country, info, df, kwargs)
+            state = CityGroup.from_rollup(country, f"state:{info['id']}", id=info["id"])
             state.state_code = info["code"]
-            state.data_source = "IBGE"
             return state
 
         elif kind == "city":
             return City(country, info["id"])
 
         elif kind == "sub-region":
-            df = countries.cities(country)
-            df = df[df["sub_region"] == info["id"]]
-            sub_region = _region_from_cities(country, info, df, kwargs)
+            key = f"sub-region:{info['id']}"
+            sub_region = CityGroup.from_rollup(country, key, id=info["id"])
             sub_region.state_code = info["state_code"]
             sub_region.state_id = info["state_id"]
-            sub_region.data_source = "IBGE"
             return sub_region
 
     else:
         return CIAFactbookCountry(name, **kwargs)
 
 
-def _region_from_cities(country, info, df, kwargs):
-    cities = []
-    for id_, row in df.iterrows():
-        try:
-            id_: int
-            city = City(country, id_)
-        except ValueError:
-            name = row["name"]
-            warnings.warn(f"City has no demography: {name} ({id_})")
-        else:
-            cities.append(city)
-    res = MultiRegion(info["name"], cities, id=info["id"])
-    return res
-
-
 if __name__ == "__main__":
     import click
 
@@ -1,9 +1,10 @@
 import numpy as np
 
 from ..cache import cache
-from covid.data import COUNTRIES
+from covid.data.countries import COUNTRIES
 from ..models.seichar_demographic import SEICHARDemographic
 from ..models.seichar import SEICHAR
+from ..models.seichar_batch import run_batch
 
 
 @cache("cache/world.db")
@@ -13,26 +14,37 @@ def simulate(region, r0=2.74, ps=0.14, cls=SEICHAR):
     return model
 
 
+def simulate_many(regions, r0=2.74, ps=0.14):
+    """
+    Simulate SEICHAR for all combinations of regions and parameters in a single
+    batch.
+
+    Return a list of models with len(regions) elements for each value of r0 or
+    ps.
+    """
+    r0s = np.atleast_1d(r0)
+    pss = np.atleast_1d(ps)
+    models = [
+        SEICHAR(region=region, R0=r0_, prob_symptomatic=ps_)
+        for r0_ in r0s
+        for ps_ in pss
+        for region in regions
+    ]
+    return run_batch(models)
+
+
 def r0_series(ps=0.14, func=lambda x: x):
-    res = []
-    for r0 in np.linspace(1, 5, 50):
-        countries = []
-        res.append(countries)
-        for country in COUNTRIES:
-            m = simulate(country, r0, ps)
-            countries.append(func(m))
-    return res
+    countries = list(COUNTRIES)
+    models = simulate_many(countries, np.linspace(1, 5, 50), ps)
+    n = len(countries)
+    return [list(map(func, models[i : i + n])) for i in range(0, len(models), n)]
 
 
 def ps_series(r0=2.74, func=lambda x: x):
-    res = []
-    for ps in np.linspace(0, 1, 50):
-        countries = []
-        res.append(countries)
-        for country in COUNTRIES:
-            m = simulate(country, r0, ps)
-            countries.append(func(m))
-    return res
+    countries = list(COUNTRIES)
+    models = simulate_many(countries, r0, np.linspace(0, 1, 50))
+    n = len(countries)
+    return [list(map(func, models[i : i + n])) for i in range(0, len(models), n)]
 
 
 if __name__ == "__main__":
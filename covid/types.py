@@ -19,11 +19,56 @@ class CachedProperty:
 
 
 class ComputedProperty(CachedProperty):
+    """
+    Memoized property that tracks the attributes it reads.
+
+    The function receives a proxy that records all attributes read from the
+    instance. The result is reused while all those attributes still refer to
+    the same objects and is recomputed when any of them is reassigned.
+    Computed attributes can depend on each other, and changes propagate
+    through the chain of dependencies. Attributes read indirectly, e.g., by
+    calling methods of the instance, are not tracked.
+
+    Assigning to the attribute stores a value in the instance that overrides
+    the computed one.
+    """
+
     def __get__(self, instance, owner=None):
         if instance is None:
             return owner
+        cache = instance.__dict__.setdefault("_computed", {})
+        try:
+            value, deps = cache[self.name]
+        except KeyError:
+            pass
         else:
-            return self.func(instance)
+            if all(getattr(instance, k) is v for k, v in deps.items()):
+                return value
+
+        tracker = _Tracker(instance)
+        value = self.func(tracker)
+        cache[self.name] = (value, tracker._deps)
+        return value
+
+
+class _Tracker:
+    """
+    Proxy that records attributes read from an object.
+    """
+
+    __slots__ = ("_obj", "_deps")
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._deps = {}
+
+    def __getattr__(self, name):
+        value = getattr(self._obj, name)
+
+        # Bound methods are new objects on every access
+        if getattr(value, "__self__", None) is not self._obj:
+            self._deps[name] = value
+        return value
 
 
 def cached(func):
@@ -65,6 +110,7 @@ def delegate(name):
 
 def computed(func):
     """
-    A writable property-like descriptor.
+    A writable property-like descriptor that is recomputed only when the
+    attributes it depends on are reassigned.
     """
     return ComputedProperty(func)
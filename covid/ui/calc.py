@@ -1,14 +1,17 @@
 from contextlib import contextmanager
 
+import numpy as np
 import streamlit as st
 
 import covid
 from covid import gettext as _
 from covid.models import SEICHARDemographic as SEICHAR
+from covid.models.emulator import Emulator
 from covid.ui import components
 from covid.ui.components import asset
 from covid.ui.input import Input
 from covid.ui.output import Output
+from covid.utils import same_value
 
 COUNTRY = "Brazil"
 DISPLAY_COUNTRY = _("Brazil")
@@ -78,20 +81,154 @@ class CalcUI:
         Initialize class with given arguments and run simulation.
         """
         kwargs = {"prob_symptomatic": 0.14, "hospital_prioritization": 0.0, **kwargs}
-        model = self.simulation_class(**kwargs)
-
-        # FIXME: should be able to setup on the constructor
-        model.hospital_capacity = hospital_capacity
-        model.icu_capacity = icu_capacity
-        model.prob_hospitalization *= hospitalization_bias
+        region = kwargs["region"]
+        key = (
+            region.kind,
+            region.id,
+            *sorted((k, v) for k, v in kwargs.items() if k != "region"),
+            hospital_capacity,
+            icu_capacity,
+            hospitalization_bias,
+        )
+
+        def baseline(hospitalization_bias=hospitalization_bias, **params):
+            model = self.simulation_class(**{**kwargs, **params})
+
+            # FIXME: should be able to setup on the constructor
+            model.hospital_capacity = hospital_capacity
+            model.icu_capacity = icu_capacity
+            model.prob_hospitalization *= hospitalization_bias
+            return model
+
+        # Interpolate precomputed results when possible
+        if not intervention:
+            cls = self.simulation_class
+            params = {k: kwargs.get(k, getattr(cls, k, None)) for k in EMULATOR_GRID}
+            params["hospitalization_bias"] = hospitalization_bias
+            ignore = {"region", "start_date", "seed", *params}
+            fixed = sorted((k, v) for k, v in kwargs.items() if k not in ignore)
+            model = emulate(baseline, period, params, fixed)
+            if model is not None:
+                Output(model).run()
+                return
+
+        base = cached_checkpoint(key, baseline)
+        model = base.fork()
         if intervention:
             model = intervention(model)
-        model.run(period)
+
+        # Scenarios that only differ by R0 after the intervention share the
+        # simulation up to this point. Other changes are part of the key.
+        changes = intervention_changes(base, model)
+        breakpoints = [t for t in getattr(model.R0, "breakpoints", ()) if 0 < t <= period]
+        if breakpoints and changes is not None:
+            t = min(breakpoints)
+            R0 = model.R0
+
+            def prefix_factory():
+                prefix = baseline()
+                for attr, _ in changes:
+                    setattr(prefix, attr, getattr(model, attr))
+                return prefix.run(t - 1)
+
+            prefix = cached_checkpoint((*key, t, *changes), prefix_factory)
+            model = prefix.fork(R0=R0)
+            model.run(period - t)
+        else:
+            model.run(period)
 
         out = Output(model)
         out.run()
 
 
+def intervention_changes(base, model):
+    """
+    Return a tuple of (name, value) pairs with the attributes of model, other
+    than R0, that differ from base, or None if some of them cannot be used as
+    a cache key.
+    """
+    changes = []
+    for attr, value in vars(model).items():
+        old = vars(base).get(attr, getattr(type(base), attr, None))
+        if attr == "R0" or same_value(value, old):
+            continue
+        elif isinstance(value, np.ndarray):
+            value = (value.shape, tuple(value.flat))
+        elif not isinstance(value, (int, float, str, tuple, type(None))):
+            return None
+        changes.append((attr, value))
+    return tuple(sorted(changes, key=lambda item: item[0]))
+
+
+# Checkpoints of simulations shared between Streamlit runs
+CHECKPOINTS = {}
+MAX_CHECKPOINTS = 32
+
+
+def cached_checkpoint(key, factory):
+    """
+    Return a model checkpoint stored under key or create a new one using the
+    factory function.
+    """
+    try:
+        return CHECKPOINTS[key]
+    except KeyError:
+        if len(CHECKPOINTS) >= MAX_CHECKPOINTS:
+            CHECKPOINTS.pop(next(iter(CHECKPOINTS)))
+        CHECKPOINTS[key] = model = factory().checkpoint()
+        return model
+
+
+# Emulators for the parameters exposed in the UI. Each emulator is valid for
+# a demography profile and for fixed fractions of initial cases and of beds
+# per capita.
+EMULATOR_GRID = {
+    "R0": np.arange(0.0, 5.01, 0.25),
+    "sigma": 1 / np.array([1.0, 2.0, 3.69, 5.0, 7.0, 10.0]),
+    "gamma_i": 1 / np.array([1.0, 2.0, 3.47, 5.0, 7.0, 10.0, 14.0]),
+    "prob_symptomatic": [0.05, 0.14, 0.3, 0.5, 0.75, 1.0],
+    "hospitalization_bias": [0.5, 1.0, 2.0, 3.0, 4.0],
+}
+EMULATOR_DURATION = 30 * 7
+EMULATOR_RTOL = 0.05
+EMULATORS = {}
+MAX_EMULATORS = 8
+
+
+def emulate(factory, period, params, fixed=()):
+    """
+    Return a model with results interpolated by an emulator or None if
+    parameters are outside the grid or if the estimated error exceeds
+    EMULATOR_RTOL.
+
+    Fixed is a sequence of (name, value) pairs with the remaining arguments of
+    factory. Models that share them and the same proportions of population
+    share the same emulator.
+    """
+    model = factory(**params)
+    population = np.sum(model.state)
+    demography = np.asarray(model.demography, dtype=float)
+    key = (
+        tuple(np.round(demography / demography.sum(), 9)),
+        round(model.seed / population, 12),
+        round(model.hospital_capacity / population, 12),
+        round(model.icu_capacity / population, 12),
+        *fixed,
+    )
+    try:
+        emulator = EMULATORS[key]
+    except KeyError:
+        if len(EMULATORS) >= MAX_EMULATORS:
+            EMULATORS.pop(next(iter(EMULATORS)))
+        emulator = EMULATORS[key] = Emulator(factory, EMULATOR_GRID, EMULATOR_DURATION)
+
+    try:
+        errors = emulator.emulate(model, period, **params)
+    except ValueError:
+        return None
+    return model if errors.max() <= EMULATOR_RTOL else None
+
+
 # @st.cache
 def region(name):
     return covid.region(name)
@@ -103,5 +240,6 @@ def rename_data_header(name):
 
 # Start main script
 if __name__ == "__main__":
+    covid.data.preload(wait=False)
     ui = CalcUI()
     ui.run()
@@ -5,7 +5,7 @@ import streamlit as st
 import covid
 from covid import gettext as _
 from covid.data import countries
-from covid.models import SEICHAR
+from covid.models import SEICHAR, Schedule
 from covid.utils import fmt, pc
 from covid.data import age_distribution
 
@@ -47,14 +47,21 @@ class Input:
         Return a region instance from user input.
         """
 
-        # Select a state
+        # Search by name or select a state
         st.sidebar.header(_("Location"))
+        query = st.sidebar.text_input(_("Search location"))
+        if query:
+            matches = complete(self.country, query)
+            if matches:
+                choice = st.sidebar.selectbox(_("Results"), matches, format_func=entity_label)
+                return get_region(f"{self.country}/{choice.id}")
+
         df = states(self.country)
         choices = [self.display_country, *df["name"]]
         choice = st.sidebar.selectbox(_("State"), choices)
         if choice == choices[0]:
             return get_region(self.country)
-        state_id = state_code(self.country, choice)
+        state_id = entity_id(self.country, "state", choice)
 
         # State selected, now ask for sub-region
         df = sub_regions(self.country, state_id)
@@ -65,7 +72,7 @@ class Input:
             choice = st.sidebar.selectbox(_("Region"), choices)
             if choice == choices[0]:
                 return get_region(f"{self.country}/{state_id}")
-        sub_region_id = sub_region_code(self.country, state_id, choice)
+        sub_region_id = entity_id(self.country, "sub-region", choice, state_id)
 
         # Sub-region selected, now ask for a city
         df = cities(self.country, sub_region_id)
@@ -76,7 +83,7 @@ class Input:
             choice = st.sidebar.selectbox(_("City"), choices)
             if choice == choices[0]:
                 return get_region(f"{self.country}/{sub_region_id}")
-        city_id = df[df["name"] == choice].index[0]
+        city_id = entity_id(self.country, "city", choice, state_id)
         return get_region(f"{self.country}/{city_id}")
 
     def params(self, region):
@@ -260,14 +267,7 @@ def social_distance_intervention(date, rate):
             return model
         else:
             delta = date - model.start_date
-            R0_initial = model.R0
-            R0_final = model.R0 * rate
-            t_intervention = delta.days
-
-            def Rt(t):
-                return R0_initial if t < t_intervention else R0_final
-
-            model.R0 = Rt
+            model.R0 = model.R0 * Schedule.steps(1.0, {delta.days: rate})
             return model
 
     return fn
@@ -290,16 +290,21 @@ def cities(country, sub_region):
     return cities[cities["sub_region"] == sub_region]
 
 
-@st.cache
-def state_code(country, state):
-    names = states(country)["name"]
-    return names[names == state].index[0]
+def entity_id(country, kind, name, state_id=None):
+    index = countries.geography_index(country)
+    return index.lookup(name, kind, state_id=state_id)[0].id
 
 
-@st.cache
-def sub_region_code(country, state_code, sub_region):
-    regions = sub_regions(country, state_code)
-    return regions[regions["name"] == sub_region].index[0]
+def complete(country, text):
+    return countries.geography_index(country).complete(text)
+
+
+def entity_label(entity):
+    if entity.kind == "city":
+        return f"{entity.name} - {entity.state_code}"
+    elif entity.kind == "sub-region":
+        return f"{entity.name} ({_('Region')})"
+    return f"{entity.name} ({_('State')})"
 
 
 @st.cache(allow_output_mutation=True)
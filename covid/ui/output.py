@@ -46,8 +46,8 @@ class Output:
         """
 
         # Which one?
-        df = model.data["infectious"] * model.gamma_i * model.prob_hospitalization
-        hospitalized = df.apply(model.integral).sum()
+        infectious = model.integral_of("infectious") * model.gamma_i
+        hospitalized = (infectious * model.prob_hospitalization).sum()
 
         h_date = model.hospital_overflow_date
         c_date = model.icu_overflow_date
@@ -124,7 +124,7 @@ class Output:
     def write_fatalities_chart(self, model):
         st.subheader(" ")
         st.subheader(_("Anticipated age distribution of COVID deaths"))
-        data = model.data.loc[model.time, "fatalities"]
+        data = pd.Series(model.final_state("fatalities"), index=model.sub_groups)
         data = pd.DataFrame(
             {
                 "fatalities": data.astype(int),
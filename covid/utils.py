@@ -6,7 +6,17 @@ from math import log10
 
 import numpy as np
 
-__all__ = ["fmt", "pc", "pm", "p10k", "indent", "rpartition", "interpolant", "lru_safe_cache"]
+__all__ = [
+    "fmt",
+    "pc",
+    "pm",
+    "p10k",
+    "indent",
+    "rpartition",
+    "interpolant",
+    "lru_safe_cache",
+    "same_value",
+]
 
 N_RE = re.compile(r"(-?)(\d+)(\.\d{,2})?\d*")
 identity = lambda x: x
@@ -35,6 +45,8 @@ def fmt(n):
         return ", ".join(map(fmt, n))
     except TypeError:
         pass
+    if n != n:
+        return "-"
     m = abs(n)
 
     if int(n) == n and m < 1e6:
@@ -139,6 +151,23 @@ def lru_safe_cache(size):
     return decorator
 
 
+def same_value(a, b) -> bool:
+    """
+    True if a and b are the same object or equal values of the same type.
+
+    Arrays are equal if they have the same shape and elements. Values that
+    cannot be compared are considered different.
+    """
+    if a is b:
+        return True
+    elif isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.shape(a) == np.shape(b) and np.array_equal(a, b)
+    try:
+        return type(a) is type(b) and bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
 def indent(st, indent=4):
     """
     Indent string.
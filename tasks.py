@@ -20,6 +20,20 @@ def i18n(ctx):
     compilemessages(ctx)
 
 
+@task
+def datasets(ctx):
+    """
+    Rebuild packed datasets from the raw files in covid/datasets.
+    """
+    from covid.data.ibge_demographic import build_city_store
+    from covid.data.ibge_rollup import build_rollup
+
+    n = build_city_store()
+    print(f"Packed demography of {n} cities")
+    n = build_rollup()
+    print(f"Aggregated {n} states, sub-regions and metro areas")
+
+
 @task
 def test(ctx):
     ctx.run("black --check .")
@@ -98,3 +98,38 @@ class TestCountriesGeography:
     def test_sub_region(self, sub_region):
         assert eq(countries.sub_region("brazil", sub_region.name, by="id"), sub_region)
         assert eq(countries.sub_region("brazil", sub_region["name"]), sub_region)
+
+    def test_parse_entity_folds_accents_and_case(self, city):
+        kind, st = countries.parse_entity("brazil", "brasilia")
+        assert kind == "city"
+        assert eq(st, city)
+        assert countries.parse_entity("brazil", "Brasilia - DF")[1]["id"] == city["id"]
+
+        with pytest.raises(ValueError):
+            countries.parse_entity("brazil", "Atlantis")
+
+
+class TestGeographyIndex:
+    @pytest.fixture(scope="class")
+    def index(self):
+        return countries.geography_index("brazil")
+
+    def test_lookup(self, index):
+        assert countries.fold_name(" São  PAULO ") == "sao paulo"
+        kinds = [e.kind for e in index.lookup("Distrito Federal")]
+        assert kinds == ["sub-region", "state"]
+        assert [e.id for e in index.lookup("sao paulo", "city")] == [3550308]
+        assert index.state("DF").id == 53
+        assert [e.state_code for e in index.lookup("Bonito", state_id=50)] == ["MS"]
+        with pytest.raises(ValueError):
+            index.lookup("Bonito", state_id=99)
+
+    def test_lineage(self, index):
+        parents = index.lineage("city", 5300108)
+        assert [(e.kind, e.id) for e in parents] == [("sub-region", 531), ("state", 53)]
+
+    def test_search(self, index):
+        names = [e.name for e in index.search("sao paulo", limit=3)]
+        assert names[0] == "São Paulo"
+        assert all(fold.startswith("sao paulo") for fold in map(countries.fold_name, names))
+        assert index.fuzzy("Florianopolys", limit=1)[0].name == "Florianópolis"
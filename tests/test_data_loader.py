@@ -1,3 +1,6 @@
+import os
+
+import numpy as np
 import pytest
 
 from covid.data import (
@@ -7,7 +10,12 @@ from covid.data import (
     covid_mean_mortality,
     contact_matrix,
     city_id_from_name,
+    brazil_city_demography,
+    brazil_cities_demography,
+    brazil_city_ids,
+    brazil_healthcare_capacity,
 )
+from covid.data import ibge_demographic, registry
 
 
 class TestCiaFactbook:
@@ -68,3 +76,65 @@ class TestCiaFactbook:
 class TestIBGE:
     def test_load_city_from_code(self):
         assert city_id_from_name("São Paulo") == 355_030
+
+    def test_city_demography_store(self):
+        ids = brazil_city_ids()
+        assert len(ids) > 5500 and (ids[1:] > ids[:-1]).all()
+
+        data = brazil_cities_demography([5300108, 3550308], coarse=True)
+        df = brazil_city_demography(5300108, coarse=True)
+        assert data.shape == (2, 9, 2)
+        assert (data[0] == df.values).all()
+        assert (data.sum(1) == brazil_cities_demography([5300108, 3550308]).sum(1)).all()
+        assert not df.values.flags.writeable
+
+        with pytest.raises(ValueError):
+            brazil_cities_demography([1])
+
+    def test_city_demography_store_agrees_with_csv(self, monkeypatch):
+        packed = brazil_city_demography(1100015)
+        monkeypatch.setattr(ibge_demographic, "_store", lambda: None)
+        csv = brazil_city_demography(1100015, download=False)
+        assert (packed.values == csv.fillna(0).values).all()
+        assert (packed.index == csv.index).all()
+
+    def test_build_city_store_to_output_directory(self, tmp_path):
+        source = tmp_path / "source"
+        source.mkdir()
+        for city_id in [1100015, 5300108]:
+            name = f"city-{city_id}.csv"
+            (source / name).write_bytes((ibge_demographic.IBGE_DATA / name).read_bytes())
+        mtime = ibge_demographic.STORE_IDS.stat().st_mtime_ns
+
+        assert ibge_demographic.build_city_store(source, tmp_path) == 2
+        assert list(np.load(tmp_path / ibge_demographic.STORE_IDS.name)) == [1100015, 5300108]
+        assert ibge_demographic.STORE_IDS.stat().st_mtime_ns == mtime
+        assert len(brazil_city_ids()) > 5500
+
+
+class TestRegistry:
+    def test_datasets_are_parsed_once_and_read_only(self):
+        df = brazil_healthcare_capacity()
+        assert brazil_healthcare_capacity() is df
+        with pytest.raises(ValueError):
+            df.iloc[0, 1] = 0
+        with pytest.raises(ValueError):
+            df["icu"].values[0] = 0
+
+    def test_reload_modified_files(self, tmp_path):
+        path = tmp_path / "data.csv"
+        path.write_text("x\n1\n")
+        df = registry.read_csv(path)
+        assert registry.read_csv(path) is df
+
+        path.write_text("x\n2\n")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        assert registry.read_csv(path).loc[0, "x"] == 2
+
+    def test_preload(self, tmp_path):
+        paths = [tmp_path / f"{i}.csv" for i in range(4)]
+        for i, path in enumerate(paths):
+            path.write_text(f"x\n{i}\n")
+        registry.preload(paths, threads=2)
+        assert {str(path) for path in paths} <= {key[0] for key in registry._entries}
+        assert [registry.read_csv(path).loc[0, "x"] for path in paths] == [0, 1, 2, 3]
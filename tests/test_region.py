@@ -1,4 +1,7 @@
+import pytest
+
 from covid import region
+from covid.region import CityGroup
 
 
 class TestRegion:
@@ -13,3 +16,47 @@ class TestRegion:
     def test_metro_area(self):
         sp = region("Brazil/Metropolitana de São Paulo")
         assert sp.population_size == 21_154_988
+
+    def test_state_is_built_in_bulk(self):
+        df = region("Brazil/DF")
+        assert df.population_size == 2_570_160
+        assert df.hospital_total_capacity == 3936
+        assert df.icu_total_capacity == 344
+        assert round(df.hospital_surge_capacity) == 473
+        assert round(df.icu_surge_capacity) == 140
+
+        # Sub-regions are only created on demand and agree with the aggregate
+        (city,) = df.sub_regions
+        assert city.population_size == df.population_size
+        assert (city.demography_detailed == df.demography_detailed).all().all()
+
+    def test_derived_quantities_follow_inputs(self):
+        it = region("Italy")
+        p_h = it.prob_hospitalization
+        assert it.prob_hospitalization is p_h
+
+        it.demography = it.demography[::-1].set_axis(it.demography.index)
+        assert it.prob_hospitalization != p_h
+
+        it.hospital_beds_pm = 1.0
+        it.icu_occupancy_rate = 0.5
+        assert it.icu_beds_pm == 0.1
+        assert it.icu_surge_capacity == 0.5 * it.icu_total_capacity
+
+    def test_metro_area_from_rollup(self):
+        metro = region("Brazil/metro:São Paulo")
+        assert metro.name == "São Paulo"
+        assert metro.population_size == 19_683_975
+        assert metro.population_size == sum(metro.demography_detailed.sum())
+        assert len(metro.sub_regions) == 39
+
+        with pytest.raises(ValueError):
+            region("Brazil/metro:Atlantis")
+
+    def test_rollup_agrees_with_cities(self):
+        state = region("Brazil/RR")
+        bulk = CityGroup("brazil", "Roraima", state.city_ids)
+        assert (state.demography == bulk.demography).all()
+        assert (state.demography_detailed == bulk.demography_detailed).all().all()
+        for attr in ["hospital_total_capacity", "icu_surge_capacity", "icu_occupancy_rate"]:
+            assert getattr(state, attr) == getattr(bulk, attr)
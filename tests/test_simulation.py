@@ -0,0 +1,724 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import covid
+from covid import data
+from covid.models import SEICHAR, SEICHARBatch, SEICHARDemographic, Schedule, run_batch
+from covid.models import Emulator, eSEICHAR
+from covid.models import jit
+from covid.models.compartments import CompartmentModel
+from covid.models.events import Event
+from covid.models.trajectory import Trajectory
+
+
+def scenarios():
+    return [
+        SEICHAR(R0=1.5, seed=1e-4),
+        SEICHAR(R0=2.74, seed=1e-4, hospital_beds_pm=0.5),
+        SEICHAR(R0=3.5, seed=1e-3, prob_symptomatic=0.3),
+    ]
+
+
+@pytest.fixture(scope="module")
+def demographic():
+    region = covid.region("Brazil")
+    region.contact_matrix = data.contact_matrix("italy", coarse=True)
+    return SEICHARDemographic(region=region)
+
+
+class TestSEICHARBatch:
+    @pytest.mark.parametrize("duration", [None, 90])
+    def test_batch_is_identical_to_scalar_runs(self, duration):
+        batch = run_batch(scenarios(), duration)
+        for m, ref in zip(batch, scenarios()):
+            ref.run(duration)
+            assert m.data.shape == ref.data.shape
+            assert (m.data.values == ref.data.values).all()
+            assert m.time == ref.time
+            assert m.hospital_overflow_time == ref.hospital_overflow_time
+            assert m.icu_overflow_time == ref.icu_overflow_time
+            assert m.fatalities == ref.fatalities
+
+    def test_batch_parameters_are_vectors(self):
+        batch = SEICHARBatch(scenarios())
+        assert batch.state.shape == (3, 8)
+        assert np.all(batch.R0 == [1.5, 2.74, 3.5])
+        assert batch.diff(batch.state, 0.0).shape == (3, 8)
+
+    def test_batch_rejects_incompatible_models(self, demographic):
+        with pytest.raises(ValueError):
+            SEICHARBatch([SEICHAR(), SEICHAR(dt=0.5)])
+        a, b = SEICHAR(), SEICHAR()
+        a.R0 = lambda t: 2.0
+        b.R0 = lambda t: 2.0
+        with pytest.raises(ValueError):
+            SEICHARBatch([a, b])
+        with pytest.raises(TypeError):
+            SEICHARBatch([SEICHAR(), demographic.copy()])
+
+    def test_demographic_batch_agrees_with_scalar_runs(self):
+        region = covid.region("Brazil")
+        region.contact_matrix = data.contact_matrix("italy", coarse=True)
+        models = [SEICHARDemographic(region=region, R0=R0) for R0 in (1.5, 2.74, 3.5)]
+        for model in models:
+            model.icu_capacity = 1e3
+        batch = run_batch([m.copy() for m in models], 120)
+        for m, ref in zip(batch, models):
+            ref.run(120)
+            N = ref.data.values[0].sum()
+            assert m.data.shape == ref.data.shape
+            assert np.abs(m.data.values - ref.data.values).max() < 1e-12 * N
+            assert np.isclose(m.icu_overflow_time, ref.icu_overflow_time)
+            assert np.isclose(m.fatalities, ref.fatalities)
+
+
+class TestTrajectory:
+    def test_trajectory_grows_by_doubling(self):
+        traj = Trajectory(2, capacity=2)
+        for t in range(5):
+            traj.append(t, [t, 2 * t])
+        assert len(traj) == 5
+        assert traj.capacity == 8
+        assert list(traj.times) == [0, 1, 2, 3, 4]
+        assert list(traj.last) == [4, 8]
+
+    def test_repeated_runs_continue_trajectory(self):
+        m1 = SEICHAR(seed=1e-4).run(30).run(30)
+        m2 = SEICHAR(seed=1e-4).run(61)
+        assert m1.data.shape == m2.data.shape == (63, 8)
+        assert (m1.data.values == m2.data.values).all()
+        assert list(m1.data.index) == list(range(63))
+
+
+class TestDemographicResults:
+    @pytest.fixture(scope="class")
+    def model(self, demographic):
+        return demographic.copy().run(60)
+
+    def test_results_are_views(self, model):
+        res = model.results
+        assert res.shape == (len(model.trajectory), 8, len(model.sub_groups))
+        assert np.shares_memory(res.compartment("critical"), model.trajectory.values)
+        assert np.shares_memory(res.by_age("critical").values, model.trajectory.values)
+
+    def test_results_agree_with_dataframe(self, model):
+        res = model.results
+        df = res.to_frame()
+        assert df.equals(model.data)
+        assert np.allclose(res.total("critical"), df["critical"].sum(1))
+        assert np.allclose(model["hospitalized:total"], df["hospitalized"].sum(1))
+        assert np.allclose(model["total"], df.sum(1))
+        with pytest.raises(KeyError):
+            res.compartment("zombies")
+
+
+class TestQueryCache:
+    def test_queries_are_memoised(self):
+        model = SEICHAR(seed=1e-4).run(30)
+        res = model["hospitalized:total:dates"]
+        assert model._query_cache[1]["hospitalized:total:dates"] is not res
+        assert model["hospitalized:total:dates"].equals(res)
+
+    def test_results_are_copies(self):
+        model = SEICHAR(seed=1e-4).run(30)
+        res = model["infectious"]
+        expected = res.copy()
+        res.iloc[:] = 0
+        assert model["infectious"].equals(expected)
+
+    def test_cache_is_invalidated(self):
+        model = SEICHAR(seed=1e-4).run(30)
+        res = model["critical:dates"]
+        model.run(10)
+        assert len(model["critical:dates"]) == len(model.trajectory) > len(res)
+
+        model.start_date = model.start_date + datetime.timedelta(days=1)
+        assert model["critical:dates"].index[0] == res.index[0] + datetime.timedelta(days=1)
+
+    def test_cache_is_invalidated_by_parameters(self):
+        model = SEICHAR(seed=1e-4)
+        model.icu_capacity = 1e-4
+        model.run(60)
+        assert model["icu"].max() == pytest.approx(1e-4)
+        model.icu_capacity = 2e-4
+        assert model["icu"].max() == pytest.approx(2e-4)
+
+    def test_forks_have_independent_caches(self):
+        model = SEICHAR(seed=1e-4).run(30)
+        res = model["critical"]
+        fork = model.fork(R0=1.0).run(10)
+        model.run(10)
+        assert model["critical"].iloc[-1] != fork["critical"].iloc[-1]
+        assert len(res) == 32
+
+
+class TestDates:
+    def test_time_to_dates(self):
+        model = SEICHAR(start_date=datetime.date(2020, 2, 28))
+        dates = model.time_to_dates([0, 1, 1.5])
+        assert list(dates.strftime("%Y-%m-%d %H:%M")) == [
+            "2020-02-28 00:00",
+            "2020-02-29 00:00",
+            "2020-02-29 12:00",
+        ]
+
+    def test_trajectory_dates_extend_incrementally(self):
+        model = SEICHAR(seed=1e-4).run(30)
+        first = model["critical:dates"].index
+        model.run(10)
+        dates = model["critical:dates"].index
+        assert (dates[: len(first)] == first).all()
+        assert len(dates) == len(model.trajectory)
+        assert dates[-1] - dates[0] == datetime.timedelta(days=model.time)
+
+
+class TestRecordingPolicy:
+    def test_record_every_and_subset(self):
+        full = SEICHAR(seed=1e-4).run(100)
+        model = SEICHAR(
+            seed=1e-4,
+            record_every=7,
+            record_dtype=np.float32,
+            record_columns=["hospitalized", "critical"],
+        ).run(100)
+        assert list(model.data.columns) == ["hospitalized", "critical"]
+        assert model.trajectory.values.dtype == np.float32
+        assert list(model.trajectory.times) == [*range(0, 100, 7), 101]
+        assert np.array_equal(model.state, full.state)
+        assert model.hospitalization_days == full.hospitalization_days
+        assert model.fatalities == full.fatalities
+
+    def test_record_only_events(self):
+        model = SEICHAR(seed=1e-4, record_every=None)
+        model.hospital_capacity = 1e-4
+        model.run(100)
+        times = sorted({np.ceil(t) for t in model.event_times.values() if np.isfinite(t)})
+        assert 0 < len(times) < 3
+        assert list(model.trajectory.times) == [0, *times, 101]
+
+    def test_interrupted_stream_records_last_state(self):
+        model = SEICHAR(seed=1e-4, record_every=10)
+        for snapshot in model.stream(100):
+            if snapshot.time >= 13:
+                break
+        assert list(model.trajectory.times) == [0, 10, 13]
+
+    def test_summary_with_restricted_policy(self):
+        full = SEICHAR(seed=1e-4).run(100)
+        model = SEICHAR(
+            seed=1e-4,
+            record_every=7,
+            record_dtype=np.float32,
+            record_columns=["hospitalized", "critical"],
+        ).run(100)
+        assert model.population == full.population
+        assert model.summary_demography() == full.summary_demography()
+        assert model.summary_healthcare() == full.summary_healthcare()
+
+        model = SEICHAR(seed=1e-4, accumulate=False, record_columns=["susceptible"]).run(100)
+        assert model.population == full.population
+        assert np.isnan(model.integral_of("critical"))
+        assert "Hosp. days         : -" in model.summary()
+
+    def test_demographic_totals(self, demographic):
+        model = demographic.copy(record_totals=True, record_columns=["critical"])
+        model.run(10)
+        assert model.trajectory.width == 1
+        assert np.isclose(model["critical:total"].iloc[-1], model.final_state("critical").sum())
+        assert model.population == demographic.copy().run(10).population
+        assert "Not available" in model.summary()
+
+
+class TestCompiledBackend:
+    @pytest.mark.parametrize("duration", [None, 90])
+    def test_compiled_backend_agrees_with_python(self, duration):
+        ref = SEICHAR(seed=1e-4).run(duration)
+        model = SEICHAR(seed=1e-4, backend="numba").run(duration)
+        assert np.allclose(model.data.values, ref.data.values, rtol=1e-12, atol=0)
+        assert model.event_times == ref.event_times
+        assert np.allclose(model.integrals, ref.integrals, rtol=1e-12)
+
+    def test_compiled_backend_with_events_and_recording(self):
+        kwargs = dict(seed=1e-4, record_every=7, validation="sampled")
+        ref = SEICHAR(**kwargs).run(100, stop_at=["icu_overflow"])
+        model = SEICHAR(backend="numba", **kwargs).run(100, stop_at=["icu_overflow"])
+        assert list(model.trajectory.times) == list(ref.trajectory.times)
+        assert model.time == ref.time < 100
+
+    def test_unsupported_models_fall_back_to_python(self):
+        model = SEICHAR(seed=1e-4, backend="numba", R0=Schedule.steps(3.0, {40: 1.0}))
+        assert model._compiled_loop() is None
+        assert model.run(60).time == 61
+
+    def test_invalid_backend(self):
+        with pytest.raises(ValueError):
+            SEICHAR(backend="fortran").run(10)
+
+    @pytest.mark.skipif(not jit.is_available(), reason="numba is not installed")
+    def test_loop_is_jit_compiled(self):
+        model = SEICHAR(seed=1e-4, backend="numba").run(10)
+        loop, _, _ = model._compiled_loop()
+        assert loop.function is not loop.python
+
+
+class TestAdaptiveSolver:
+    def test_dopri5_agrees_with_rk4(self):
+        ref = SEICHAR(seed=1e-4, steps_per_day=32).run(365)
+        model = SEICHAR(seed=1e-4, solver="dopri5").run(365)
+        N = ref.data.values[0].sum()
+        assert model.data.shape == ref.data.shape
+        assert np.abs(model.data.values - ref.data.values).max() < 1e-5 * N
+        assert model._solver.nfev < 365 * 4 * SEICHAR.steps_per_day
+
+    def test_dopri5_respects_breakpoints(self):
+        def Rt(t):
+            return 3.0 if t < 40 else 1.0
+
+        Rt.breakpoints = (40,)
+        model = SEICHAR(seed=1e-4, solver="dopri5")
+        model.R0 = Rt
+        model.run(120)
+
+        # Reference changes R0 between runs
+        ref = SEICHAR(seed=1e-4, steps_per_day=32)
+        ref.R0 = 3.0
+        ref.run(39)
+        ref.R0 = 1.0
+        ref.run(80)
+        N = ref.data.values[0].sum()
+        assert np.abs(model.data.values - ref.data.values).max() < 1e-5 * N
+
+    def test_invalid_solver(self):
+        with pytest.raises(ValueError):
+            SEICHAR(solver="euler").run(10)
+
+
+class TestExponentialSolver:
+    def test_agrees_with_rk4(self):
+        # One step per day is as accurate as RK4 with the same step
+        ref = SEICHAR(seed=1e-4, steps_per_day=4).run(180)
+        rk4 = SEICHAR(seed=1e-4, steps_per_day=1).run(180)
+        model = SEICHAR(seed=1e-4, solver="etdrk4", steps_per_day=1).run(180)
+        N = ref.data.values[0].sum()
+        error = np.abs(model.data.values - ref.data.values).max()
+        assert error < 2e-5 * N
+        assert error < 2 * np.abs(rk4.data.values - ref.data.values).max()
+        assert np.allclose(
+            model.integral_of("hospitalized"), ref.integral_of("hospitalized"), rtol=1e-4
+        )
+
+    def test_stable_for_fast_rates(self):
+        kwargs = {"seed": 1e-4, "sigma": 4.0, "gamma_a": 3.0, "steps_per_day": 1}
+        ref = SEICHAR(**kwargs, solver="rk4").fork(steps_per_day=32).run(120)
+        model = SEICHAR(**kwargs, solver="etdrk4").run(120)
+        N = ref.data.values[0].sum()
+        assert np.abs(model.data.values - ref.data.values).max() < 1e-6 * N
+
+    def test_linear_part_includes_saturated_transitions(self):
+        model = SEICHAR(seed=1e-4)
+        model.hospital_capacity = model.icu_capacity = 0.0
+        A = model.split_at(0).matrix
+        h, c = model.HOSPITALIZED, model.CRITICAL
+        assert A[h, h] == -model.gamma_h
+        assert A[c, c] == -model.gamma_c
+        assert A[model.EXPOSED, model.INFECTIOUS] == pytest.approx(model.beta(0))
+
+
+class TestFinalSize:
+    @pytest.mark.parametrize("R0", [1.5, 2.74, 4.0])
+    def test_agrees_with_simulation(self, R0):
+        model = SEICHAR(seed=1e-4, R0=R0)
+        model.hospital_capacity = model.icu_capacity = 1.0
+        estimate = model.final_size()
+        model.run()
+
+        assert np.isclose(estimate.susceptible, model.final_state("susceptible"), rtol=1e-2)
+        assert np.isclose(estimate.fatalities, model.final_state("fatalities"), rtol=1e-2)
+        assert np.isclose(estimate.peak_hospitalized, model.peaks[0], rtol=0.3)
+        assert np.isclose(estimate.peak_critical, model.peaks[1], rtol=0.4)
+
+    def test_demographic(self, demographic):
+        estimate = demographic.final_size()
+        n_groups = len(demographic.sub_groups)
+        assert all(np.shape(v) == (n_groups,) for v in estimate)
+        assert np.all((estimate.attack_rate > 0) & (estimate.attack_rate < 1))
+        assert np.allclose(estimate.infected, estimate.attack_rate * demographic.demography)
+
+    @pytest.mark.parametrize("R0", [1.5, 2.74])
+    def test_demographic_agrees_with_simulation(self, demographic, R0):
+        model = demographic.copy(R0=R0)
+        model.hospital_capacity = model.icu_capacity = 1e12
+        estimate = model.final_size()
+        model.run()
+
+        # Attack rates agree within 3 percentage points in each age group
+        attack_rate = 1 - model.final_state("susceptible") / model.demography.values
+        assert np.allclose(estimate.attack_rate, attack_rate, atol=0.03)
+        assert np.isclose(estimate.attack_rate.mean(), attack_rate.mean(), rtol=0.02)
+
+        # Simulations clip depleted susceptibles in the oldest groups for large
+        # values of R0, which inflates their fatalities
+        if R0 < 2:
+            fatalities = model.final_state("fatalities")
+            assert np.isclose(estimate.fatalities.sum(), fatalities.sum(), rtol=0.02)
+
+
+class TestExponential:
+    def test_closed_form_agrees_with_stream(self):
+        m = eSEICHAR(seed=1e-5).run(25)
+        ref = eSEICHAR(seed=1e-5)
+        for _ in ref.stream(25):
+            pass
+        assert np.allclose(m.data.values, ref.data.values, rtol=1e-12)
+        assert np.allclose(m.integrals, ref.integrals, rtol=1e-12)
+
+    def test_growth_rate_and_derivative(self):
+        m = eSEICHAR(seed=1e-5)
+        xs = m.states([0.0, 10.0])
+        assert np.allclose(xs[1, 1:6] / xs[0, 1:6], np.exp(10 * m.K))
+        assert np.isclose(xs[1].sum(), xs[0].sum())
+        assert np.allclose((m.states(1e-6) - m.state) / 1e-6, m.diff(m.state, 0), atol=1e-9)
+
+    def test_approximates_seichar_in_early_phase(self):
+        m = eSEICHAR(seed=1e-5).run()
+        ref = SEICHAR(seed=1e-5).run(int(m.time))
+        assert 0.05 < 1 - m.susceptible < 0.06
+        assert abs(m["infectious"].iloc[-1] / ref["infectious"].iloc[-1] - 1) < 0.15
+        assert len(m["infectious:dates"]) == len(m.data)
+
+    def test_overflow_times(self):
+        m = eSEICHAR(seed=1e-5, hospital_beds_pm=0.01).run(25)
+        h0 = m["hospitalized"].iloc[0]
+        expected = np.log(m.hospital_capacity / h0) / m.K
+        assert abs(m.hospital_overflow_time - expected) < 1e-3
+
+    def test_duration_is_limited_to_horizon(self):
+        m = eSEICHAR()
+        horizon = m.horizon()
+        assert horizon > 20
+        with pytest.warns(UserWarning):
+            m.run(120)
+        assert m.time == pytest.approx(np.ceil(horizon))
+        assert 0.94 < m.susceptible < 0.95
+
+        with pytest.raises(ValueError):
+            eSEICHAR(seed=0.01).run()
+
+
+class TestEmulator:
+    @staticmethod
+    def factory(R0, prob_symptomatic):
+        model = SEICHAR(seed=1e-4, R0=R0, prob_symptomatic=prob_symptomatic)
+        model.hospital_capacity = 5e-4
+        model.icu_capacity = 5e-5
+        return model
+
+    @pytest.fixture(scope="class")
+    def emulator(self):
+        grid = {"R0": np.arange(1.5, 3.51, 0.25), "prob_symptomatic": [0.14, 0.3, 0.5]}
+        return Emulator(self.factory, grid, 150)
+
+    def test_nodes_are_exact(self, emulator):
+        model = self.factory(2.5, 0.14)
+        ref = model.copy().run(120)
+        errors = emulator.emulate(model, 120, R0=2.5, prob_symptomatic=0.14)
+        assert (errors == 0).all()
+        assert len(emulator) == 1
+        assert np.allclose(model.data.values, ref.data.values)
+        assert np.allclose(model.state, ref.state)
+        assert model.fatalities == ref.fatalities
+        assert abs(model.icu_overflow_time - ref.icu_overflow_time) < 0.05
+
+    def test_nodes_are_extended(self, emulator):
+        model = self.factory(2.5, 0.14)
+        emulator.emulate(model, 60, R0=2.5, prob_symptomatic=0.14)
+        model = self.factory(2.5, 0.14)
+        ref = model.copy().run(140)
+        emulator.emulate(model, 140, R0=2.5, prob_symptomatic=0.14)
+        assert np.allclose(model.data.values, ref.data.values)
+        assert np.allclose(model.integrals, ref.integrals)
+
+    @pytest.mark.parametrize("R0, prob_symptomatic", [(2.6, 0.2), (3.4, 0.14)])
+    def test_interpolation_error_is_estimated(self, emulator, R0, prob_symptomatic):
+        model = self.factory(R0, prob_symptomatic)
+        ref = model.copy().run(120)
+        errors = emulator.emulate(model, 120, R0=R0, prob_symptomatic=prob_symptomatic)
+        for name in ["peak_hospitalization_demand", "peak_icu_demand", "fatalities"]:
+            error = abs(getattr(model, name) / getattr(ref, name) - 1)
+            assert errors[name] / 5 < error < 2 * errors[name]
+
+    def test_parameters_outside_grid(self, emulator):
+        with pytest.raises(ValueError):
+            emulator.emulate(self.factory(4.0, 0.14), 120, R0=4.0, prob_symptomatic=0.14)
+        with pytest.raises(ValueError):
+            emulator.emulate(self.factory(2.5, 0.14), 200, R0=2.5, prob_symptomatic=0.14)
+
+
+class TestSchedule:
+    def test_evaluation_and_composition(self):
+        R0 = 2.0 * Schedule.steps(1.0, {10: 0.5}) + Schedule.ramp(0.0, 1.0, 20, 30)
+        assert R0.breakpoints == (10, 20, 30)
+        assert [R0(t) for t in (0, 10, 25, 40)] == [2.0, 1.0, 1.5, 2.0]
+        ts = np.linspace(-5, 50, 111)
+        assert np.allclose(R0(ts), [R0(t) for t in ts])
+        assert np.isclose(R0.average(0, 20), 1.5)
+
+        with pytest.raises(ValueError):
+            Schedule.ramp(1, 2, 0, 10) * Schedule.ramp(1, 2, 5, 15)
+
+    def test_rk4_switches_at_breakpoints(self):
+        model = SEICHAR(seed=1e-4)
+        model.R0 = Schedule.steps(3.0, {40: 1.0})
+        model.run(120)
+
+        ref = SEICHAR(seed=1e-4)
+        ref.R0 = 3.0
+        ref.run(39)
+        ref.R0 = 1.0
+        ref.run(80)
+        N = ref.data.values[0].sum()
+        assert np.abs(model.data.values - ref.data.values).max() < 1e-9 * N
+
+    def test_breakpoints_within_day(self):
+        R0 = Schedule.steps(3.0, {40.3: 1.0})
+        model = SEICHAR(seed=1e-4, R0=R0).run(120)
+        ref = SEICHAR(seed=1e-4, R0=R0, solver="dopri5").run(120)
+        N = ref.data.values[0].sum()
+        assert np.abs(model.data.values - ref.data.values).max() < 1e-5 * N
+
+    def test_R0_average(self):
+        model = SEICHAR(seed=1e-4, R0=Schedule.ramp(3.0, 1.0, 10, 50)).run(60)
+        expected = np.mean([model.R0(t) for t in model.data.index])
+        assert np.isclose(model.R0_average, expected)
+
+
+class TestAccumulators:
+    @pytest.fixture(scope="class")
+    def ref(self):
+        return SEICHAR(seed=1e-4, steps_per_day=64).run(200)
+
+    def test_integrals_are_more_accurate_than_rectangle_rule(self, ref):
+        model = SEICHAR(seed=1e-4).run(200)
+        rect = SEICHAR(seed=1e-4, accumulate=False).run(200)
+        assert rect.integrals is None
+        err = abs(model.hospitalization_days - ref.hospitalization_days)
+        assert err < 0.1 * abs(rect.hospitalization_days - ref.hospitalization_days)
+        assert model.peak_icu_demand == rect.peak_icu_demand
+
+    def test_dopri5_integrals(self, ref):
+        model = SEICHAR(seed=1e-4, solver="dopri5").run(200)
+        assert np.allclose(model.integrals, ref.integrals, rtol=1e-5)
+
+    def test_integrals_accumulate_over_forks_and_batches(self):
+        model = SEICHAR(seed=1e-4).run(200)
+        fork = SEICHAR(seed=1e-4).run(80).fork().run(119)
+        batch = run_batch([SEICHAR(seed=1e-4), SEICHAR(seed=1e-4, R0=2.0)], 200)[0]
+        assert np.allclose(fork.integrals, model.integrals, rtol=1e-12)
+        assert np.allclose(batch.integrals, model.integrals, rtol=1e-12)
+        assert np.allclose(batch.peaks, model.peaks, rtol=1e-12)
+
+    def test_external_data_disables_accumulators(self):
+        model = SEICHAR(seed=1e-4).run(50)
+        model.data = model.data
+        assert model.integrals is None
+        model.run(10)
+        assert model.integrals is None and model.hospitalization_days > 0
+
+
+class TestCompartmentModel:
+    @pytest.fixture
+    def sir(self):
+        return CompartmentModel(
+            ["s", "i", "r"],
+            [
+                ("s", "i", "beta * s * i / n"),
+                ("i", "r", "gamma * i"),
+                ("r", None, "mu * r", "vital"),
+            ],
+            {"n": "s + i + r"},
+        )
+
+    def test_parameters_and_stoichiometry(self, sir):
+        assert sir.parameters == ("beta", "gamma", "mu", "vital")
+        assert sir.stoichiometry.tolist() == [[-1, 0, 0], [1, -1, 0], [0, 1, -1]]
+
+    def test_bind_parameters(self, sir):
+        y = np.array([0.9, 0.1, 0.0])
+        params = {"beta": 0.5, "gamma": 0.25, "mu": 1.0, "vital": False}
+        assert np.allclose(sir.bind(params)(y, 0.0), [-0.045, 0.02, 0.025])
+        assert np.allclose(sir.bind(params, beta=lambda t: t)(y, 1.0), [-0.09, 0.065, 0.025])
+
+        # State may have extra axes for scenarios or sub-groups
+        ys = np.stack([y, y, y], axis=1)
+        assert sir.bind(params)(ys, 0.0).shape == (3, 3)
+
+    def test_kernel_agrees_with_bind(self, sir):
+        y = np.array([0.9, 0.1, 0.0])
+        params = {"beta": 0.5, "gamma": 0.25, "mu": 1.0, "vital": True}
+        rhs, args = sir.kernel(params)
+        assert np.allclose(rhs(y, 0.0, *args), sir.bind(params)(y, 0.0))
+        assert sir.kernel({**params, "beta": 1.0})[0] is rhs
+
+        with pytest.raises(TypeError):
+            sir.kernel(params, beta=lambda t: t)
+
+    def test_split_agrees_with_bind(self, sir):
+        y = np.array([[0.9, 0.5], [0.1, 0.3], [0.0, 0.2]])
+        params = {"beta": 0.5, "gamma": np.array([0.25, 0.5]), "mu": 1.0, "vital": True}
+        split = sir.split(params)
+        assert split.matrix.shape == (2, 3, 3)
+        assert np.allclose(
+            split.apply(split.matrix, y) + split.nonlinear(y, 0.0), sir.bind(params)(y, 0.0)
+        )
+
+        # Time-dependent rates are never linear
+        split = sir.split(params, mu=lambda t: 1.0)
+        assert not split.matrix[..., 2].any()
+
+    def test_split_expands_sums(self):
+        model = CompartmentModel(
+            ["s", "i", "r"],
+            [("s", "i", "beta * (i - excess) * s"), ("i", "r", "gamma * (i - excess)")],
+            {"excess": "np.maximum(0, i - cap)", "gamma": "2 * rate"},
+        )
+        params = {"beta": 0.5, "rate": 0.25, "cap": 0.05}
+        split = model.split(params)
+        assert split.matrix[2].tolist() == [0.0, 0.5, 0.0]
+
+        y = np.array([0.8, 0.15, 0.05])
+        assert np.allclose(split.matrix @ y + split.nonlinear(y, 0.0), model.bind(params)(y, 0.0))
+
+    def test_seichar_dynamics_conserves_population(self):
+        m = SEICHAR(seed=1e-3)
+        assert abs(m.diff(m.state, 0.0).sum()) < 1e-12
+
+
+class TestValidation:
+    def test_validation_is_off_by_default(self):
+        m = SEICHAR(seed=1e-3)
+        x = m.state.copy()
+        x[1] = -1.0
+        assert m.validation == "off"
+        assert m.diff(x, 0.0).shape == (8,)
+
+    def test_full_validation_checks_derivative(self):
+        m = SEICHAR(seed=1e-3, validation="full")
+        x = m.state.copy()
+        x[1] = -1.0
+        with pytest.raises(ValueError, match="exposed=-1.0"):
+            m.diff(x, 0.0)
+
+    @pytest.mark.parametrize("validation", ["sampled", "full"])
+    def test_valid_runs_pass_checks(self, validation):
+        m = SEICHAR(seed=1e-4, validation=validation).run(120)
+        assert len(m.data) == 122
+
+    def test_sampled_validation_checks_conservation(self):
+        m = SEICHAR(seed=1e-3, validation="sampled")
+        with pytest.raises(ValueError, match="not conserved"):
+            m.check_state(1.1 * m.state, 1.0, m.state)
+        with pytest.raises(ValueError):
+            SEICHAR(validation="always").run(10)
+
+
+class TestStream:
+    def test_stream_can_be_interrupted_and_resumed(self):
+        m1 = SEICHAR(seed=1e-4)
+        for t, date, x in m1.stream(100):
+            if t >= 30:
+                break
+        assert m1.time == 30
+        assert (m1.state == x).all()
+        m1.run(30)
+
+        m2 = SEICHAR(seed=1e-4).run(60)
+        assert (m1.data.values == m2.data.values).all()
+
+    def test_stream_options(self):
+        m = SEICHAR(seed=1e-4)
+        snapshots = list(m.stream(28, every=7, columns=["infectious", "critical"]))
+        assert [s.time for s in snapshots] == [7, 14, 21, 28]
+        assert snapshots[0].date == m.start_date + datetime.timedelta(days=7)
+        assert snapshots[-1].state.shape == (2,)
+        assert snapshots[-1].state[1] == m.data["critical"].iloc[-2]
+
+    def test_iter_updates_model(self):
+        m = SEICHAR(seed=1e-4)
+        it = iter(m)
+        next(it)
+        x = next(it)
+        assert m.time == 2
+        assert (m.state == x).all()
+
+
+class TestEvents:
+    def test_overflow_times_are_interpolated(self):
+        m = SEICHAR(seed=1e-4, hospital_beds_pm=0.5).run(150)
+        ref = SEICHAR(seed=1e-4, hospital_beds_pm=0.5, steps_per_day=64).run(150)
+        assert m.hospital_overflow_time % 1 != 0
+        assert abs(m.hospital_overflow_time - ref.hospital_overflow_time) < 1e-3
+        assert abs(m.icu_overflow_time - ref.icu_overflow_time) < 1e-3
+
+    def test_run_stops_when_epidemic_is_resolved(self):
+        m = SEICHAR(seed=1e-4).run()
+        active = m.data.values[:, 1:6].sum(1)
+        assert m.event_times["resolved"] <= m.time < m.event_times["resolved"] + 1
+        assert active.max() > 1e3 * active[-1]
+
+    def test_terminal_events(self):
+        m = SEICHAR(seed=1e-4).run(stop_at=["icu_overflow"])
+        assert m.time == np.ceil(m.icu_overflow_time)
+
+        half = Event("half", lambda x: x[..., 0] - 0.5, direction=-1, terminal=True)
+        m = SEICHAR(seed=1e-4).run(365, events=[half])
+        assert m.time == np.ceil(m.event_times["half"])
+        assert abs(m.data["susceptible"].iloc[-2] - 0.5) < 0.1
+
+        with pytest.raises(ValueError):
+            SEICHAR().run(stop_at=["bad-event"])
+
+
+class TestFork:
+    def test_forked_trajectories_are_copy_on_write(self):
+        traj = Trajectory(1, capacity=8)
+        traj.extend([0, 1], [[0], [1]])
+        fork = traj.fork()
+        assert fork.values.base is traj.values.base
+        fork.append(2, [20])
+        traj.append(2, [2])
+        assert list(fork.values[:, 0]) == [0, 1, 20]
+        assert list(traj.values[:, 0]) == [0, 1, 2]
+
+    def test_copy_does_not_share_mutable_state(self):
+        m1 = SEICHAR(seed=1e-4).run(10)
+        m2 = m1.copy()
+        m2.state[0] = 0.0
+        m2.run(10)
+        assert m1.state[0] != 0.0
+        assert len(m1.data) == 12
+        assert len(m2.data) == 23
+
+    def test_forks_share_prefix(self):
+        base = SEICHAR(seed=1e-4).run(29).checkpoint()
+        scenarios = [base.fork(R0=R0).run(60) for R0 in (1.5, 2.0)]
+
+        for R0, fork in zip((1.5, 2.0), scenarios):
+            ref = SEICHAR(seed=1e-4).run(29)
+            ref.R0 = R0
+            ref.run(60)
+            assert (fork.data.values == ref.data.values).all()
+            assert fork.icu_overflow_time == ref.icu_overflow_time
+        assert len(base.data) == 31
+
+        with pytest.raises(TypeError):
+            base.fork(bad_parameter=1)
+
+    def test_restore_checkpoint(self):
+        m = SEICHAR(seed=1e-4).run(10)
+        checkpoint = m.checkpoint()
+        m.run(10)
+        m.restore(checkpoint)
+        assert m.time == checkpoint.time == 11
+        assert (m.data.values == checkpoint.data.values).all()
@@ -16,3 +16,34 @@ class TestDescriptors:
         assert obj.cached == 42
         obj.cached = 0
         assert obj.cached == 0
+
+    def test_computed_descriptors_track_dependencies(self):
+        calls = []
+
+        class Cls:
+            a = 1
+            b = 2
+
+            @tt.computed
+            def sum(self):
+                calls.append("sum")
+                return self.a + self.b
+
+            @tt.computed
+            def double(self):
+                calls.append("double")
+                return 2 * self.sum
+
+        obj = Cls()
+        assert obj.double == 6
+        assert obj.double == 6
+        assert calls == ["double", "sum"]
+
+        obj.a = 10
+        assert obj.double == 24
+        assert calls == ["double", "sum", "sum", "double"]
+
+        obj.double = 0
+        assert obj.double == 0
+        del obj.double
+        assert obj.double == 24
@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+import covid
+from covid import data
+
+pytest.importorskip("streamlit")
+from covid.ui import calc  # noqa: E402
+from covid.ui.input import social_distance_intervention  # noqa: E402
+
+
+def ui_region(name):
+    region = covid.region(name)
+    region.contact_matrix = data.contact_matrix("italy", coarse=True)
+    return region
+
+
+@pytest.fixture()
+def outputs(monkeypatch):
+    models = []
+
+    class Output:
+        def __init__(self, model):
+            models.append(model)
+
+        def run(self):
+            pass
+
+    monkeypatch.setattr(calc, "Output", Output)
+    monkeypatch.setattr(calc, "CHECKPOINTS", {})
+    monkeypatch.setattr(calc, "EMULATORS", {})
+    return models
+
+
+def run_simulation(region, **kwargs):
+    ui = calc.CalcUI.__new__(calc.CalcUI)
+    kwargs = {
+        "period": 70,
+        "start_date": datetime.date(2020, 4, 1),
+        "seed": max(5e-6 * region.population_size, 1),
+        "hospital_capacity": 0.25 * region.hospital_total_capacity,
+        "icu_capacity": 0.25 * region.icu_total_capacity,
+        "R0": 2.74,
+        **kwargs,
+    }
+    ui.run_simulation(region=region, **kwargs)
+
+
+class TestCalc:
+    def test_checkpoints_are_keyed_by_region_id(self, outputs):
+        date = datetime.date(2020, 4, 10)
+        for name in ["Bonito - MS", "Bonito - PA"]:
+            region = ui_region(f"Brazil/{name}")
+            kwargs = {"seed": 1, "hospital_capacity": 0.0, "icu_capacity": 0.0}
+            run_simulation(region, intervention=social_distance_intervention(date, 0.5), **kwargs)
+
+        ids = {key[:2] for key in calc.CHECKPOINTS}
+        assert len(ids) == 2
+        ms, pa = outputs
+        assert ms.population != pa.population
+
+    @pytest.mark.parametrize("R0", [2.6, 2.7, 2.74])
+    def test_default_parameters_are_emulated(self, outputs, R0):
+        run_simulation(ui_region("Brazil/DF"), R0=R0)
+        (model,) = outputs
+        assert len(calc.EMULATORS) == 1
+        assert not calc.CHECKPOINTS
+        assert model.record_totals
+
+    def test_intervention_changes(self):
+        region = ui_region("Brazil/DF")
+        base = calc.SEICHAR(region=region).checkpoint()
+        model = base.fork()
+        model.R0 = 2.0
+        assert calc.intervention_changes(base, model) == ()
+
+        model.gamma_h = 0.5
+        assert calc.intervention_changes(base, model) == (("gamma_h", 0.5),)